@@ -0,0 +1,222 @@
+from fastapi import APIRouter, Depends, HTTPException
+from schemas.artifacts import (
+    AdminCreateArtifactRequest,
+    AdminUpdateArtifactRequest,
+    AdminPatchArtifactRequest,
+    AdminGetArtifactRequest,
+    AdminDeleteArtifactRequest,
+    AdminDeleteArtifactsRequest,
+)
+from utils.artifacts import (
+    ArtifactNotFound,
+    InvalidPatch,
+    VersionConflict,
+    create_artifact,
+    delete_artifacts,
+    get_artifact,
+    list_artifacts,
+    patch_artifact,
+    update_artifact,
+)
+from utils.permissions import require_permission, PERMISSION_READ, PERMISSION_WRITE
+from utils.sharing import list_visible_artifacts
+from utils.auth import get_current_user
+from core import audit
+from core.responses import stream_json_list
+from core.singleflight import coalesce
+
+
+router = APIRouter()
+
+
+@router.post("/create-artifact")
+async def admin_create_artifact(
+    request: AdminCreateArtifactRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin create artifact through the dashboard.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        result = create_artifact(
+            request.variable_name,
+            request.content,
+            request.is_preprompt,
+            request.user_ids,
+            request.group_ids,
+        )
+        audit.record(
+            "artifact_created",
+            actor_id=current_user["id"],
+            subject_type="artifact",
+            subject_id=result["id"],
+            details={"variable_name": request.variable_name},
+        )
+        return {
+            "message": "Artifact created successfully",
+            "artifact_id": result["id"],
+            "version": result["version"],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create artifact: {str(e)}")
+
+
+@router.post("/update-artifact")
+async def admin_update_artifact(
+    request: AdminUpdateArtifactRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin update artifact through the dashboard.
+    Only the difference to the stored content is written.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        result = update_artifact(
+            request.id,
+            request.variable_name,
+            request.content,
+            request.user_ids,
+            request.group_ids,
+        )
+        audit.record(
+            "artifact_updated",
+            actor_id=current_user["id"],
+            subject_type="artifact",
+            subject_id=result["id"],
+            details={"version": result["version"]},
+        )
+        return {"artifact_id": result["id"], "version": result["version"]}
+    except ArtifactNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update artifact: {str(e)}")
+
+
+@router.post("/patch-artifact")
+async def admin_patch_artifact(
+    request: AdminPatchArtifactRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Apply an editor delta to an artifact.
+    Fails with 409 if the artifact moved past base_version, the editor
+    should then reload the artifact and resend its changes.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        result = patch_artifact(
+            request.id,
+            request.base_version,
+            [list(op) for op in request.ops],
+            request.variable_name,
+        )
+        audit.record(
+            "artifact_patched",
+            actor_id=current_user["id"],
+            subject_type="artifact",
+            subject_id=result["id"],
+            details={"version": result["version"]},
+        )
+        return {"artifact_id": result["id"], "version": result["version"]}
+    except ArtifactNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except VersionConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "current_version": e.current_version},
+        )
+    except InvalidPatch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to patch artifact: {str(e)}")
+
+
+@router.post("/get-artifact")
+async def admin_get_artifact(
+    request: AdminGetArtifactRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Get artifact specified by id in the request, optionally at an older version
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        artifact = await coalesce(
+            "artifacts", (request.id, request.version), get_artifact
+        )
+        return {"artifact": artifact}
+    except ArtifactNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get artifact: {str(e)}")
+
+
+@router.get("/get-artifacts")
+async def admin_get_artifacts(
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Admin get artifacts through the dashboard.
+    Lists artifacts without their content.
+    Only authenticated admin users can access this endpoint.
+    """
+    return stream_json_list(list_artifacts(), key="artifacts")
+
+
+@router.get("/get-visible-artifacts")
+async def get_visible_artifacts(current_user: dict = Depends(get_current_user)):
+    """
+    Artifacts shared with the current user, directly or through their group.
+    """
+    return stream_json_list(
+        list_visible_artifacts(current_user["id"]), key="artifacts"
+    )
+
+
+@router.post("/delete-artifact")
+async def admin_delete_artifact(
+    request: AdminDeleteArtifactRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin delete artifact by artifact id
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        deleted = delete_artifacts([request.artifact_id])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete artifact: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    audit.record(
+        "artifact_deleted",
+        actor_id=current_user["id"],
+        subject_type="artifact",
+        subject_id=deleted[0],
+    )
+    return {"artifact_id": deleted[0]}
+
+
+@router.post("/delete-artifacts")
+async def admin_delete_artifacts(
+    request: AdminDeleteArtifactsRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin delete multiple artifacts by artifact ids
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        deleted = delete_artifacts(request.ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete artifacts: {str(e)}")
+    if deleted:
+        audit.record(
+            "artifacts_deleted",
+            actor_id=current_user["id"],
+            subject_type="artifact",
+            details={"ids": deleted},
+        )
+    return {"artifact_ids": deleted}
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from core.audit import query_audit_log
+from core.responses import stream_json_list
+from utils.permissions import require_permission, PERMISSION_READ
+
+router = APIRouter()
+
+# Default window when no since is given
+AUDIT_DEFAULT_DAYS = 7
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    """audit_log stores naive UTC timestamps"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.get("")
+async def get_audit_log(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    event: str | None = None,
+    actor_id: int | None = None,
+    limit: int = 1000,
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Audit events between since and until (default: the last 7 days), newest
+    first, optionally filtered by event name and actor.
+    Only authenticated admin users can access this endpoint.
+    """
+    until = _utc(until) or datetime.utcnow()
+    since = _utc(since) or until - timedelta(days=AUDIT_DEFAULT_DAYS)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if not 1 <= limit <= 10000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 10000")
+
+    return stream_json_list(
+        query_audit_log(since, until, event=event, actor_id=actor_id, limit=limit),
+        key="events",
+    )
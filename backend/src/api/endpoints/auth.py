@@ -1,33 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Cookie
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Cookie
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
 import psycopg
 from typing import Optional
 
-from schemas.auth import Token
+from schemas.auth import Token, RefreshToken, GoogleLogin
 from utils.auth import (
     authenticate_user,
-    create_access_token,
-    save_token,
-    get_current_user,
-    ACCESS_TOKEN_EXPIRE_MINUTES,
-    SECRET_KEY,
-    ALGORITHM,
+    get_user_by_email,
+    user_from_access_token,
 )
+from utils.google_auth import (
+    GoogleAuthError,
+    GoogleAuthUnavailable,
+    verify_google_id_token,
+)
+from utils.sessions import (
+    SessionError,
+    clear_session_cookies,
+    end_session,
+    refresh_session,
+    revoke_user_sessions,
+    set_session_cookies,
+    start_session,
+)
+from core import audit
 from core.database import get_db_connection
-from jose import jwt, JWTError
+from utils import rollups
 
 router = APIRouter()
 
-# Cookie settings
-COOKIE_SECURE = False  # Set to False in development if not using HTTPS
-COOKIE_HTTPONLY = True
-COOKIE_SAMESITE = "lax"
-ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
-
 
 @router.post("/login")
 async def login_for_access_token(
+    request: Request,
     response: Response,  # for manipulating the response sent back to the browser eg. response.set_cookie()
     form_data: OAuth2PasswordRequestForm = Depends(),
 ):
@@ -39,6 +45,11 @@ async def login_for_access_token(
         form_data.username, form_data.password
     )  # username here is email
     if not user:
+        audit.record(
+            "login_failed",
+            ip=client_ip(request),
+            details={"email": form_data.username, "method": "password"},
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -53,15 +64,62 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
-    )
+    return issue_login(response, user, "password", client_ip(request))
+
+
+@router.post("/google")
+async def login_with_google(request: Request, response: Response, body: GoogleLogin):
+    """
+    Sign in with a Google ID token, set cookies for future requests.
+    The Google account's verified email must belong to an existing user.
+    """
+    try:
+        claims = verify_google_id_token(body.id_token)
+    except GoogleAuthUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
+    except GoogleAuthError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    user = await get_user_by_email(claims["email"])
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No account exists for this Google account",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Check if user account is active
+    if user["status"] != "active":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User account is not active",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return issue_login(response, user, "google", client_ip(request))
+
+
+def client_ip(request: Request) -> str | None:
+    return request.client.host if request.client else None
 
-    # Save tokens to database
-    token_saved = await save_token(user["id"], access_token)
-    if not token_saved:
+
+def issue_login(
+    response: Response, user: dict, method: str, ip: str | None = None
+) -> dict:
+    """
+    Start a session for an authenticated user: tokens, login stats and cookies
+    """
+    # Create access and refresh tokens
+    try:
+        access_token, refresh_token = start_session(user)
+    except Exception as e:
+        print(f"Error starting session: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Could not create authentication token",
@@ -85,51 +143,78 @@ async def login_for_access_token(
         print(f"Error updating login stats: {e}")
 
     # Set cookies in the response
-    response.set_cookie(
-        key="access_token",
-        value=access_token,
-        max_age=ACCESS_TOKEN_EXPIRE_SECONDS,
-        expires=ACCESS_TOKEN_EXPIRE_SECONDS,
-        httponly=COOKIE_HTTPONLY,
-        secure=COOKIE_SECURE,
-        samesite=COOKIE_SAMESITE,
-    )
+    set_session_cookies(response, access_token, refresh_token)
+    audit.record("login", actor_id=user["id"], ip=ip, details={"method": method})
+    rollups.record_login(user["id"])
 
     # Return success response
     return {"message": "Login successful"}
 
 
+@router.post("/refresh")
+async def refresh_access_token(
+    response: Response,
+    body: Optional[RefreshToken] = None,
+    refresh_token: Optional[str] = Cookie(None),
+):
+    """
+    Rotate the refresh token and issue a new access token.
+    Browsers send the refresh_token cookie and get new cookies back, other
+    clients send the token in the body and get the new tokens in the response.
+    """
+    token = body.refresh_token if body else refresh_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    try:
+        _, access_token, new_refresh_token = refresh_session(response, token)
+    except SessionError as e:
+        clear_session_cookies(response)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if body:
+        return Token(
+            access_token=access_token,
+            refresh_token=new_refresh_token or body.refresh_token,
+            token_type="bearer",
+        )
+    return {"message": "Token refreshed"}
+
+
 @router.post("/logout")
-async def logout(response: Response, current_user=Depends(get_current_user)):
+async def logout(
+    request: Request,
+    response: Response,
+    body: Optional[RefreshToken] = None,
+    refresh_token: Optional[str] = Cookie(None),
+    access_token: Optional[str] = Cookie(None),
+):
     """
-    Logout a user by invalidating their tokens and clearing cookies
+    Logout a user by revoking their session and clearing cookies.
+    Works from the refresh token alone, the access token may have expired.
     """
+    token = body.refresh_token if body else refresh_token
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    UPDATE token
-                    SET status = false
-                    WHERE user_id = %s
-                    """,
-                    (current_user["id"],),
-                )
-                conn.commit()
+        user_id = end_session(token) if token else None
+        if user_id is None:
+            # No usable refresh token, end every session of the access token's user
+            user = user_from_access_token(access_token)
+            if user is not None:
+                user_id = user["id"]
+                revoke_user_sessions(user_id)
+        if user_id is not None:
+            audit.record("logout", actor_id=user_id, ip=client_ip(request))
 
         # Clear cookies
-        response.delete_cookie(
-            key="access_token",
-            httponly=COOKIE_HTTPONLY,
-            secure=COOKIE_SECURE,
-            samesite=COOKIE_SAMESITE,
-        )
-        response.delete_cookie(
-            key="refresh_token",
-            httponly=COOKIE_HTTPONLY,
-            secure=COOKIE_SECURE,
-            samesite=COOKIE_SAMESITE,
-        )
+        clear_session_cookies(response)
 
         return {"message": "Successfully logged out"}
     except Exception as e:
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from fastapi import APIRouter, Cookie, WebSocket, WebSocketDisconnect
+
+from core import lifecycle, metrics
+from core.pubsub import RESYNC, subscribe
+from utils.auth import user_from_access_token
+from utils.permissions import has_permission, PERMISSION_ACCESS, PERMISSION_READ
+
+router = APIRouter()
+
+# Keeps proxies from closing idle sockets and notices gone clients
+HEARTBEAT_SECONDS = 15
+# How often an idle socket checks whether the worker is draining
+DRAIN_CHECK_SECONDS = 1
+
+
+@router.websocket("/ws/admin-watch")
+async def admin_watch_chats(
+    websocket: WebSocket,
+    chat_id: int | None = None,
+    user_id: int | None = None,
+    access_token: str | None = Cookie(None),
+):
+    """
+    Live events of client chats: one chat (chat_id), one client's chats
+    (user_id) or all chats. Events are the stored messages and the text of
+    replies as it streams. A {"type": "resync"} event means events were lost:
+    reload the chat from admin-get-client-chat and connect again.
+    Only authenticated admin users can access this endpoint.
+    """
+    # The access cookie only: a refresh could not set the new cookies here
+    user = user_from_access_token(access_token)
+    if user is None or not has_permission(user, PERMISSION_ACCESS | PERMISSION_READ):
+        await websocket.close(code=1008)
+        return
+
+    if chat_id is not None:
+        topic = f"chat:{chat_id}"
+    elif user_id is not None:
+        topic = f"user:{user_id}"
+    else:
+        topic = "chats"
+
+    await websocket.accept()
+    subscription = subscribe(topic)
+    metrics.increment("chat_watchers_total")
+    last_sent = time.monotonic()
+    try:
+        while True:
+            if lifecycle.state["draining"]:
+                # Let the worker finish draining, the client reconnects elsewhere
+                await websocket.close(code=1012)
+                return
+            try:
+                event = await subscription.get(timeout=DRAIN_CHECK_SECONDS)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+                    await websocket.send_json({"type": "ping"})
+                    last_sent = time.monotonic()
+                continue
+            await websocket.send_json(event)
+            last_sent = time.monotonic()
+            if event.get("type") == RESYNC["type"]:
+                # Dropped, or an event was lost: the client reloads and reconnects
+                await websocket.close(code=1013)
+                return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from core.singleflight import coalesce
+from utils.auth import get_current_user
+from utils.permissions import (
+    accessible_organisations,
+    has_permission,
+    PERMISSION_ACCESS,
+    PERMISSION_READ,
+)
+from utils.rollups import login_stats, user_stats
+
+router = APIRouter()
+
+# Longest range get-login-stats serves
+MAX_DAYS = 366
+
+
+def _organisation(current_user: dict, organisation_id: int | None) -> int:
+    """
+    The requested organisation, or the user's only one, if the user may
+    read it
+    """
+    if organisation_id is None:
+        orgs = accessible_organisations(current_user)
+        if len(orgs) != 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="organisation_id is required",
+            )
+        organisation_id = orgs[0]
+    if not has_permission(current_user, PERMISSION_ACCESS | PERMISSION_READ, organisation_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions",
+        )
+    return organisation_id
+
+
+@router.get("/get-login-stats")
+async def get_login_stats(
+    days: int = 30,
+    organisation_id: int | None = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Logins and active users per day (UTC) for the last `days` days, and
+    logins per group over the same range, read from the login rollups.
+    Only authenticated admin users can access this endpoint.
+    """
+    if not 1 <= days <= MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"days must be between 1 and {MAX_DAYS}",
+        )
+    org = _organisation(current_user, organisation_id)
+    until = datetime.utcnow().date()
+    since: date = until - timedelta(days=days - 1)
+    try:
+        return await coalesce("login_stats", (org, since, until), login_stats)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to retrieve login stats: {str(e)}"
+        )
+
+
+@router.get("/get-user-stats")
+async def get_user_stats(
+    organisation_id: int | None = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Users, never logged in, dormant and recently active accounts per group,
+    as of the last rollup refresh (refreshed_at).
+    Only authenticated admin users can access this endpoint.
+    """
+    org = _organisation(current_user, organisation_id)
+    try:
+        return await coalesce("user_stats", (org,), user_stats)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to retrieve user stats: {str(e)}"
+        )
@@ -0,0 +1,102 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from core import audit
+from core.responses import stream_json_list
+from schemas.documents import AdminDeleteDocumentRequest, RetrieveRequest
+from utils.auth import get_current_user
+from utils.documents import (
+    DocumentError,
+    delete_document,
+    ingest_document,
+    list_documents,
+    retrieve,
+)
+from utils.onboarding import OnboardingError, multipart_boundary
+from utils.permissions import require_permission, PERMISSION_READ, PERMISSION_WRITE
+
+router = APIRouter()
+
+
+@router.post("/upload-document")
+async def admin_upload_document(
+    request: Request,
+    title: str | None = None,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin upload a text document for chat-docs as multipart/form-data.
+    It is chunked and indexed while it is received.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        boundary = multipart_boundary(request.headers.get("content-type", ""))
+        result = await ingest_document(
+            request.stream(), boundary, title=title, uploaded_by=current_user["id"]
+        )
+    except (OnboardingError, DocumentError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to index document: {str(e)}")
+
+    audit.record(
+        "document_uploaded",
+        actor_id=current_user["id"],
+        subject_type="document",
+        subject_id=result["document_id"],
+        details={"title": result["title"], "chunks": result["chunks"]},
+    )
+    return result
+
+
+@router.get("/get-documents")
+async def admin_get_documents(
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Get all documents and their indexing status.
+    Only authenticated admin users can access this endpoint.
+    """
+    return stream_json_list(list_documents(), key="documents")
+
+
+@router.post("/delete-document")
+async def admin_delete_document(
+    request: AdminDeleteDocumentRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin delete a document and remove it from the index.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        deleted = delete_document(request.document_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete document: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    audit.record(
+        "document_deleted",
+        actor_id=current_user["id"],
+        subject_type="document",
+        subject_id=request.document_id,
+    )
+    return {"document_id": request.document_id}
+
+
+@router.post("/retrieve")
+async def retrieve_chunks(
+    request: RetrieveRequest, current_user: dict = Depends(get_current_user)
+):
+    """
+    The most relevant document chunks for each query, in one round trip
+    """
+    try:
+        results = await asyncio.to_thread(
+            retrieve, request.queries, request.k, request.document_ids
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve chunks: {str(e)}")
+    return {"results": results}
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from utils.export import ExportError, build_export_query, stream_export
+from utils.permissions import require_permission, PERMISSION_READ
+
+router = APIRouter()
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# Query parameters that are not filters
+EXPORT_OPTIONS = {"format", "columns", "compress"}
+
+
+@router.get("/{dataset}")
+async def admin_export(
+    dataset: str,
+    request: Request,
+    format: str = Query("csv"),
+    columns: str | None = Query(None),
+    compress: bool = Query(False),
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Export users (with login stats), chats or artifacts as CSV or NDJSON.
+    `columns` is a comma separated subset of the dataset's columns, any other
+    query parameter is a filter (e.g. status, since, until).
+    Only authenticated admin users can access this endpoint.
+    """
+    filters = {
+        name: value
+        for name, value in request.query_params.items()
+        if name not in EXPORT_OPTIONS
+    }
+    selected = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    try:
+        query, params = build_export_query(dataset, selected, filters, format)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filename = f"{dataset}_{datetime.now().strftime('%d%m%Y_%H%M%S')}.{format}"
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        stream_export(query, params, compress),
+        media_type="application/gzip" if compress else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
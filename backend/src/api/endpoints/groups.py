@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from core import audit
+from schemas.groups import AdminDeleteGroupRequest, AdminDeleteGroupsRequest
+from utils.permissions import require_permission, PERMISSION_WRITE
+from utils.sharing import delete_groups
+
+router = APIRouter()
+
+
+@router.post("/delete_group")
+async def admin_delete_group(
+    request: AdminDeleteGroupRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin delete a group by group id. Its members stay, without a group,
+    and lose the artifacts shared with it.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        deleted = delete_groups([request.group_id])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete group: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Group not found")
+    audit.record(
+        "group_deleted",
+        actor_id=current_user["id"],
+        subject_type="group",
+        subject_id=deleted[0],
+    )
+    return {"group_id": deleted[0]}
+
+
+@router.post("/delete_groups")
+async def admin_delete_groups(
+    request: AdminDeleteGroupsRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin delete multiple groups by group ids
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        deleted = delete_groups(request.ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete groups: {str(e)}")
+    if deleted:
+        audit.record(
+            "groups_deleted",
+            actor_id=current_user["id"],
+            subject_type="group",
+            details={"ids": deleted},
+        )
+    return {"group_ids": deleted}
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Response, status
+from fastapi.responses import PlainTextResponse
+
+from core import metrics
+from core.lifecycle import state
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz():
+    """
+    Liveness probe, the process is up and serving
+    """
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz(response: Response):
+    """
+    Readiness probe, pools are warm and the worker is not draining
+    """
+    if not state["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "ready": state["ready"],
+        "draining": state["draining"],
+        "in_flight": state["in_flight"],
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Counters of this worker process in the Prometheus text format
+    """
+    return metrics.render()
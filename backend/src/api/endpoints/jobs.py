@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from core.jobs import enqueue, get_job, list_jobs, take_job_secrets
+from core.singleflight import coalesce
+from utils.auth import get_current_user
+from utils.permissions import require_permission, PERMISSION_WRITE
+
+router = APIRouter()
+
+
+@router.get("/get-jobs")
+async def get_jobs(current_user: dict = Depends(get_current_user)):
+    """
+    Most recent background jobs started by the current user
+    """
+    # In-flight sharing only: workers in other processes cannot invalidate
+    # a reused result when they move a job on
+    return {
+        "jobs": await coalesce("jobs", (current_user["id"],), list_jobs, window_us=0)
+    }
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: int, current_user: dict = Depends(get_current_user)):
+    """
+    Status and progress of a background job started by the current user.
+    Secrets in the result (generated passwords) are returned once and then
+    removed from the database. Unfetched ones expire after
+    JOB_SECRETS_TTL_SECONDS.
+    """
+    # Progress bars poll this, often from several tabs
+    job = await coalesce("job", (job_id,), get_job, window_us=0)
+    if job is None or job["created_by"] != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job["status"] == "succeeded" and job["result"] and "secrets" in job["result"]:
+        job["result"]["secrets"] = take_job_secrets(job_id)
+    return {"job": job}
+
+
+@router.post("/backup")
+async def admin_backup(
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Queue a full database backup.
+    Only authenticated admin users can access this endpoint.
+    """
+    job_id = enqueue("backup_full", {}, created_by=current_user["id"])
+    return {"message": "Backup queued", "job_id": job_id}
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from utils.permissions import require_permission, PERMISSION_READ
+from utils.search import search, SEARCH_KINDS, SEARCH_MAX_LIMIT
+
+router = APIRouter()
+
+
+@router.get("")
+async def admin_search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    kinds: str = Query(",".join(SEARCH_KINDS)),
+    limit: int = Query(10, ge=1, le=SEARCH_MAX_LIMIT),
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Type-ahead search over clients, artifacts and chats.
+    Returns the top `limit` matches ranked across the requested kinds.
+    Only authenticated admin users can access this endpoint.
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q must not be blank")
+
+    requested = [kind.strip() for kind in kinds.split(",") if kind.strip()]
+    unknown = set(requested) - set(SEARCH_KINDS)
+    if not requested or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"kinds must be a comma separated subset of {', '.join(SEARCH_KINDS)}",
+        )
+
+    result = await search(q, requested, limit, request.is_disconnected)
+    if result is None:
+        # Client went away, nobody is listening for a body
+        return Response(status_code=499)
+    return result
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 import psycopg
 from schemas.users import (
     UserCreate,
     AdminCreateUserRequest,
+    AdminCreateUsersRequest,
     AdminGetClientRequest,
     AdminUpdateUserRequest,
     AdminDeleteClientRequest,
@@ -11,7 +13,19 @@ from schemas.users import (
 )
 from utils.auth import get_password_hash, get_current_user, get_current_user
 from utils.users import generate_password
-from core.database import get_db_connection
+from utils.onboarding import (
+    OnboardingError,
+    multipart_boundary,
+    onboard_clients,
+    spool_body,
+    spooled_chunks,
+)
+from utils.permissions import require_permission, PERMISSION_READ, PERMISSION_WRITE
+from utils.sharing import refresh_user_visibility
+from core import audit
+from core.database import get_db_connection, stream_rows
+from core.responses import stream_json_list
+from core.jobs import enqueue
 
 
 # Load environment variables
@@ -51,19 +65,24 @@ async def create_user(user: UserCreate, _: dict = Depends(get_current_user)):
                 # Execute the INSERT statement
                 cur.execute(
                     """
-                    INSERT INTO users (full_name, email, password_hash)
-                    VALUES (%s, %s, %s)
+                    INSERT INTO users (full_name, email, password_hash, group_id)
+                    VALUES (%s, %s, %s, %s)
                     RETURNING id
                     """,
                     (
                         user.full_name,
                         user.email,
                         hashed_password,
+                        user.group_id,
                     ),
                 )
 
                 user_id = cur.fetchone()
 
+                # Artifacts shared with the group become visible to the new user
+                if user.group_id is not None:
+                    refresh_user_visibility(cur, [user_id[0]])  # type: ignore
+
                 conn.commit()
 
         return {"id": user_id[0], "full_name": user.full_name}  # type: ignore
@@ -81,7 +100,7 @@ async def create_user(user: UserCreate, _: dict = Depends(get_current_user)):
 @router.post("/create-user")
 async def admin_create_user(
     request: AdminCreateUserRequest,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
 ):
     """
     Admin create client user through the dashboard.
@@ -95,6 +114,7 @@ async def admin_create_user(
         full_name=request.full_name,
         email=request.email,
         password=generated_password,
+        group_id=request.group_id,
     )
 
     try:
@@ -103,6 +123,13 @@ async def admin_create_user(
 
         # Extract the user ID from the result
         client_user_id = user_result["id"]
+        audit.record(
+            "user_created",
+            actor_id=current_user["id"],
+            subject_type="user",
+            subject_id=client_user_id,
+            details={"email": request.email, "group_id": request.group_id},
+        )
 
         # Return success response
         return {
@@ -118,10 +145,61 @@ async def admin_create_user(
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
 
+@router.post("/create-users")
+async def admin_create_users(
+    request: AdminCreateUsersRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin bulk create client users in the background.
+    Returns a job id, poll /api/jobs/{job_id} for progress and the generated passwords.
+    Only authenticated admin users can access this endpoint.
+    """
+    job_id = enqueue(
+        "create_users",
+        {"users": [user.model_dump() for user in request.users]},
+        created_by=current_user["id"],
+        progress_total=len(request.users),
+    )
+    audit.record(
+        "users_create_queued",
+        actor_id=current_user["id"],
+        subject_type="job",
+        subject_id=job_id,
+        details={"emails": [user.email for user in request.users]},
+    )
+    return {"message": "User creation queued", "job_id": job_id}
+
+
+@router.post("/upload-clients")
+async def admin_upload_clients(
+    request: Request,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Admin onboard clients from a CSV file uploaded as multipart/form-data.
+    The header row needs full_name and email, group_id is optional.
+    Passwords are auto generated. Streams back one NDJSON line per row.
+    Only authenticated admin users can access this endpoint.
+    """
+    try:
+        boundary = multipart_boundary(request.headers.get("content-type", ""))
+        # The whole body has to be read before the response starts
+        body = await spool_body(request.stream())
+    except OnboardingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    audit.record("clients_uploaded", actor_id=current_user["id"])
+    return StreamingResponse(
+        onboard_clients(spooled_chunks(body), boundary),
+        media_type="application/x-ndjson",
+    )
+
+
 @router.post("/update-user")
 async def admin_update_user(
     request: AdminUpdateUserRequest,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
 ):
     """
     Admin update client user through the dashboard.
@@ -137,21 +215,38 @@ async def admin_update_user(
                 cur.execute(
                     """
                     UPDATE users 
-                    SET full_name = %s, email = %s
+                    SET full_name = %s, email = %s, group_id = %s
                     WHERE id = %s
                     RETURNING id
                     """,
                     (
                         request.full_name,
                         request.email,
+                        request.group_id,
                         request.id,
                     ),
                 )
 
                 user_id = cur.fetchone()
 
+                # Group membership may have changed, only differences are written
+                if user_id:
+                    refresh_user_visibility(cur, [user_id[0]])
+
                 conn.commit()
 
+        if user_id:
+            audit.record(
+                "user_updated",
+                actor_id=current_user["id"],
+                subject_type="user",
+                subject_id=user_id[0],
+                details={
+                    "full_name": request.full_name,
+                    "email": request.email,
+                    "group_id": request.group_id,
+                },
+            )
         return {"user_id": user_id[0]}  # type: ignore
 
     except HTTPException as he:
@@ -159,3 +254,50 @@ async def admin_update_user(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update user: {str(e)}")
+
+
+@router.get("/get-clients")
+async def admin_get_clients(
+    current_user: dict = Depends(require_permission(PERMISSION_READ)),
+):
+    """
+    Get all client users.
+    Only authenticated admin users can access this endpoint.
+    """
+    # Streamed row by row, the client list can grow to any size
+    return stream_json_list(
+        stream_rows(
+            """
+            SELECT id, full_name, email, status, created_at, group_id
+            FROM users
+            ORDER BY id
+            """
+        ),
+        key="clients",
+    )
+
+
+@router.post("/delete-clients")
+async def admin_delete_clients(
+    request: AdminDeleteClientsRequest,
+    current_user: dict = Depends(require_permission(PERMISSION_WRITE)),
+):
+    """
+    Delete clients specified by ids in the request, in the background.
+    Returns a job id, poll /api/jobs/{job_id} for progress.
+    Only authenticated admin users can access this endpoint.
+    """
+    job_id = enqueue(
+        "delete_users",
+        {"ids": request.ids},
+        created_by=current_user["id"],
+        progress_total=len(request.ids),
+    )
+    audit.record(
+        "clients_delete_queued",
+        actor_id=current_user["id"],
+        subject_type="job",
+        subject_id=job_id,
+        details={"ids": request.ids},
+    )
+    return {"message": "Client deletion queued", "job_id": job_id}
@@ -1,8 +1,17 @@
 from fastapi import APIRouter
-from api.endpoints import users, auth
+from api.endpoints import users, auth, search, artifacts, jobs, exports, audit, documents, chat, dashboard, groups
 
 api_router = APIRouter(prefix="/api")
 
 
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
+api_router.include_router(groups.router, prefix="/groups", tags=["groups"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
+api_router.include_router(artifacts.router, prefix="/artifacts", tags=["artifacts"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(exports.router, prefix="/exports", tags=["exports"])
+api_router.include_router(documents.router, prefix="/documents", tags=["documents"])
+api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
+api_router.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
+api_router.include_router(audit.router, prefix="/audit", tags=["audit"])
@@ -0,0 +1,146 @@
+"""
+Microbenchmarks for the auth primitives in utils/auth.py and utils/users.py.
+
+Times token creation, the JWT decode done in get_current_user, bcrypt hashing
+and verification at several cost factors, password generation, and compares
+python-jose against pyjwt for the same HS256 tokens.
+
+Run from backend/src:
+
+    python -m bench.auth_primitives --rounds 10 12 14
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+import jwt as pyjwt
+from jose import jwt as jose_jwt
+from passlib.context import CryptContext
+
+from bench.common import percentile, save_result
+from utils.auth import (
+    ALGORITHM,
+    PWD_SALT,
+    SECRET_KEY,
+    create_access_token,
+)
+from utils.users import generate_password
+
+# Tokens are signed with a throwaway key when JWT_SECRET_KEY is not set
+BENCH_SECRET = SECRET_KEY or "bench-secret-key"
+
+
+def measure(fn, iterations: int, warmup: int = 3) -> dict:
+    """Call fn repeatedly and return latency statistics in microseconds"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "ops_per_sec": iterations / total if total else 0.0,
+        "mean_us": total / iterations * 1e6,
+        "p50_us": percentile(timings, 0.50) * 1e6,
+        "p99_us": percentile(timings, 0.99) * 1e6,
+    }
+
+
+def jwt_cases(iterations: int) -> dict:
+    claims = {"sub": "bench@bench.local"}
+    token = create_access_token(data=claims, expires_delta=timedelta(minutes=15))
+    # create_access_token signs with SECRET_KEY, re-sign for the decode cases
+    token = jose_jwt.encode(
+        jose_jwt.get_unverified_claims(token), BENCH_SECRET, algorithm=ALGORITHM
+    )
+
+    return {
+        "create_access_token": measure(
+            lambda: create_access_token(data=claims), iterations
+        ),
+        "jose.encode": measure(
+            lambda: jose_jwt.encode(claims, BENCH_SECRET, algorithm=ALGORITHM),
+            iterations,
+        ),
+        "pyjwt.encode": measure(
+            lambda: pyjwt.encode(claims, BENCH_SECRET, algorithm=ALGORITHM),
+            iterations,
+        ),
+        # Same call get_current_user makes
+        "jose.decode (get_current_user)": measure(
+            lambda: jose_jwt.decode(token, BENCH_SECRET, algorithms=[ALGORITHM]),
+            iterations,
+        ),
+        "pyjwt.decode": measure(
+            lambda: pyjwt.decode(token, BENCH_SECRET, algorithms=[ALGORITHM]),
+            iterations,
+        ),
+    }
+
+
+def bcrypt_cases(rounds: list[int], iterations: int) -> dict:
+    results = {}
+    password = generate_password(12)
+    for r in rounds:
+        ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=r)
+        hashed = ctx.hash(password + PWD_SALT)
+        results[f"get_password_hash (rounds={r})"] = measure(
+            lambda: ctx.hash(password + PWD_SALT), iterations, warmup=1
+        )
+        results[f"verify_password (rounds={r})"] = measure(
+            lambda: ctx.verify(password + PWD_SALT, hashed), iterations, warmup=1
+        )
+    return results
+
+
+def print_report(results: dict):
+    print(f"\n{'case':<38} {'ops/s':>12} {'mean us':>12} {'p50 us':>12} {'p99 us':>12}")
+    for name, r in results.items():
+        print(
+            f"{name:<38} {r['ops_per_sec']:>12.1f} {r['mean_us']:>12.1f} "
+            f"{r['p50_us']:>12.1f} {r['p99_us']:>12.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark auth primitives.")
+    parser.add_argument(
+        "--iterations", type=int, default=5000, help="Iterations for fast cases"
+    )
+    parser.add_argument(
+        "--bcrypt-iterations", type=int, default=10, help="Iterations per bcrypt case"
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        nargs="+",
+        default=[10, 11, 12, 13],
+        help="bcrypt cost factors to compare",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    results.update(jwt_cases(args.iterations))
+    results["generate_password"] = measure(generate_password, args.iterations)
+    results.update(bcrypt_cases(args.rounds, args.bcrypt_iterations))
+
+    print_report(results)
+    result_file = save_result(
+        "auth_primitives",
+        {"cases": results},
+        {
+            "iterations": args.iterations,
+            "bcrypt_iterations": args.bcrypt_iterations,
+            "rounds": args.rounds,
+        },
+    )
+    print(f"\nResults written to {result_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Helpers shared by the benchmark scripts"""
+
+import json
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+RESULTS_DIR = Path("../benchmarks/results")
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_result(name: str, result: dict, config: dict) -> Path:
+    """Write a result as JSON tagged with the current commit, return the path"""
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    commit = git_commit()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    result_file = RESULTS_DIR / f"{name}_{timestamp}_{commit}.json"
+    result.update({"git_commit": commit, "timestamp": timestamp, "config": config})
+    result_file.write_text(json.dumps(result, indent=2))
+    return result_file
@@ -8,6 +8,7 @@ import psycopg
 from fastapi import HTTPException
 from utils.auth import get_password_hash
 from core.database import get_db_connection
+from core.migrations import apply_migrations
 import re
 
 
@@ -73,6 +74,176 @@ def create_user(args):
         print(f"Failed to create user: {str(e)}")
 
 
+def export(args):
+    """
+    Export a dataset to a CSV or NDJSON file straight from COPY ... TO STDOUT.
+    """
+    from utils.export import ExportError, build_export_query, export_to_file
+
+    filters = {}
+    for item in args.filter or []:
+        name, _, value = item.partition("=")
+        filters[name] = value
+    columns = args.columns.split(",") if args.columns else None
+
+    try:
+        query, params = build_export_query(args.dataset, columns, filters, args.format)
+    except ExportError as e:
+        print(f"Error: {e}")
+        return
+
+    output = args.output
+    if output is None:
+        timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
+        export_dir = Path("../exports")
+        export_dir.mkdir(exist_ok=True)
+        output = export_dir / f"{args.dataset}_{timestamp}.{args.format}"
+        if args.gzip:
+            output = output.with_name(output.name + ".gz")
+
+    try:
+        written = export_to_file(query, params, str(output), args.gzip)
+        print(f"Exported {args.dataset} to {output} ({written / 1024:.1f} KB)")
+    except Exception as e:
+        print(f"Failed to export {args.dataset}: {str(e)}")
+
+
+def worker(args):
+    """
+    Run a background job worker until interrupted.
+    """
+    import asyncio
+    import utils.job_handlers  # noqa: F401 - registers the handlers
+    from core import llm
+    from core.jobs import JobWorker
+
+    async def run():
+        # Handlers such as summarize_chat call the model
+        await llm.start_client()
+        try:
+            await JobWorker(args.job_types).run()
+        finally:
+            await llm.stop_client()
+
+    asyncio.run(run())
+
+
+def migrate(args):
+    """
+    Apply pending SQL migrations from src/migrations.
+    """
+    with get_db_connection() as conn:  # type: ignore
+        applied = apply_migrations(conn)
+
+    if applied:
+        print(f"Applied migrations: {', '.join(applied)}")
+    else:
+        print("Database is up to date.")
+
+
+def audit_maintenance(args):
+    """
+    Create upcoming audit log partitions and drop those past retention.
+    """
+    from core.audit import maintain_partitions
+
+    try:
+        result = maintain_partitions()
+        print(f"Audit partitions ready: {', '.join(result['ensured'])}")
+        if result["dropped"]:
+            print(f"Dropped: {', '.join(result['dropped'])}")
+    except Exception as e:
+        print(f"Failed to maintain audit partitions: {str(e)}")
+
+
+def reindex_artifacts(args):
+    """
+    Rewrite the search vectors of all artifacts from their current content.
+    """
+    from utils.artifacts import reindex_artifacts as reindex
+
+    try:
+        print(f"Reindexed {reindex()} artifacts.")
+    except Exception as e:
+        print(f"Failed to reindex artifacts: {str(e)}")
+
+
+def refresh_rollups(args):
+    """
+    Recompute the dashboard's user rollups now.
+    """
+    from utils.rollups import refresh_user_rollups
+
+    try:
+        if refresh_user_rollups(force=True):
+            print("User rollups refreshed.")
+        else:
+            print("Another process is refreshing the user rollups.")
+    except Exception as e:
+        print(f"Failed to refresh user rollups: {str(e)}")
+
+
+def create_organisation(args):
+    """
+    Create a new organisation.
+    """
+    try:
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO organisations (name)
+                    VALUES (%s)
+                    RETURNING id
+                    """,
+                    (args.name,),
+                )
+                organisation_id = cur.fetchone()
+                conn.commit()
+
+        print(f"Organisation created successfully with ID: {organisation_id[0]}")  # type: ignore
+
+    except psycopg.errors.UniqueViolation:
+        print("Error: An organisation with this name already exists.")
+    except Exception as e:
+        print(f"Failed to create organisation: {str(e)}")
+
+
+def add_user_to_organisation(args):
+    """
+    Grant a user permissions in an organisation.
+    The new permissions apply when the user's access token is next refreshed.
+    """
+    permission_type = int(args.permission_type)
+    assert 0 <= permission_type <= 7, "permission_type must follow 7 >= perm >= 0"
+
+    try:
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO user_organisation (user_id, organisation_id, permission_type)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id, organisation_id)
+                    DO UPDATE SET permission_type = EXCLUDED.permission_type
+                    """,
+                    (args.user_id, args.organisation_id, permission_type),
+                )
+                # Permissions are baked into the access token and picked up
+                # again at its next refresh
+                conn.commit()
+
+        print(
+            f"User {args.user_id} granted permission {permission_type} "
+            f"in organisation {args.organisation_id}"
+        )
+
+    except psycopg.errors.ForeignKeyViolation:
+        print("Error: User or organisation does not exist.")
+    except Exception as e:
+        print(f"Failed to add user to organisation: {str(e)}")
+
+
 def create_secrets(args):
     """
     Create a secrets file with auto-generated values.
@@ -258,6 +429,7 @@ def backup_db_schema(args):
             print(f"File size: {backup_file.stat().st_size / 1024:.1f} KB")
             if extensions:
                 print(f"Included extensions: {', '.join(extensions)}")
+            return backup_file
         else:
             print(f"Error creating backup: {result.stderr}")
             # Remove incomplete backup file
@@ -278,13 +450,24 @@ def backup_db_schema(args):
 def backup_db_full(args):
     """
     Create a full database backup with schema and data.
+    pg_dump runs at low priority behind a bandwidth limit, see utils/backups.py.
+    Returns the backup file, or None if the backup failed.
     """
+    from utils.backups import (
+        BACKUP_DIR,
+        BackupFailed,
+        BackupLocked,
+        backup_lock,
+        prune_backups,
+        record_metrics,
+        run_dump,
+    )
+
     db_config = get_db_config()
     timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
 
     # Create backups directory if it doesn't exist
-    backup_dir = Path("../backups")
-    backup_dir.mkdir(exist_ok=True)
+    BACKUP_DIR.mkdir(exist_ok=True)
     if "DB_CONNECTION_STRING" in os.environ:
         conn_str = os.environ["DB_CONNECTION_STRING"]
     else:
@@ -296,77 +479,78 @@ def backup_db_full(args):
     match = re.search(r"@([^:/]+)", conn_str)
     host_name = match.group(1) if match else db_config["host"]
 
-    backup_file = backup_dir / f"full_backup_{host_name}_{timestamp}.sql"
+    backup_file = BACKUP_DIR / f"full_backup_{host_name}_{timestamp}.sql"
 
     try:
-        # Get installed extensions first
-        extensions = get_installed_extensions()
-        print(f"Found extensions: {', '.join(extensions) if extensions else 'none'}")
-
-        # Prepare pg_dump command for full backup
-        cmd = [
-            "pg_dump",
-            conn_str,
-            "--no-owner",  # Don't include ownership commands
-            "--no-privileges",  # Don't include privilege commands
-            "--inserts",  # Use INSERT commands instead of COPY
-            "--clean",  # Include DROP statements before CREATE
-            "--if-exists",  # Use IF EXISTS with DROP statements
-            "--verbose",
-        ]
+        with backup_lock():
+            # Get installed extensions first
+            extensions = get_installed_extensions()
+            print(f"Found extensions: {', '.join(extensions) if extensions else 'none'}")
+
+            # Prepare pg_dump command for full backup
+            cmd = [
+                "pg_dump",
+                conn_str,
+                "--no-owner",  # Don't include ownership commands
+                "--no-privileges",  # Don't include privilege commands
+                "--inserts",  # Use INSERT commands instead of COPY
+                "--clean",  # Include DROP statements before CREATE
+                "--if-exists",  # Use IF EXISTS with DROP statements
+                "--verbose",
+            ]
 
-        # Set password via environment variable
-        env = os.environ.copy()
-        env["PGPASSWORD"] = db_config["password"]
+            # Set password via environment variable
+            env = os.environ.copy()
+            env["PGPASSWORD"] = db_config["password"]
 
-        print(f"Creating full backup: {backup_file}")
+            print(f"Creating full backup: {backup_file}")
 
-        with open(backup_file, "w") as f:
-            # Add custom header
-            f.write("--\n")
-            f.write(f"-- PostgreSQL database full backup\n")
-            f.write(
+            # Custom header, then database setup and extensions
+            header = (
+                "--\n"
+                "-- PostgreSQL database full backup\n"
                 f"-- Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-            )
-            f.write(f"-- Database: {db_config['dbname']}\n")
-            f.write("-- Includes schema and data\n")
-            f.write("--\n\n")
-
-            # Add database setup and extensions header
-            db_setup_header = create_database_setup_header(db_config)
-            f.write(db_setup_header)
-
-            # Run pg_dump and write to file
-            result = subprocess.run(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env
-            )
-
-            if result.returncode == 0:
-                # Write the pg_dump output to file
-                f.write(result.stdout)
-            else:
-                raise Exception(f"pg_dump failed: {result.stderr}")
-
-        if result.returncode == 0:
-            print(f"Full backup created successfully: {backup_file}")
-            print(f"File size: {backup_file.stat().st_size / 1024:.1f} KB")
-            if extensions:
-                print(f"Included extensions: {', '.join(extensions)}")
-        else:
-            print(f"Error creating backup: {result.stderr}")
-            # Remove incomplete backup file
-            if backup_file.exists():
-                backup_file.unlink()
-
+                f"-- Database: {db_config['dbname']}\n"
+                "-- Includes schema and data\n"
+                "--\n\n"
+            ) + create_database_setup_header(db_config)
+
+            metrics = run_dump(cmd, env, header, backup_file)
+            metrics["pruned"] = prune_backups("full_backup_")
+
+        record_metrics(metrics)
+        print(f"Full backup created successfully: {backup_file}")
+        print(f"File size: {backup_file.stat().st_size / 1024:.1f} KB")
+        if extensions:
+            print(f"Included extensions: {', '.join(extensions)}")
+        return backup_file
+
+    except BackupLocked as e:
+        print(f"Skipping backup: {str(e)}")
     except FileNotFoundError:
         print(
             "Error: pg_dump not found. Please ensure PostgreSQL client tools are installed."
         )
+    except BackupFailed as e:
+        record_metrics({"file": str(backup_file), "error": str(e)})
+        print(f"Failed to create full backup: {str(e)}")
     except Exception as e:
         print(f"Failed to create full backup: {str(e)}")
-        # Remove incomplete backup file if it exists
-        if backup_file.exists():
-            backup_file.unlink()
+
+
+def backup_scheduler(args):
+    """
+    Run a full backup every day at --at (local time, HH:MM) until interrupted.
+    """
+    import time
+    from utils.backups import seconds_until
+
+    print(f"Scheduling daily full backups at {args.at}")
+    while True:
+        wait = seconds_until(args.at)
+        print(f"Next backup in {wait / 3600:.1f} hours")
+        time.sleep(wait)
+        backup_db_full(args)
 
 
 def restore_db(args):
@@ -443,15 +627,15 @@ if __name__ == "__main__":
     )
     create_user_parser.add_argument("--password", help="Password for the new user")
 
-    add_user_to_organisation = subparsers.add_parser(
+    add_user_to_organisation_parser = subparsers.add_parser(
         "add_user_to_organisation",
         help="Adds a given user to a given organisation with the given permissions",
     )
-    add_user_to_organisation.add_argument("--user_id", required=True, help="user id")
-    add_user_to_organisation.add_argument(
+    add_user_to_organisation_parser.add_argument("--user_id", required=True, help="user id")
+    add_user_to_organisation_parser.add_argument(
         "--organisation_id", required=True, help="organisation id"
     )
-    add_user_to_organisation.add_argument(
+    add_user_to_organisation_parser.add_argument(
         "--permission_type",
         required=True,
         help="permissions to be granted - must follow: 7 >= perm >= 0, it is a standard int3 permission with access, read, write in the 1, 2, and 4 bit.",
@@ -483,6 +667,15 @@ if __name__ == "__main__":
         "backup_full", help="Create a full database backup (schema + data)"
     )
 
+    backup_scheduler_parser = subparsers.add_parser(
+        "backup_scheduler", help="Run throttled full backups every day at a set time"
+    )
+    backup_scheduler_parser.add_argument(
+        "--at",
+        default=os.getenv("BACKUP_AT", "03:00"),
+        help="Local time of day to run the backup, HH:MM (default: BACKUP_AT or 03:00)",
+    )
+
     restore_parser = subparsers.add_parser(
         "restore_db", help="Restore database from backup file"
     )
@@ -495,6 +688,49 @@ if __name__ == "__main__":
         "create_secrets", help="Create a secrets file with auto-generated values"
     )
 
+    subparsers.add_parser("migrate", help="Apply pending database migrations")
+
+    subparsers.add_parser(
+        "audit_maintenance",
+        help="Create upcoming audit log partitions and drop expired ones",
+    )
+
+    subparsers.add_parser(
+        "reindex_artifacts", help="Rewrite the search vectors of all artifacts"
+    )
+
+    subparsers.add_parser(
+        "refresh_rollups", help="Recompute the dashboard's user rollups"
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export users, chats or artifacts to CSV or NDJSON"
+    )
+    export_parser.add_argument("dataset", help="users, chats or artifacts")
+    export_parser.add_argument(
+        "--format", default="csv", choices=["csv", "ndjson"], help="Output format"
+    )
+    export_parser.add_argument(
+        "--columns", help="Comma separated columns to export (default: all)"
+    )
+    export_parser.add_argument(
+        "--filter",
+        action="append",
+        help="Filter as name=value, e.g. --filter since=2025-01-01 (repeatable)",
+    )
+    export_parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+    export_parser.add_argument(
+        "--output", help="Output file (default: ../exports/<dataset>_<timestamp>)"
+    )
+
+    worker_parser = subparsers.add_parser("worker", help="Run a background job worker")
+    worker_parser.add_argument(
+        "--job-types",
+        nargs="*",
+        default=None,
+        help="Only handle these job types (default: all)",
+    )
+
     get_password_hash_parser = subparsers.add_parser("get_pwdhash", help="get_pwdhash")
 
     get_password_hash_parser.add_argument(
@@ -504,8 +740,17 @@ if __name__ == "__main__":
     actions = {
         "create_user": create_user,
         "create_env": create_env,
+        "create_organisation": create_organisation,
+        "add_user_to_organisation": add_user_to_organisation,
+        "migrate": migrate,
+        "audit_maintenance": audit_maintenance,
+        "reindex_artifacts": reindex_artifacts,
+        "refresh_rollups": refresh_rollups,
+        "export": export,
+        "worker": worker,
         "backup_schema": backup_db_schema,
         "backup_full": backup_db_full,
+        "backup_scheduler": backup_scheduler,
         "restore_db": restore_db,
         "create_secrets": create_secrets,
         "get_pwdhash": get_password_hash_cmd,
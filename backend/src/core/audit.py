@@ -0,0 +1,194 @@
+"""
+Audit log with batched writes into monthly partitions.
+
+record() only appends the event to an in-memory queue, so logins and admin
+mutations pay no database round trip for their audit row. A
+core.batch_writer.BatchWriter drains the queue every AUDIT_FLUSH_SECONDS
+(or as soon as AUDIT_BATCH_SIZE events are waiting) and writes each batch
+with one COPY. Shutdown flushes whatever is left.
+
+audit_log is range partitioned by month. The flusher keeps partitions
+created AUDIT_PARTITIONS_AHEAD months ahead and drops whole partitions
+older than AUDIT_RETENTION_MONTHS. Reads always take a date range, so
+Postgres only scans the partitions it covers.
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+
+import psycopg
+from dotenv import load_dotenv
+
+from core.batch_writer import BatchWriter
+from core.database import get_db_connection, stream_rows
+
+load_dotenv()
+
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+# Events beyond this are dropped (oldest first) while the database is down
+AUDIT_MAX_QUEUE = int(os.getenv("AUDIT_MAX_QUEUE", "100000"))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+AUDIT_PARTITIONS_AHEAD = 2
+# How often the flusher checks partitions
+AUDIT_MAINTENANCE_SECONDS = 6 * 60 * 60
+
+AUDIT_COLUMNS = (
+    "occurred_at",
+    "event",
+    "actor_id",
+    "subject_type",
+    "subject_id",
+    "ip",
+    "details",
+)
+
+_PARTITION_NAME = re.compile(r"^audit_log_(\d{4})_(\d{2})$")
+
+
+def record(
+    event: str,
+    actor_id: int | None = None,
+    subject_type: str | None = None,
+    subject_id=None,
+    ip: str | None = None,
+    details: dict | None = None,
+):
+    """Queue an audit event, never blocks on the database"""
+    _writer.add(
+        (
+            datetime.utcnow(),
+            event,
+            actor_id,
+            subject_type,
+            None if subject_id is None else str(subject_id),
+            ip,
+            json.dumps(details) if details is not None else None,
+        )
+    )
+
+
+def _month_start(year: int, month: int) -> datetime:
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def ensure_partitions(cur, months_ahead: int = AUDIT_PARTITIONS_AHEAD) -> list[str]:
+    """Create the partitions from this month to months_ahead months ahead"""
+    now = datetime.utcnow()
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _month_start(now.year, now.month + offset)
+        end = _month_start(start.year, start.month + 1)
+        name = f"audit_log_{start.year:04d}_{start.month:02d}"
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF audit_log
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+            """
+        )
+        created.append(name)
+    return created
+
+
+def drop_old_partitions(cur, retention_months: int = AUDIT_RETENTION_MONTHS) -> list[str]:
+    """Drop partitions that end before the retention window starts"""
+    now = datetime.utcnow()
+    cutoff = _month_start(now.year, now.month - retention_months)
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_log'::regclass
+        """
+    )
+    dropped = []
+    for (name,) in cur.fetchall():
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            continue
+        end = _month_start(int(match.group(1)), int(match.group(2)) + 1)
+        if end <= cutoff:
+            cur.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def maintain_partitions() -> dict:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            created = ensure_partitions(cur)
+            dropped = drop_old_partitions(cur)
+            conn.commit()
+    if dropped:
+        print(f"Dropped audit partitions: {', '.join(dropped)}")
+    return {"ensured": created, "dropped": dropped}
+
+
+def _copy_batch(batch: list[tuple]):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            with cur.copy(
+                f"COPY audit_log ({', '.join(AUDIT_COLUMNS)}) FROM STDIN"
+            ) as copy:
+                for row in batch:
+                    copy.write_row(row)
+            conn.commit()
+
+
+def _write_batch(batch: list[tuple]):
+    try:
+        _copy_batch(batch)
+    except psycopg.errors.CheckViolation:
+        # No partition for these rows yet (first run, clock jump)
+        maintain_partitions()
+        _copy_batch(batch)
+
+
+# Also keeps the partitions maintained
+_writer = BatchWriter(
+    "audit-log",
+    _write_batch,
+    flush_seconds=AUDIT_FLUSH_SECONDS,
+    batch_size=AUDIT_BATCH_SIZE,
+    max_queue=AUDIT_MAX_QUEUE,
+    metric="audit_events",
+    tasks=[(AUDIT_MAINTENANCE_SECONDS, maintain_partitions)],
+)
+
+
+def flush() -> int:
+    """Write everything queued so far, return the number of events written"""
+    return _writer.flush()
+
+
+def query_audit_log(
+    since: datetime,
+    until: datetime,
+    event: str | None = None,
+    actor_id: int | None = None,
+    limit: int = 10000,
+):
+    """Audit rows in [since, until), newest first, read partition-pruned"""
+    conditions = ["occurred_at >= %s", "occurred_at < %s"]
+    params: list = [since, until]
+    if event is not None:
+        conditions.append("event = %s")
+        params.append(event)
+    if actor_id is not None:
+        conditions.append("actor_id = %s")
+        params.append(actor_id)
+    return stream_rows(
+        f"""
+        SELECT {', '.join(AUDIT_COLUMNS)}
+        FROM audit_log
+        WHERE {' AND '.join(conditions)}
+        ORDER BY occurred_at DESC
+        LIMIT %s
+        """,
+        (*params, limit),
+    )
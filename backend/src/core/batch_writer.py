@@ -0,0 +1,181 @@
+"""
+Batched background writes.
+
+A BatchWriter takes items from request handlers without touching the
+database: add() appends to an in-memory queue. A daemon thread, started on
+the first item (or by start()), drains the queue every flush_seconds, or as
+soon as batch_size items are waiting, and hands each batch to write_batch.
+A batch that fails goes back to the front of the queue for the next round.
+While the database is unreachable that repeats for as long as it takes.
+Any other error fails the same batch at most MAX_BATCH_RETRIES times. After
+that its items are written one at a time, and the items that still fail are
+dropped and counted in {metric}_failed_total, so one bad row cannot hold
+up everything queued behind it. Shutdown, and process exit for CLI
+commands, flush whatever is left.
+
+The queue is bounded in add(): past max_queue the oldest item is dropped
+and counted in {metric}_dropped_total. A re-queued batch may exceed the
+bound for a moment but is never silently cut. Written items are counted in
+{metric}_written_total.
+
+The thread can also run periodic tasks, as (interval_seconds, fn) pairs.
+A task that raises is retried on the next round.
+"""
+
+import asyncio
+import atexit
+import threading
+import time
+from collections import deque
+
+import psycopg
+import psycopg_pool
+
+from core import lifecycle, metrics
+
+# Failures of one batch, other than the database being unreachable, before
+# its items are written one by one
+MAX_BATCH_RETRIES = 3
+
+# The database is down or busy, nothing is wrong with the items
+TRANSIENT_ERRORS = (psycopg.OperationalError, psycopg_pool.PoolTimeout)
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        name: str,
+        write_batch,
+        flush_seconds: float,
+        batch_size: int,
+        max_queue: int,
+        metric: str,
+        tasks: list[tuple[float, object]] | None = None,
+    ):
+        self.name = name
+        self.write_batch = write_batch
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.metric = metric
+        self.tasks = tasks or []
+        self._queue: deque = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        # Serialises flushes between the thread and shutdown
+        self._flush_lock = threading.Lock()
+        # Failed attempts at the batch at the front of the queue
+        self._failures = 0
+        lifecycle.on_shutdown(self.shutdown)
+        atexit.register(self.stop)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def add(self, item):
+        """Queue an item, never blocks on the database"""
+        if len(self._queue) >= self.max_queue:
+            try:
+                self._queue.popleft()
+                metrics.increment(f"{self.metric}_dropped_total")
+            except IndexError:
+                # Drained by the thread meanwhile
+                pass
+        self._queue.append(item)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+        self.start()
+
+    def flush(self) -> int:
+        """Write everything queued so far, return the number of items written"""
+        written = 0
+        with self._flush_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    self.write_batch(batch)
+                except TRANSIENT_ERRORS as e:
+                    print(f"Error writing {self.name}, will retry: {e}")
+                    # Back to the front, in order, for the next flush
+                    self._queue.extendleft(reversed(batch))
+                    break
+                except Exception as e:
+                    self._failures += 1
+                    if self._failures < MAX_BATCH_RETRIES:
+                        print(f"Error writing {self.name}, will retry: {e}")
+                        self._queue.extendleft(reversed(batch))
+                        break
+                    print(f"Error writing {self.name}, writing items one by one: {e}")
+                    self._failures = 0
+                    isolated, stopped = self._write_one_by_one(batch)
+                    written += isolated
+                    if stopped:
+                        break
+                    continue
+                self._failures = 0
+                written += len(batch)
+        if written:
+            metrics.increment(f"{self.metric}_written_total", written)
+        return written
+
+    def _write_one_by_one(self, batch: list) -> tuple[int, bool]:
+        """
+        Write a failing batch item by item and drop the items that fail.
+        Returns the number written and whether the database went away, in
+        which case the rest is queued again.
+        """
+        written = 0
+        for i, item in enumerate(batch):
+            try:
+                self.write_batch([item])
+            except TRANSIENT_ERRORS as e:
+                print(f"Error writing {self.name}, will retry: {e}")
+                self._queue.extendleft(reversed(batch[i:]))
+                return written, True
+            except Exception as e:
+                print(f"Dropping {self.name} item that cannot be written: {e}")
+                metrics.increment(f"{self.metric}_failed_total")
+                continue
+            written += 1
+        return written, False
+
+    def _run(self):
+        last_run = [0.0] * len(self.tasks)
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            for i, (interval, fn) in enumerate(self.tasks):
+                if time.monotonic() - last_run[i] > interval:
+                    try:
+                        fn()
+                        last_run[i] = time.monotonic()
+                    except Exception as e:
+                        print(f"Error in {self.name} task {fn.__name__}: {e}")
+            self.flush()
+
+    def start(self):
+        """Start the background thread unless it runs already"""
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-writer", daemon=True
+                )
+                self._thread.start()
+
+    async def shutdown(self):
+        """stop() off the event loop, it joins the thread and writes"""
+        await asyncio.to_thread(self.stop)
+
+    def stop(self):
+        """Flush queued items and stop the thread"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds * 5)
+        self.flush()
@@ -1,9 +1,12 @@
 # Database connection parameters from environment variables
 import os
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 
 from dotenv import load_dotenv
 import psycopg
 import psycopg_pool
+from psycopg.rows import dict_row
 import atexit
 
 load_dotenv()
@@ -17,27 +20,101 @@ DB_PARAMS = {
     "port": os.getenv("DB_PORT", ""),
 }
 
+# Pool sizes per worker process, set by the launcher from the connection budget
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+ASYNC_POOL_MIN_SIZE = int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "1"))
+ASYNC_POOL_MAX_SIZE = int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "10"))
+
+# Statement timeout outside of requests (CLI, job workers), 0 for none.
+# Requests get per-route deadlines from core/deadlines.py
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Longest a request waits for a free pooled connection
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+# Deadline and checked out connections of the current request, set by
+# core.deadlines.QueryDeadlineMiddleware
+query_scope: ContextVar[dict | None] = ContextVar("query_scope", default=None)
+
 if "DB_CONNECTION_STRING" in os.environ:
-    _pool = psycopg_pool.ConnectionPool(os.environ["DB_CONNECTION_STRING"], open=False)
-    _pool_async = psycopg_pool.AsyncConnectionPool(
-        os.environ["DB_CONNECTION_STRING"], open=False
-    )
-    atexit.register(_pool.close)
-    atexit.register(_pool_async.close)
+    _conninfo = os.environ["DB_CONNECTION_STRING"]
 else:
-    _pool = psycopg_pool.ConnectionPool(
-        f"postgresql://{DB_PARAMS['user']}:{DB_PARAMS['password']}@{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}",
-        min_size=1,
-        max_size=10,
-        open=False,
-    )
+    _conninfo = f"postgresql://{DB_PARAMS['user']}:{DB_PARAMS['password']}@{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}"
+
+_pool = psycopg_pool.ConnectionPool(
+    _conninfo,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    open=False,
+)
+
+_pool_async = psycopg_pool.AsyncConnectionPool(
+    _conninfo,
+    min_size=ASYNC_POOL_MIN_SIZE,
+    max_size=ASYNC_POOL_MAX_SIZE,
+    open=False,
+)
 
-    _pool_async = psycopg_pool.AsyncConnectionPool(
-        f"postgresql://{DB_PARAMS['user']}:{DB_PARAMS['password']}@{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}",
-        min_size=1,
-        max_size=10,
-        open=False,
-    )
+atexit.register(_pool.close)
+
+
+def _scope_settings():
+    scope = query_scope.get()
+    timeout_ms = scope["timeout_ms"] if scope else DB_STATEMENT_TIMEOUT_MS
+    return scope, timeout_ms
+
+
+def flag_query_error(scope, error: Exception):
+    """Remember why a request's query failed, for the deadline middleware"""
+    if scope is None:
+        return
+    if isinstance(error, psycopg.errors.QueryCanceled):
+        scope["canceled"] = True
+    elif isinstance(error, psycopg_pool.PoolTimeout):
+        scope["pool_timeout"] = True
+
+
+@contextmanager
+def _connection():
+    scope, timeout_ms = _scope_settings()
+    try:
+        with _pool.connection(timeout=DB_POOL_TIMEOUT) as conn:
+            # Session setting, only sent when this connection's value differs
+            if getattr(conn, "_statement_timeout_ms", None) != timeout_ms:
+                conn.execute(f"SET statement_timeout = {int(timeout_ms)}")
+                conn.commit()
+                conn._statement_timeout_ms = timeout_ms  # type: ignore
+            if scope is not None:
+                scope["connections"].add(conn)
+            try:
+                yield conn
+            finally:
+                if scope is not None:
+                    scope["connections"].discard(conn)
+    except (psycopg.errors.QueryCanceled, psycopg_pool.PoolTimeout) as e:
+        flag_query_error(scope, e)
+        raise
+
+
+@asynccontextmanager
+async def _async_connection():
+    scope, timeout_ms = _scope_settings()
+    try:
+        async with _pool_async.connection(timeout=DB_POOL_TIMEOUT) as conn:
+            if getattr(conn, "_statement_timeout_ms", None) != timeout_ms:
+                await conn.execute(f"SET statement_timeout = {int(timeout_ms)}")
+                await conn.commit()
+                conn._statement_timeout_ms = timeout_ms  # type: ignore
+            if scope is not None:
+                scope["connections"].add(conn)
+            try:
+                yield conn
+            finally:
+                if scope is not None:
+                    scope["connections"].discard(conn)
+    except (psycopg.errors.QueryCanceled, psycopg_pool.PoolTimeout) as e:
+        flag_query_error(scope, e)
+        raise
 
 
 def get_db_connection():
@@ -45,7 +122,7 @@ def get_db_connection():
         _pool.open()
     """Create and return a database connection"""
     try:
-        return _pool.connection()
+        return _connection()
     except Exception as e:
         print(f"Error connecting to database: {e}")
         raise
@@ -56,7 +133,20 @@ async def get_async_db_connection():
         await _pool_async.open()
     """Create and return an asynchronous database connection"""
     try:
-        return _pool_async.connection()
+        return _async_connection()
     except Exception as e:
         print(f"Error connecting to database: {e}")
         raise
+
+
+def stream_rows(query: str, params: tuple = (), itersize: int = 1000):
+    """
+    Yield rows of a query as dicts through a server-side cursor, so at most
+    `itersize` rows are held in memory at a time
+    """
+    with get_db_connection() as conn:
+        with conn.cursor(name="stream_rows", row_factory=dict_row) as cur:
+            cur.itersize = itersize
+            cur.execute(query, params)  # type: ignore
+            for row in cur:
+                yield row
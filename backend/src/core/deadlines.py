@@ -0,0 +1,202 @@
+"""
+Per-route query deadlines and cancellation on client disconnect.
+
+QueryDeadlineMiddleware picks a statement timeout for each request from
+QUERY_TIMEOUTS_MS (longest matching path prefix) and hands it to the
+connection layer in core/database.py through a context variable, which
+applies it as the session statement_timeout on checkout. The connections a
+request has checked out are tracked, so when the client disconnects their
+running queries are cancelled server side and the connections go back to
+the pool straight away. Queries that hit their deadline become a 504, a pool
+that stays exhausted for DB_POOL_TIMEOUT a 503, and both are counted on
+/metrics.
+"""
+
+import asyncio
+import os
+
+import orjson
+import psycopg
+import psycopg_pool
+from dotenv import load_dotenv
+
+from core import metrics
+from core.database import query_scope
+
+load_dotenv()
+
+# Deadline for routes not listed below
+DB_REQUEST_TIMEOUT_MS = int(os.getenv("DB_REQUEST_TIMEOUT_MS", "5000"))
+
+# Statement timeout by path prefix, longest match wins, 0 for no limit.
+# Login and session checks are kept tight so a slow query can never hold
+# the connections they need for long.
+QUERY_TIMEOUTS_MS = {
+    "/api/auth": 2000,
+    "/api/users/me": 1000,
+    "/api/search": 1000,
+    "/api/users/upload-clients": 60000,
+    "/api/documents/upload-document": 60000,
+    # Streams for as long as the table takes, each COPY is one statement
+    "/api/exports": 0,
+}
+
+# Extra or changed deadlines as "prefix=ms,prefix=ms"
+for item in filter(None, os.getenv("QUERY_TIMEOUTS_MS", "").split(",")):
+    prefix, _, ms = item.partition("=")
+    QUERY_TIMEOUTS_MS[prefix.strip()] = int(ms)
+
+
+def route_timeout_ms(path: str) -> int:
+    matches = [p for p in QUERY_TIMEOUTS_MS if path.startswith(p)]
+    if not matches:
+        return DB_REQUEST_TIMEOUT_MS
+    return QUERY_TIMEOUTS_MS[max(matches, key=len)]
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope["path"]
+
+
+async def _cancel(connection):
+    if hasattr(connection, "cancel_safe") and asyncio.iscoroutinefunction(
+        connection.cancel_safe
+    ):
+        await connection.cancel_safe()
+    else:
+        # Sync connections are in use on a worker thread, cancelling is a
+        # separate request to the server and safe from here
+        await asyncio.to_thread(connection.cancel_safe)
+
+
+async def _error_response(send, status: int, detail: str, headers=()):
+    body = orjson.dumps({"detail": detail})
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class QueryDeadlineMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = {
+            "timeout_ms": route_timeout_ms(scope["path"]),
+            "connections": set(),
+            "canceled": False,
+            "pool_timeout": False,
+        }
+        token = query_scope.set(state)
+
+        headers = dict(scope.get("headers") or [])
+        has_body = b"transfer-encoding" in headers or headers.get(
+            b"content-length", b"0"
+        ) not in (b"", b"0")
+        body_done = asyncio.Event()
+        disconnected = asyncio.Event()
+        if not has_body:
+            body_done.set()
+        app_got_request = False
+
+        async def app_receive():
+            # Once the body is read the watcher owns receive(), and the app
+            # only ever hears about the disconnect
+            nonlocal app_got_request
+            if body_done.is_set():
+                if not app_got_request:
+                    app_got_request = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            app_got_request = True
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                body_done.set()
+            elif not message.get("more_body", False):
+                body_done.set()
+            return message
+
+        async def watch_disconnect():
+            await body_done.wait()
+            while not disconnected.is_set():
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+            if response_complete:
+                return
+            active = list(state["connections"])
+            if active:
+                metrics.increment(
+                    "db_query_cancellations_total", route=_route_label(scope)
+                )
+            for connection in active:
+                try:
+                    await _cancel(connection)
+                except Exception as e:
+                    print(f"Failed to cancel query after disconnect: {e}")
+
+        response_started = False
+        response_complete = False
+        replaced = False
+
+        async def send_replacement() -> bool:
+            """Answer with 504/503 if a deadline or the pool caused the failure"""
+            nonlocal replaced
+            route = _route_label(scope)
+            if state["canceled"] and not disconnected.is_set():
+                replaced = True
+                metrics.increment("db_query_timeouts_total", route=route)
+                await _error_response(send, 504, "Database query timed out")
+                return True
+            if state["pool_timeout"]:
+                replaced = True
+                metrics.increment("db_pool_timeouts_total", route=route)
+                await _error_response(
+                    send, 503, "Database is busy, try again", [(b"retry-after", b"1")]
+                )
+                return True
+            return False
+
+        async def deadline_send(message):
+            nonlocal response_started, response_complete
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                # Endpoints wrap errors in a generic 500, the flags say why
+                if message["status"] >= 500 and await send_replacement():
+                    return
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await self.app(scope, app_receive, deadline_send)
+        except (psycopg.errors.QueryCanceled, psycopg_pool.PoolTimeout):
+            if response_started or disconnected.is_set():
+                raise
+            if not await send_replacement():
+                raise
+        finally:
+            response_complete = True
+            watcher.cancel()
+            query_scope.reset(token)
@@ -0,0 +1,436 @@
+"""
+Postgres-backed background job queue.
+
+Jobs are rows in `jobs`. Workers claim due jobs with FOR UPDATE SKIP LOCKED,
+so any number of workers (inside uvicorn or `python -m cli worker`) can poll
+the same table without blocking each other. Each job type has a global
+concurrency limit, enforced under a per-type advisory lock at claim time.
+Failed jobs are retried with exponential backoff and jitter until
+max_attempts, and running jobs whose worker stopped heartbeating are put
+back in the queue.
+
+Handlers are plain (blocking) functions registered with @job_handler and
+run in a thread:
+
+    @job_handler("delete_users", concurrency=1)
+    def delete_users(job: dict, progress) -> dict:
+        ...
+        progress(done, total)
+        return {"deleted": n}
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from core.database import get_db_connection
+from core.singleflight import invalidate
+
+load_dotenv()
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+# A running job without a heartbeat for this long is considered abandoned
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_BACKOFF_BASE_SECONDS = float(os.getenv("JOB_BACKOFF_BASE_SECONDS", "5"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "900"))
+# Unclaimed result["secrets"] are deleted this long after the job finished
+JOB_SECRETS_TTL_SECONDS = float(os.getenv("JOB_SECRETS_TTL_SECONDS", "900"))
+# How long stop() waits for running jobs before leaving them to be requeued
+JOB_STOP_TIMEOUT_SECONDS = float(os.getenv("JOB_STOP_TIMEOUT_SECONDS", "20"))
+
+# job_type -> {"fn", "concurrency", "max_attempts"}
+_handlers = {}
+
+
+def _changed():
+    """Stop sharing job reads of this process that started before a write"""
+    invalidate("jobs")
+    invalidate("job")
+
+
+def job_handler(job_type: str, concurrency: int = 1, max_attempts: int = 5):
+    """Register a handler for job_type with a global concurrency limit"""
+
+    def register(fn):
+        _handlers[job_type] = {
+            "fn": fn,
+            "concurrency": concurrency,
+            "max_attempts": max_attempts,
+        }
+        return fn
+
+    return register
+
+
+def enqueue(
+    job_type: str,
+    payload: dict,
+    created_by: int | None = None,
+    progress_total: int | None = None,
+) -> int:
+    """Queue a job and return its id"""
+    max_attempts = _handlers.get(job_type, {}).get("max_attempts", 5)
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO jobs
+                    (job_type, payload, max_attempts, created_by, progress_total)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+                """,
+                (
+                    job_type,
+                    json.dumps(payload),
+                    max_attempts,
+                    created_by,
+                    progress_total,
+                ),
+            )
+            job_id = cur.fetchone()[0]  # type: ignore
+            conn.commit()
+    _changed()
+    return job_id
+
+
+JOB_COLUMNS = """
+    id, job_type, status, attempts, max_attempts, run_at, progress_done,
+    progress_total, result, error, created_by, created_at, finished_at
+"""
+
+
+def _job_row(row) -> dict:
+    keys = [c.strip() for c in JOB_COLUMNS.split(",")]
+    return dict(zip(keys, row))
+
+
+def get_job(job_id: int) -> dict | None:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+            row = cur.fetchone()
+    return _job_row(row) if row else None
+
+
+def take_job_secrets(job_id: int) -> dict | None:
+    """
+    Return and remove result["secrets"] (e.g. generated passwords), so they
+    are handed out once. Secrets nobody takes are removed by scrub_secrets.
+    """
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs j
+                SET result = j.result - 'secrets'
+                FROM (
+                    SELECT id, result -> 'secrets' AS secrets
+                    FROM jobs
+                    WHERE id = %s
+                    FOR UPDATE
+                ) old
+                WHERE j.id = old.id AND old.secrets IS NOT NULL
+                RETURNING old.secrets
+                """,
+                (job_id,),
+            )
+            row = cur.fetchone()
+            conn.commit()
+    if row:
+        _changed()
+    return row[0] if row else None
+
+
+def scrub_secrets() -> int:
+    """Remove result["secrets"] of jobs finished over JOB_SECRETS_TTL_SECONDS ago"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET result = result - 'secrets'
+                WHERE result ? 'secrets'
+                  AND finished_at < now() - make_interval(secs => %s)
+                """,
+                (JOB_SECRETS_TTL_SECONDS,),
+            )
+            count = cur.rowcount
+            conn.commit()
+    if count:
+        _changed()
+    return count
+
+
+def list_jobs(created_by: int, limit: int = 50) -> list[dict]:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT {JOB_COLUMNS} FROM jobs
+                WHERE created_by = %s
+                ORDER BY id DESC
+                LIMIT %s
+                """,
+                (created_by, limit),
+            )
+            jobs = [_job_row(row) for row in cur.fetchall()]
+    for job in jobs:
+        # Only take_job_secrets hands them out
+        if job["result"]:
+            job["result"].pop("secrets", None)
+    return jobs
+
+
+def _claim(job_type: str, concurrency: int, worker_id: str) -> dict | None:
+    """Claim one due job of job_type if fewer than `concurrency` are running"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            # Serialises claims per type so the running count cannot race
+            cur.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('jobs:' || %s))", (job_type,)
+            )
+            cur.execute(
+                "SELECT count(*) FROM jobs WHERE job_type = %s AND status = 'running'",
+                (job_type,),
+            )
+            if cur.fetchone()[0] >= concurrency:  # type: ignore
+                conn.commit()
+                return None
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'running', locked_by = %s, heartbeat_at = now(),
+                    attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE job_type = %s AND status = 'queued' AND run_at <= now()
+                    ORDER BY run_at, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, job_type, payload, attempts, max_attempts, created_by
+                """,
+                (worker_id, job_type),
+            )
+            row = cur.fetchone()
+            conn.commit()
+    if not row:
+        return None
+    _changed()
+    return {
+        "id": row[0],
+        "job_type": row[1],
+        "payload": row[2],
+        "attempts": row[3],
+        "max_attempts": row[4],
+        "created_by": row[5],
+    }
+
+
+def _finish(job: dict, result: dict):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'succeeded', result = %s, error = NULL,
+                    locked_by = NULL, finished_at = now()
+                WHERE id = %s
+                """,
+                (json.dumps(result), job["id"]),
+            )
+            conn.commit()
+    _changed()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff, jittered over the upper half of the window"""
+    ceiling = min(
+        JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)
+    )
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def _fail(job: dict, error: str):
+    retry = job["attempts"] < job["max_attempts"]
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = %s, error = %s, locked_by = NULL, run_at = %s,
+                    finished_at = CASE WHEN %s THEN NULL ELSE now() END
+                WHERE id = %s
+                """,
+                (
+                    "queued" if retry else "failed",
+                    error,
+                    datetime.utcnow()
+                    + timedelta(seconds=backoff_seconds(job["attempts"])),
+                    not retry,
+                    job["id"],
+                ),
+            )
+            conn.commit()
+    _changed()
+
+
+def _progress_reporter(job_id: int):
+    """progress(done, total) callback handed to handlers, also a heartbeat"""
+
+    def progress(done: int, total: int | None = None):
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE jobs
+                    SET progress_done = %s,
+                        progress_total = coalesce(%s, progress_total),
+                        heartbeat_at = now()
+                    WHERE id = %s
+                    """,
+                    (done, total, job_id),
+                )
+                conn.commit()
+        _changed()
+
+    return progress
+
+
+def _touch(job_id: int):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE jobs SET heartbeat_at = now() WHERE id = %s", (job_id,)
+            )
+            conn.commit()
+
+
+def requeue_abandoned() -> int:
+    """Put running jobs whose worker stopped heartbeating back in the queue"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    error = 'Worker stopped heartbeating',
+                    locked_by = NULL,
+                    finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END
+                WHERE status = 'running'
+                  AND heartbeat_at < now() - make_interval(secs => %s)
+                """,
+                (JOB_LEASE_SECONDS,),
+            )
+            count = cur.rowcount
+            conn.commit()
+    if count:
+        _changed()
+    return count
+
+
+def _heartbeat(job_id: int, done: threading.Event):
+    """Keep the lease of a long job that does not report progress"""
+    while not done.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            _touch(job_id)
+        except Exception as e:
+            print(f"Error heartbeating job {job_id}: {e}")
+
+
+def _execute(job: dict):
+    """
+    Run a job's handler and record the outcome, in a worker thread. The
+    lease is kept until the handler returns, even when the worker has
+    stopped waiting for it, so a running job is never requeued.
+    """
+    handler = _handlers[job["job_type"]]
+    done = threading.Event()
+    threading.Thread(
+        target=_heartbeat,
+        args=(job["id"], done),
+        name=f"job-{job['id']}-heartbeat",
+        daemon=True,
+    ).start()
+    try:
+        result = handler["fn"](job, _progress_reporter(job["id"]))
+        _finish(job, result or {})
+    except Exception as e:
+        print(f"Job {job['id']} ({job['job_type']}) failed: {e}")
+        _fail(job, f"{e}\n{traceback.format_exc(limit=5)}")
+    finally:
+        done.set()
+
+
+class JobWorker:
+    """Polls for jobs of every registered type and runs them in threads"""
+
+    def __init__(self, job_types: list[str] | None = None):
+        self.job_types = job_types or list(_handlers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.running: dict[str, set] = {t: set() for t in self.job_types}
+        self.stopping = False
+
+    async def _run_job(self, job: dict):
+        await asyncio.to_thread(_execute, job)
+
+    async def _poll_once(self) -> bool:
+        claimed = False
+        for job_type in self.job_types:
+            limit = _handlers[job_type]["concurrency"]
+            if len(self.running[job_type]) >= limit:
+                continue
+            job = await asyncio.to_thread(_claim, job_type, limit, self.worker_id)
+            if job is None:
+                continue
+            claimed = True
+            task = asyncio.create_task(self._run_job(job))
+            self.running[job_type].add(task)
+            task.add_done_callback(self.running[job_type].discard)
+        return claimed
+
+    async def run(self):
+        print(f"Job worker {self.worker_id} handling: {', '.join(self.job_types)}")
+        last_reap = 0.0
+        loop = asyncio.get_running_loop()
+        while not self.stopping:
+            try:
+                if loop.time() - last_reap > JOB_LEASE_SECONDS:
+                    await asyncio.to_thread(requeue_abandoned)
+                    await asyncio.to_thread(scrub_secrets)
+                    last_reap = loop.time()
+                # Keep claiming while there is work, sleep once the queue is dry
+                if not await self._poll_once():
+                    await asyncio.sleep(JOB_POLL_SECONDS)
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def stop(self, timeout: float = JOB_STOP_TIMEOUT_SECONDS):
+        """
+        Stop claiming and wait up to timeout for running jobs to finish.
+        Jobs still running after that are no longer waited for here, but
+        their threads keep the lease and record the outcome; process exit
+        waits for them. Only a killed process leaves jobs to
+        requeue_abandoned.
+        """
+        self.stopping = True
+        tasks = [t for running in self.running.values() for t in running]
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(
+                f"Job worker {self.worker_id} stopped waiting for {len(pending)} "
+                "running jobs, they finish in the background"
+            )
@@ -0,0 +1,189 @@
+"""
+Process lifecycle: pool warm-up, readiness and graceful draining.
+
+Startup opens the connection pools to min_size and runs the registered
+warm-up hooks before the worker reports ready on /readyz. On SIGTERM the
+worker stops being ready, refuses new requests and WebSockets with 503/1012,
+and only hands the signal on to uvicorn once in-flight requests and chat
+streams have finished or DRAIN_TIMEOUT has passed. Shutdown hooks (buffered
+writers etc.) run before the pools are closed.
+"""
+
+import asyncio
+import inspect
+import os
+import signal
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from core.database import _pool, _pool_async
+
+load_dotenv()
+
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+POOL_WARMUP_TIMEOUT = float(os.getenv("POOL_WARMUP_TIMEOUT", "30"))
+
+# Probe and metrics routes are served while draining and are not counted as in-flight
+PROBE_PATHS = {"/healthz", "/readyz", "/metrics"}
+
+_warm_up_hooks = []
+_shutdown_hooks = []
+
+state = {
+    "ready": False,
+    "draining": False,
+    "in_flight": 0,
+    "started_at": time.time(),
+}
+
+_idle = asyncio.Event()
+_idle.set()
+
+
+def on_warm_up(fn):
+    """Register a (sync or async) callable to run before reporting ready"""
+    _warm_up_hooks.append(fn)
+    return fn
+
+
+def on_shutdown(fn):
+    """Register a (sync or async) callable to run after draining, before the pools close"""
+    _shutdown_hooks.append(fn)
+    return fn
+
+
+async def _run_hook(fn):
+    result = fn()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def warm_up():
+    """Open pools to min_size and run warm-up hooks, then report ready"""
+    started = time.perf_counter()
+    _pool.open(wait=True, timeout=POOL_WARMUP_TIMEOUT)
+    await _pool_async.open(wait=True, timeout=POOL_WARMUP_TIMEOUT)
+
+    for fn in _warm_up_hooks:
+        await _run_hook(fn)
+
+    state["ready"] = True
+    print(
+        f"Worker {os.getpid()} ready in {(time.perf_counter() - started) * 1000:.0f}ms "
+        f"(pool min_size={_pool.min_size}, async min_size={_pool_async.min_size})"
+    )
+
+
+async def wait_for_drain(timeout: float = DRAIN_TIMEOUT) -> bool:
+    """Wait until nothing is in flight, return False if the deadline passed"""
+    try:
+        await asyncio.wait_for(_idle.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        print(
+            f"Drain deadline of {timeout:.0f}s passed with "
+            f"{state['in_flight']} requests still in flight"
+        )
+        return False
+
+
+async def shutdown():
+    """Run shutdown hooks (flush buffered writes) and close the pools"""
+    state["ready"] = False
+    for fn in _shutdown_hooks:
+        try:
+            await _run_hook(fn)
+        except Exception as e:
+            print(f"Error in shutdown hook {getattr(fn, '__name__', fn)}: {e}")
+    await _pool_async.close()
+    _pool.close()
+
+
+def begin_drain():
+    state["draining"] = True
+    state["ready"] = False
+
+
+def install_signal_handlers():
+    """
+    Chain in front of uvicorn's SIGTERM/SIGINT handlers. The first signal
+    starts draining and forwards it once in-flight work is done; a second
+    signal is forwarded straight away.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Signals can only be handled on the main thread (e.g. not under TestClient)
+        return
+
+    loop = asyncio.get_running_loop()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame, previous=previous):
+            def forward():
+                if callable(previous):
+                    previous(signum, frame)
+
+            if state["draining"]:
+                forward()
+                return
+
+            print(f"Worker {os.getpid()} draining, received signal {signum}")
+            begin_drain()
+
+            async def drain_then_forward():
+                await wait_for_drain()
+                forward()
+
+            loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(drain_then_forward())
+            )
+
+        signal.signal(sig, handler)
+
+
+class LifecycleMiddleware:
+    """Count in-flight requests and refuse new work while draining"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope["path"] in PROBE_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if state["draining"]:
+            if scope["type"] == "websocket":
+                # 1012: service restart, clients should reconnect elsewhere
+                await send({"type": "websocket.close", "code": 1012})
+            else:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 503,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"connection", b"close"),
+                            (b"retry-after", b"1"),
+                        ],
+                    }
+                )
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": b'{"detail":"Server is shutting down"}',
+                    }
+                )
+            return
+
+        state["in_flight"] += 1
+        _idle.clear()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            state["in_flight"] -= 1
+            if state["in_flight"] == 0:
+                _idle.set()
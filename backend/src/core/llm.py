@@ -0,0 +1,301 @@
+"""
+Shared upstream LLM client.
+
+Each worker process holds one AsyncAnthropic client, created at warm-up and
+closed at shutdown. Its keep-alive connection pool is reused by every chat
+request, so turns do not pay a fresh TLS handshake.
+
+Calls go through three layers:
+
+- Retries: overload, rate-limit, 5xx and connection errors are retried up
+  to LLM_MAX_RETRIES times with full-jitter exponential backoff, honouring
+  retry-after. The SDK's own retries are off.
+- Hedging: with LLM_HEDGE_AFTER_MS set, a stream that has not produced its
+  first token by then gets a second, identical request. The first to
+  produce a token wins and the other is cancelled.
+- Circuit breaker: after LLM_BREAKER_FAILURES consecutive upstream failures
+  calls fail fast with LLMUnavailable for LLM_BREAKER_OPEN_SECONDS, then a
+  single probe decides whether to close again.
+
+/metrics shows llm_circuit_state (0 closed, 1 half open, 2 open) and
+counters for requests, retries, hedges and breaker trips. Point
+LLM_BASE_URL at a local stub server to exercise all of this without the
+real API.
+"""
+
+import asyncio
+import os
+import random
+import time
+
+import anthropic
+from dotenv import load_dotenv
+
+from core import lifecycle, metrics
+
+load_dotenv()
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+LLM_MODEL = os.getenv("LLM_MODEL", "claude-3-7-sonnet-latest")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# Start a second stream if the first token takes longer, 0 to never hedge
+LLM_HEDGE_AFTER_MS = int(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# 529 is Anthropic's "overloaded"
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504, 529)
+# Error types the API reports inside an already started stream
+RETRY_ERROR_TYPES = ("overloaded_error", "rate_limit_error", "api_error")
+
+_client: anthropic.AsyncAnthropic | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+class LLMUnavailable(Exception):
+    """The client is not started or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failures: int, open_seconds: float):
+        self.failures = failures
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._publish()
+
+    def _publish(self):
+        metrics.gauge("llm_circuit_state", self.STATES[self.state])
+
+    def _set(self, state: str):
+        if state != self.state:
+            print(f"LLM circuit breaker {self.state} -> {state}")
+            self.state = state
+            self._publish()
+
+    def before_call(self):
+        """Raise LLMUnavailable if calls should fail fast right now"""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                raise LLMUnavailable("Upstream model is unavailable, try again shortly")
+            self._set("half_open")
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                raise LLMUnavailable("Upstream model is recovering, try again shortly")
+            self._probing = True
+
+    def record_success(self):
+        self._consecutive = 0
+        self._probing = False
+        self._set("closed")
+
+    def record_cancelled(self):
+        """The caller went away mid-call, which says nothing about upstream"""
+        self._probing = False
+
+    def record_failure(self):
+        self._consecutive += 1
+        self._probing = False
+        if self.state == "half_open" or self._consecutive >= self.failures:
+            if self.state != "open":
+                metrics.increment("llm_circuit_opened_total")
+            self._opened_at = time.monotonic()
+            self._set("open")
+
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_OPEN_SECONDS)
+
+
+def llm_enabled() -> bool:
+    return bool(os.getenv("ANTHROPIC_API_KEY") or LLM_BASE_URL)
+
+
+@lifecycle.on_warm_up
+async def start_client():
+    """Create this process's client, bound to the running event loop"""
+    global _client, _loop
+    if _client is not None or not llm_enabled():
+        return
+    # Built from the SDK's own types, whichever HTTP library it ships with
+    limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+    )
+    _client = anthropic.AsyncAnthropic(
+        base_url=LLM_BASE_URL or None,
+        max_retries=0,
+        timeout=anthropic.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        http_client=anthropic.DefaultAsyncHttpxClient(limits=limits),
+    )
+    _loop = asyncio.get_running_loop()
+
+
+@lifecycle.on_shutdown
+async def stop_client():
+    global _client, _loop
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _loop = None
+
+
+def get_client() -> anthropic.AsyncAnthropic:
+    if _client is None:
+        raise LLMUnavailable("LLM client is not configured in this process")
+    return _client
+
+
+def run_sync(coro_fn, *args, **kwargs):
+    """
+    Run a coroutine function on the client's event loop from a worker thread
+    (job handlers) and wait for the result
+    """
+    if _loop is None:
+        raise LLMUnavailable("LLM client is not configured in this process")
+    return asyncio.run_coroutine_threadsafe(coro_fn(*args, **kwargs), _loop).result()
+
+
+def _retryable(e: BaseException) -> bool:
+    if isinstance(e, anthropic.APIConnectionError):
+        return True
+    if isinstance(e, anthropic.APIStatusError):
+        if e.status_code in RETRY_STATUSES:
+            return True
+        body = e.body if isinstance(e.body, dict) else {}
+        error = body.get("error") if isinstance(body.get("error"), dict) else body
+        return error.get("type") in RETRY_ERROR_TYPES
+    return False
+
+
+def _retry_delay(attempt: int, e: BaseException) -> float:
+    delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2**attempt))
+    response = getattr(e, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), LLM_RETRY_MAX_SECONDS))
+        except ValueError:
+            pass
+    return delay
+
+
+async def _call(attempt_fn, kind: str):
+    """Run attempt_fn under the breaker, retrying transient upstream errors"""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            breaker.before_call()
+        except LLMUnavailable:
+            metrics.increment("llm_requests_total", kind=kind, outcome="circuit_open")
+            raise
+        try:
+            result = await attempt_fn()
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        except Exception as e:
+            if not _retryable(e):
+                # Upstream answered, the request itself was bad
+                breaker.record_success()
+                metrics.increment("llm_requests_total", kind=kind, outcome="error")
+                raise
+            breaker.record_failure()
+            if attempt == LLM_MAX_RETRIES or breaker.state == "open":
+                metrics.increment("llm_requests_total", kind=kind, outcome="failed")
+                raise
+            metrics.increment("llm_retries_total", kind=kind)
+            await asyncio.sleep(_retry_delay(attempt, e))
+            continue
+        breaker.record_success()
+        metrics.increment("llm_requests_total", kind=kind, outcome="ok")
+        return result
+
+
+async def create_message(**kwargs):
+    """messages.create with retries and circuit breaking"""
+    kwargs.setdefault("model", LLM_MODEL)
+    return await _call(lambda: get_client().messages.create(**kwargs), "message")
+
+
+async def _open_stream(kwargs: dict):
+    """Start a stream and read up to its first token"""
+    stream = await get_client().messages.create(stream=True, **kwargs)
+    events = stream.__aiter__()
+    head = []
+    try:
+        async for event in events:
+            head.append(event)
+            if event.type in ("content_block_delta", "message_stop"):
+                break
+    except BaseException:
+        await stream.close()
+        raise
+    return stream, events, head
+
+
+async def _close_opened(task: asyncio.Task):
+    if task.done() and not task.cancelled() and task.exception() is None:
+        await task.result()[0].close()
+
+
+async def _open_hedged(kwargs: dict):
+    if not LLM_HEDGE_AFTER_MS or breaker.state != "closed":
+        return await _open_stream(kwargs)
+
+    first = asyncio.create_task(_open_stream(kwargs))
+    done, _ = await asyncio.wait({first}, timeout=LLM_HEDGE_AFTER_MS / 1000)
+    if done:
+        return first.result()
+
+    metrics.increment("llm_hedges_total")
+    hedge = asyncio.create_task(_open_stream(kwargs))
+    pending = {first, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.increment(
+                        "llm_hedge_wins_total", winner="hedge" if task is hedge else "first"
+                    )
+                    for other in done - {task}:
+                        await _close_opened(other)
+                    return task.result()
+                error = task.exception()
+        raise error  # type: ignore
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def stream_text(**kwargs):
+    """
+    Yield the text of a streamed reply. Retries and hedging only apply until
+    the first token; once text has been sent on, errors are raised as is.
+    """
+    kwargs.setdefault("model", LLM_MODEL)
+    stream, events, head = await _call(lambda: _open_hedged(kwargs), "stream")
+    try:
+        for event in head:
+            if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                yield event.delta.text
+        async for event in events:
+            if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                yield event.delta.text
+    finally:
+        await stream.close()
@@ -0,0 +1,41 @@
+"""
+Process-local counters and gauges in the Prometheus text format, served on
+/metrics.
+
+Each uvicorn worker counts on its own, so scrape every worker (or sum over
+the instance label) for totals.
+"""
+
+import threading
+from collections import defaultdict
+
+_counters: dict[str, float] = defaultdict(float)
+_lock = threading.Lock()
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(
+        f'{label}="{str(value).replace(chr(34), chr(39))}"'
+        for label, value in sorted(labels.items())
+    )
+    return f"{name}{{{rendered}}}"
+
+
+def increment(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += amount
+
+
+def gauge(name: str, value: float, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = value
+
+
+def render() -> str:
+    with _lock:
+        items = sorted(_counters.items())
+    return "".join(f"{key} {value:g}\n" for key, value in items)
@@ -0,0 +1,40 @@
+"""
+Plain SQL migrations.
+
+Files in src/migrations are applied in name order and recorded in
+schema_migrations, so each one runs once per database. Run them with
+`python -m cli migrate`.
+"""
+
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+
+def apply_migrations(conn) -> list[str]:
+    """Apply pending migrations on conn, return the names applied"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """
+        )
+        cur.execute("SELECT name FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+        conn.commit()
+
+    new = []
+    for migration in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        if migration.name in applied:
+            continue
+        with conn.cursor() as cur:
+            cur.execute(migration.read_text())
+            cur.execute(
+                "INSERT INTO schema_migrations (name) VALUES (%s)", (migration.name,)
+            )
+        conn.commit()
+        new.append(migration.name)
+    return new
@@ -0,0 +1,143 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+A background thread samples the stack of the event loop thread while a
+profiled request is in flight. When a request takes longer than
+PROFILE_SLOW_MS, its samples are written in collapsed-stack format
+("frame;frame;frame count" per line), which flamegraph.pl and speedscope
+read directly.
+
+Enable for every request with PROFILE_REQUESTS=1, or per request by sending
+the X-Profile-Token header with the value of PROFILE_TOKEN (only admins
+should know it). Samples of other requests interleaved on the same event
+loop are included, so profile under the load you want to explain.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "../profiles"))
+
+PROFILE_HEADER = b"x-profile-token"
+
+
+def profiling_enabled() -> bool:
+    return PROFILE_REQUESTS or bool(PROFILE_TOKEN)
+
+
+class StackSampler:
+    """Samples one thread's stack and hands each sample to active collectors"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.collectors: set[int] = set()
+        self.samples: dict[int, Counter] = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start_collecting(self, key: int):
+        with self.lock:
+            self.collectors.add(key)
+            self.samples[key] = Counter()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self.thread.start()
+
+    def stop_collecting(self, key: int) -> Counter:
+        with self.lock:
+            self.collectors.discard(key)
+            return self.samples.pop(key, Counter())
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.collectors:
+                    # Exit when idle, the next request restarts the thread
+                    self.thread = None
+                    return
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                collapsed = ";".join(reversed(stack))
+                with self.lock:
+                    for key in self.collectors:
+                        self.samples[key][collapsed] += 1
+            time.sleep(self.interval)
+
+
+def write_collapsed(samples: Counter, method: str, path: str, elapsed_ms: float) -> Path:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    safe_path = path.strip("/").replace("/", "_") or "root"
+    profile_file = PROFILE_DIR / f"{timestamp}_{method}_{safe_path}_{elapsed_ms:.0f}ms.folded"
+    with open(profile_file, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return profile_file
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests and dumps the slow ones"""
+
+    def __init__(self, app):
+        self.app = app
+        self.sampler = None
+
+    def _should_profile(self, scope) -> bool:
+        if PROFILE_REQUESTS:
+            return True
+        if not PROFILE_TOKEN:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER:
+                return value.decode() == PROFILE_TOKEN
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if self.sampler is None:
+            self.sampler = StackSampler(
+                threading.get_ident(), PROFILE_INTERVAL_MS / 1000
+            )
+
+        key = id(scope)
+        start = time.perf_counter()
+        self.sampler.start_collecting(key)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            samples = self.sampler.stop_collecting(key)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= PROFILE_SLOW_MS and samples:
+                profile_file = write_collapsed(
+                    samples, scope["method"], scope["path"], elapsed_ms
+                )
+                print(
+                    f"Slow request {scope['method']} {scope['path']} "
+                    f"took {elapsed_ms:.0f}ms, profile written to {profile_file}"
+                )
@@ -0,0 +1,206 @@
+"""
+Event fan-out for live views.
+
+publish() sends an event once and every subscriber of its topics receives
+it, in whichever worker they are connected. With PUBSUB_BACKEND=postgres
+(the default) events travel through NOTIFY on PUBSUB_CHANNEL: each worker
+keeps one LISTEN connection and hands events to its local subscribers.
+PUBSUB_BACKEND=local keeps events inside the process, for a single worker
+or development without a database.
+
+Each subscriber has a queue of PUBSUB_QUEUE_SIZE events. A subscriber that
+falls that far behind is dropped: its queue is replaced by a single
+{"type": "resync"} event and nothing more is delivered, so the consumer
+reloads its state and subscribes again. Memory stays bounded however slow
+the consumer. Everyone gets the same marker after the LISTEN connection had
+to reconnect and events may have been missed.
+"""
+
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+import psycopg
+from dotenv import load_dotenv
+
+from core import lifecycle, metrics
+from core.database import _conninfo, get_async_db_connection, get_db_connection
+
+load_dotenv()
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "postgres")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "live_events")
+PUBSUB_QUEUE_SIZE = int(os.getenv("PUBSUB_QUEUE_SIZE", "256"))
+PUBSUB_RECONNECT_MAX_SECONDS = 30
+
+# NOTIFY payloads must stay below 8000 bytes
+NOTIFY_MAX_BYTES = 7900
+
+RESYNC = {"type": "resync"}
+
+_subscribers: dict[str, set["Subscription"]] = defaultdict(set)
+_listener: asyncio.Task | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+class Subscription:
+    """A bounded queue of events for one consumer"""
+
+    def __init__(self, topics: tuple[str, ...]):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=PUBSUB_QUEUE_SIZE)
+        self.dropped = False
+
+    def _deliver(self, event: dict):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.drop()
+
+    def drop(self):
+        """Discard queued events and leave only the resync marker"""
+        if self.dropped:
+            return
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+        metrics.increment("pubsub_dropped_subscribers_total")
+
+    async def get(self, timeout: float | None = None) -> dict:
+        """The next event, raises TimeoutError if none arrives in time"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        unsubscribe(self)
+
+
+def subscribe(*topics: str) -> Subscription:
+    subscription = Subscription(topics)
+    for topic in topics:
+        _subscribers[topic].add(subscription)
+    metrics.gauge("pubsub_subscribers", subscriber_count())
+    return subscription
+
+
+def unsubscribe(subscription: Subscription):
+    for topic in subscription.topics:
+        subscribers = _subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _subscribers[topic]
+    metrics.gauge("pubsub_subscribers", subscriber_count())
+
+
+def subscriber_count() -> int:
+    return len({s for subscribers in _subscribers.values() for s in subscribers})
+
+
+def _dispatch(message: dict):
+    """Deliver a published message to this process's subscribers, once each"""
+    delivered = set()
+    for topic in message["topics"]:
+        for subscription in list(_subscribers.get(topic, ())):
+            if subscription not in delivered:
+                delivered.add(subscription)
+                subscription._deliver(message["event"])
+
+
+def _resync_all():
+    for subscribers in list(_subscribers.values()):
+        for subscription in list(subscribers):
+            subscription.drop()
+
+
+def _payload(topics: list[str], event: dict) -> str:
+    payload = json.dumps({"topics": topics, "event": event}, default=str)
+    if len(payload.encode()) > NOTIFY_MAX_BYTES:
+        # Too big for NOTIFY, subscribers reload instead
+        metrics.increment("pubsub_oversized_events_total")
+        payload = json.dumps(
+            {"topics": topics, "event": {**RESYNC, "reason": "event too large"}}
+        )
+    return payload
+
+
+async def publish(topics: list[str], event: dict):
+    """Send an event to the subscribers of any of topics"""
+    metrics.increment("pubsub_published_total")
+    if PUBSUB_BACKEND == "local":
+        _dispatch({"topics": topics, "event": event})
+        return
+    async with await get_async_db_connection() as conn:  # type: ignore
+        await conn.execute(
+            "SELECT pg_notify(%s, %s)", (PUBSUB_CHANNEL, _payload(topics, event))
+        )
+        await conn.commit()
+
+
+def publish_sync(topics: list[str], event: dict):
+    """publish() for worker threads and job handlers"""
+    metrics.increment("pubsub_published_total")
+    if PUBSUB_BACKEND == "local":
+        # Only reaches subscribers of a serving process's own threads
+        if _loop is not None:
+            _loop.call_soon_threadsafe(_dispatch, {"topics": topics, "event": event})
+        return
+    with get_db_connection() as conn:  # type: ignore
+        conn.execute(
+            "SELECT pg_notify(%s, %s)", (PUBSUB_CHANNEL, _payload(topics, event))
+        )
+        conn.commit()
+
+
+async def _listen():
+    """Dispatch notifications until cancelled, reconnecting with backoff"""
+    delay = 1.0
+    connected_before = False
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(_conninfo, autocommit=True)
+            try:
+                await conn.execute(f"LISTEN {PUBSUB_CHANNEL}")
+                if connected_before:
+                    # Anything published while we were away is lost
+                    _resync_all()
+                connected_before = True
+                delay = 1.0
+                async for notify in conn.notifies():
+                    try:
+                        _dispatch(json.loads(notify.payload))
+                    except (ValueError, KeyError, TypeError) as e:
+                        print(f"Ignoring malformed pub/sub payload: {e}")
+            finally:
+                await conn.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Pub/sub listener lost its connection, reconnecting: {e}")
+            metrics.increment("pubsub_reconnects_total")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PUBSUB_RECONNECT_MAX_SECONDS)
+
+
+@lifecycle.on_warm_up
+async def start_listener():
+    global _listener, _loop
+    _loop = asyncio.get_running_loop()
+    if PUBSUB_BACKEND == "postgres" and _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+@lifecycle.on_shutdown
+async def stop_listener():
+    global _listener, _loop
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+    _listener = None
+    _loop = None
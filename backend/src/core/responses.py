@@ -0,0 +1,217 @@
+"""
+API response layer: orjson-backed JSON responses, a streaming JSON encoder
+for list endpoints and gzip/brotli compression middleware.
+"""
+
+import os
+import zlib
+from typing import Any, Iterable
+
+import brotli
+import orjson
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+load_dotenv()
+
+# Responses smaller than this are not worth the CPU spent compressing them
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Target size of each chunk written by the streaming JSON encoder
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Content types that are already compressed, or not worth compressing
+INCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/", "font/")
+INCOMPRESSIBLE_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-brotli",
+    "application/x-bzip2",
+    "application/x-7z-compressed",
+    "application/pdf",
+    "application/octet-stream",
+    "application/font-woff",
+    "application/wasm",
+}
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serialized with orjson, used as the app-wide default"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _json_list_chunks(items: Iterable, key: str | None):
+    """Encode items one at a time, yielding roughly STREAM_CHUNK_SIZE chunks"""
+    buffer = bytearray(b'{"' + key.encode() + b'":[' if key else b"[")
+    first = True
+    for item in items:
+        if not first:
+            buffer += b","
+        buffer += dumps(item)
+        first = False
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]}" if key else b"]"
+    yield bytes(buffer)
+
+
+def stream_json_list(
+    items: Iterable, key: str | None = None, status_code: int = 200
+) -> StreamingResponse:
+    """
+    Stream a JSON array, optionally wrapped as {key: [...]}, without ever
+    holding the whole payload in memory. `items` is consumed lazily, so pass
+    a generator such as core.database.stream_rows.
+    """
+    return StreamingResponse(
+        _json_list_chunks(items, key),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick br over gzip, honouring q=0 exclusions"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    if not media_type:
+        return False
+    if media_type == "image/svg+xml":
+        return True
+    if media_type.startswith(INCOMPRESSIBLE_PREFIXES):
+        return False
+    return media_type not in INCOMPRESSIBLE_TYPES
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._gz = None
+        else:
+            self._br = None
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._br:
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)  # type: ignore
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._br:
+            return self._br.process(data) + self._br.finish()
+        return self._gz.compress(data) + self._gz.flush()  # type: ignore
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip depending on Accept-Encoding.
+    Small bodies, already-encoded responses, partial content and
+    already-compressed media types are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                if start_message is not None:
+                    await send(start_message)
+                    start_message = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])  # type: ignore
+                if (
+                    start_message["status"] in (204, 206, 304)  # type: ignore
+                    or "content-encoding" in headers
+                    or "content-range" in headers
+                    or not is_compressible(headers.get("content-type", ""))
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+
+                if not more_body:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                await send(start_message)
+                start_message = None
+
+            if more_body:
+                chunk = compressor.compress(body)
+                if chunk:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body)})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,111 @@
+"""
+Single-flight coalescing for hot identical reads.
+
+Dashboards fire the same read many times at once on page load. coalesce()
+runs a blocking data-access function on a worker thread and lets every
+concurrent caller with the same key await that one call instead of issuing
+their own query. A result can optionally be reused for a few microseconds
+after it lands (window_us), which catches the stragglers of a burst.
+
+Writers call invalidate(namespace): it moves the namespace to a new
+generation, so nobody who arrives after the write joins a flight or window
+started before it. Sharing is per worker process.
+
+Counters on /metrics: singleflight_calls_total (queries actually run),
+singleflight_coalesced_total (callers that joined a running query) and
+singleflight_window_hits_total (callers served from the window).
+"""
+
+import asyncio
+import contextvars
+import copy
+import os
+import threading
+import time
+from collections import defaultdict
+
+import psycopg
+import psycopg_pool
+from dotenv import load_dotenv
+
+from core import metrics
+from core.database import flag_query_error, query_scope
+
+load_dotenv()
+
+# Default result window in microseconds, 0 to only share in-flight calls
+SINGLEFLIGHT_WINDOW_US = int(os.getenv("SINGLEFLIGHT_WINDOW_US", "0"))
+
+# Recent results kept for window_us, cleared wholesale beyond this size
+WINDOW_MAX_ENTRIES = 1024
+
+_flights: dict[tuple, asyncio.Task] = {}
+_recent: dict[tuple, tuple[float, object]] = {}
+_generations: dict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+
+
+def invalidate(namespace: str):
+    """Stop sharing reads of namespace that started before now"""
+    with _lock:
+        _generations[namespace] += 1
+        for key in [k for k in _recent if k[0] == namespace]:
+            _recent.pop(key, None)
+
+
+def _finished(key: tuple, window_us: int, task: asyncio.Task):
+    if _flights.get(key) is task:
+        del _flights[key]
+    if task.cancelled() or task.exception() is not None or not window_us:
+        return
+    with _lock:
+        # Written meanwhile, the result must not outlive the write
+        if _generations[key[0]] != key[1]:
+            return
+        if len(_recent) >= WINDOW_MAX_ENTRIES:
+            _recent.clear()
+        _recent[key] = (time.perf_counter(), task.result())
+
+
+async def coalesce(
+    namespace: str, args: tuple, fn, window_us: int = SINGLEFLIGHT_WINDOW_US
+):
+    """
+    Return fn(*args), sharing the call with concurrent callers of the same
+    namespace and args. Every caller gets its own copy of the result.
+    """
+    key = (namespace, _generations[namespace], *args)
+
+    if window_us:
+        recent = _recent.get(key)
+        if recent is not None:
+            if time.perf_counter() - recent[0] <= window_us / 1_000_000:
+                metrics.increment("singleflight_window_hits_total", namespace=namespace)
+                return copy.deepcopy(recent[1])
+            _recent.pop(key, None)
+
+    task = _flights.get(key)
+    if task is None:
+        metrics.increment("singleflight_calls_total", namespace=namespace)
+        # Same deadline, but not tied to this request: its disconnect must
+        # not cancel a query other requests are waiting on
+        context = contextvars.copy_context()
+        scope = query_scope.get()
+        if scope is not None:
+            context.run(
+                query_scope.set,
+                {**scope, "connections": set(), "canceled": False, "pool_timeout": False},
+            )
+        task = asyncio.create_task(asyncio.to_thread(fn, *args), context=context)
+        _flights[key] = task
+        task.add_done_callback(lambda t: _finished(key, window_us, t))
+    else:
+        metrics.increment("singleflight_coalesced_total", namespace=namespace)
+
+    try:
+        # One caller going away must not cancel the query for the others
+        result = await asyncio.shield(task)
+    except (psycopg.errors.QueryCanceled, psycopg_pool.PoolTimeout) as e:
+        flag_query_error(query_scope.get(), e)
+        raise
+    return copy.deepcopy(result)
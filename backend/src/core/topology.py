@@ -0,0 +1,129 @@
+"""
+Worker and connection pool topology for the server launcher.
+
+The launcher in main.py sizes the worker count from the cores this process
+may run on, splits a global Postgres connection budget across the workers
+and passes the per-worker pool sizes down through the environment, since
+core.database builds its pools at import time in every worker.
+"""
+
+import importlib.util
+import os
+import tempfile
+from pathlib import Path
+
+# Connections each worker keeps open even when idle
+DEFAULT_POOL_MIN_SIZE = 1
+
+# Directory used by workers to claim a CPU when pinning is enabled
+PIN_CLAIM_DIR = Path(tempfile.gettempdir()) / "umto_cpu_claims"
+# This worker's claim, see pin_current_worker
+_claim_fd: int | None = None
+
+
+def available_cpus() -> list[int]:
+    """CPUs this process may run on (respects cgroups/taskset on Linux)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pick_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def pick_http() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def compute_topology(
+    workers: int | None, db_connections: int, pin_cpus: bool
+) -> dict:
+    """
+    Work out workers and pool sizes. Each worker gets an equal share of
+    db_connections, split 3:1 between the sync and async pools.
+    """
+    cpus = available_cpus()
+    workers = workers or len(cpus)
+
+    per_worker = db_connections // workers
+    if per_worker < 2:
+        raise ValueError(
+            f"A budget of {db_connections} connections cannot serve {workers} workers, "
+            "each worker needs at least 2 (one sync and one async pool connection)"
+        )
+    async_max = max(1, per_worker // 4)
+    sync_max = per_worker - async_max
+
+    return {
+        "cpus": cpus,
+        "workers": workers,
+        "db_connections": db_connections,
+        "pool_min_size": min(DEFAULT_POOL_MIN_SIZE, sync_max),
+        "pool_max_size": sync_max,
+        "async_pool_min_size": min(DEFAULT_POOL_MIN_SIZE, async_max),
+        "async_pool_max_size": async_max,
+        "loop": pick_loop(),
+        "http": pick_http(),
+        "pin_cpus": pin_cpus and hasattr(os, "sched_setaffinity"),
+    }
+
+
+def export_topology(topology: dict):
+    """Pass pool sizes and pinning to the workers through the environment"""
+    os.environ["DB_POOL_MIN_SIZE"] = str(topology["pool_min_size"])
+    os.environ["DB_POOL_MAX_SIZE"] = str(topology["pool_max_size"])
+    os.environ["DB_ASYNC_POOL_MIN_SIZE"] = str(topology["async_pool_min_size"])
+    os.environ["DB_ASYNC_POOL_MAX_SIZE"] = str(topology["async_pool_max_size"])
+    if topology["pin_cpus"]:
+        # No clean-up of old claims needed, a dead worker's lock is gone with it
+        os.environ["PIN_WORKER_CPUS"] = ",".join(str(c) for c in topology["cpus"])
+
+
+def print_topology(topology: dict):
+    total_max = topology["workers"] * (
+        topology["pool_max_size"] + topology["async_pool_max_size"]
+    )
+    print(
+        f"Topology: {topology['workers']} workers on {len(topology['cpus'])} CPUs "
+        f"({'pinned' if topology['pin_cpus'] else 'unpinned'}), "
+        f"loop={topology['loop']}, http={topology['http']}"
+    )
+    print(
+        f"Per worker pools: sync {topology['pool_min_size']}-{topology['pool_max_size']}, "
+        f"async {topology['async_pool_min_size']}-{topology['async_pool_max_size']} "
+        f"({total_max} of {topology['db_connections']} connections at most)"
+    )
+
+
+def pin_current_worker():
+    """
+    Claim a free CPU from PIN_WORKER_CPUS and pin this process to it.
+    A claim is an exclusive lock on the CPU's file, held as long as the
+    process lives: no two live workers can hold the same CPU, and the CPU
+    of a dead worker is free again for its replacement.
+    """
+    global _claim_fd
+    cpus = os.getenv("PIN_WORKER_CPUS")
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return
+    import fcntl
+
+    PIN_CLAIM_DIR.mkdir(exist_ok=True)
+    for cpu in (int(c) for c in cpus.split(",")):
+        fd = os.open(PIN_CLAIM_DIR / f"cpu-{cpu}", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        # The owner pid is only informational, the lock is the claim
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        # Never closed: closing the file would release the claim
+        _claim_fd = fd
+        os.sched_setaffinity(0, {cpu})
+        print(f"Worker {os.getpid()} pinned to CPU {cpu}")
+        return
+
+    print(f"Worker {os.getpid()} found no free CPU to pin to, running unpinned")
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from fastapi import FastAPI
 from fastapi.concurrency import asynccontextmanager
@@ -6,17 +7,73 @@ from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from api.router import api_router  # Import the central router
-from core.database import _pool
+from api.endpoints import health
+from core import lifecycle, topology
+import core.llm  # noqa: F401 - shared upstream client, started at warm-up
+from core.deadlines import QueryDeadlineMiddleware
+from core.jobs import JobWorker
+from core.profiling import ProfilingMiddleware, profiling_enabled
+from core.responses import CompressionMiddleware, FastJSONResponse
+from utils.sessions import SessionRefreshMiddleware
+
+
+STATIC_DIR = "static"
+
+# Relative paths of the files under STATIC_DIR, filled in at warm-up
+_static_files: set[str] | None = None
+
+
+@lifecycle.on_warm_up
+def load_static_manifest():
+    """
+    Index the static build once so serve_spa does not stat the disk per request
+    """
+    global _static_files
+    files = set()
+    for root, _, names in os.walk(STATIC_DIR):
+        for name in names:
+            files.add(os.path.relpath(os.path.join(root, name), STATIC_DIR))
+    _static_files = files
+
+
+# Run a job worker inside every uvicorn worker instead of `python -m cli worker`
+if os.getenv("JOB_WORKER_IN_APP", "0") == "1":
+    import utils.job_handlers  # noqa: F401 - registers the handlers
+
+    _job_worker = JobWorker()
+    _job_worker_task = None
+
+    @lifecycle.on_warm_up
+    async def start_job_worker():
+        global _job_worker_task
+        _job_worker_task = asyncio.create_task(_job_worker.run())
+
+    @lifecycle.on_shutdown
+    async def stop_job_worker():
+        await _job_worker.stop()
+        if _job_worker_task is not None:
+            _job_worker_task.cancel()
 
 
 @asynccontextmanager
 async def lifespan(instance: FastAPI):
-    _pool.open()
+    topology.pin_current_worker()
+    lifecycle.install_signal_handlers()
+    await lifecycle.warm_up()
     yield
-    _pool.close()
+    await lifecycle.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(SessionRefreshMiddleware)
+app.add_middleware(lifecycle.LifecycleMiddleware)
+app.add_middleware(QueryDeadlineMiddleware)
 
+# Sampling profiler for slow requests, see core/profiling.py
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
 
-app = FastAPI(lifespan=lifespan)
 # Add CORS middleware
 # app.add_middleware(
 #     CORSMiddleware,
@@ -26,6 +83,7 @@ app = FastAPI(lifespan=lifespan)
 #     allow_headers=["*"],
 # )
 
+app.include_router(health.router)
 app.include_router(api_router)
 
 # Include the central API router
@@ -40,11 +98,15 @@ app.include_router(api_router)
 @app.get("/{full_path:path}")
 async def serve_spa(full_path: str):
     # Check if the path exists as a file
-    if os.path.exists(os.path.join("static", full_path)):
-        return FileResponse(os.path.join("static", full_path))
+    if _static_files is not None:
+        is_file = full_path in _static_files
+    else:
+        is_file = os.path.isfile(os.path.join(STATIC_DIR, full_path))
+    if is_file:
+        return FileResponse(os.path.join(STATIC_DIR, full_path))
 
     # Otherwise serve index.html for client-side routing
-    return FileResponse("static/index.html")
+    return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
 
 def use_route_names_as_operation_ids(app: FastAPI) -> None:
@@ -71,7 +133,33 @@ if __name__ == "__main__":
         "--port", type=int, default=8000, help="Port to run the server on"
     )
     parser.add_argument(
-        "--workers", type=int, default=8, help="Number of worker processes to run"
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes to run (default: one per available CPU)",
+    )
+    parser.add_argument(
+        "--db-connections",
+        type=int,
+        default=int(os.getenv("DB_MAX_CONNECTIONS", "80")),
+        help="Postgres connections shared by all workers (default: DB_MAX_CONNECTIONS or 80)",
+    )
+    parser.add_argument(
+        "--pin-cpus", action="store_true", help="Pin each worker to its own CPU"
     )
     args = parser.parse_args()
-    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+    server_topology = topology.compute_topology(
+        args.workers, args.db_connections, args.pin_cpus
+    )
+    topology.export_topology(server_topology)
+    topology.print_topology(server_topology)
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=server_topology["workers"],
+        loop=server_topology["loop"],
+        http=server_topology["http"],
+    )
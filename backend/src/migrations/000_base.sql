@@ -0,0 +1,23 @@
+-- Tables the auth and users endpoints were written against.
+-- Existing databases already have them, so everything is IF NOT EXISTS.
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    last_login_at TIMESTAMP,
+    login_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS token (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    access_toke TEXT NOT NULL,
+    status BOOLEAN NOT NULL DEFAULT true,
+    created_date TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS token_access_toke_idx ON token (access_toke);
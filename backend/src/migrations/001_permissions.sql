@@ -0,0 +1,29 @@
+-- Organisations, groups and the int3 permission bits (1 access, 2 read, 4 write)
+
+CREATE TABLE IF NOT EXISTS organisations (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    organisation_id INTEGER REFERENCES organisations(id) ON DELETE CASCADE,
+    agent_id INTEGER
+);
+
+-- Permissions every member of the group gets in the group's organisation
+ALTER TABLE groups
+    ADD COLUMN IF NOT EXISTS permission_type SMALLINT NOT NULL DEFAULT 1
+    CHECK (permission_type BETWEEN 0 AND 7);
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS group_id INTEGER REFERENCES groups(id) ON DELETE SET NULL;
+
+CREATE TABLE IF NOT EXISTS user_organisation (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    organisation_id INTEGER NOT NULL REFERENCES organisations(id) ON DELETE CASCADE,
+    permission_type SMALLINT NOT NULL CHECK (permission_type BETWEEN 0 AND 7),
+    PRIMARY KEY (user_id, organisation_id)
+);
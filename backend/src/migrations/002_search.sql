@@ -0,0 +1,39 @@
+-- Trigram and full-text indexes behind /api/search
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    id SERIAL PRIMARY KEY,
+    variable_name TEXT NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    is_preprompt BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    last_updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS chats (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    title TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    last_updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+ALTER TABLE artifacts
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+
+-- Substring matches (ILIKE '%x%') for queries of 3+ characters
+CREATE INDEX IF NOT EXISTS users_full_name_trgm_idx ON users USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS users_email_trgm_idx ON users USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS artifacts_variable_name_trgm_idx ON artifacts USING gin (variable_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS chats_title_trgm_idx ON chats USING gin (title gin_trgm_ops);
+
+-- Prefix matches for 1-2 character queries, too short for trigrams
+CREATE INDEX IF NOT EXISTS users_full_name_prefix_idx ON users (lower(full_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS users_email_prefix_idx ON users (lower(email) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS artifacts_variable_name_prefix_idx ON artifacts (lower(variable_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS chats_title_prefix_idx ON chats (lower(title) text_pattern_ops);
+
+-- Word matches inside artifact content
+CREATE INDEX IF NOT EXISTS artifacts_search_vector_idx ON artifacts USING gin (search_vector);
@@ -0,0 +1,27 @@
+-- Versioned, compressed artifact content.
+-- Each save appends a delta; every ARTIFACT_SNAPSHOT_EVERY versions a full
+-- snapshot is stored. artifacts.content only holds content written before
+-- versioning (current_version = 0) and is emptied on the next save.
+
+CREATE TABLE IF NOT EXISTS artifact_versions (
+    artifact_id INTEGER NOT NULL REFERENCES artifacts(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    is_snapshot BOOLEAN NOT NULL,
+    data BYTEA NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (artifact_id, version)
+);
+
+-- Finds the latest snapshot to replay from
+CREATE INDEX IF NOT EXISTS artifact_versions_snapshot_idx
+    ON artifact_versions (artifact_id, version DESC) WHERE is_snapshot;
+
+ALTER TABLE artifacts ADD COLUMN IF NOT EXISTS current_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE artifacts ADD COLUMN IF NOT EXISTS content_length INTEGER;
+UPDATE artifacts SET content_length = length(content) WHERE content_length IS NULL;
+ALTER TABLE artifacts ALTER COLUMN content_length SET NOT NULL;
+ALTER TABLE artifacts ALTER COLUMN content_length SET DEFAULT 0;
+
+-- Content is no longer stored in plain text, the search vector is now
+-- written by the application on every save
+ALTER TABLE artifacts ALTER COLUMN search_vector DROP EXPRESSION IF EXISTS;
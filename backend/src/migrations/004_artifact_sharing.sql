@@ -0,0 +1,25 @@
+-- Artifact sharing with users and groups, plus the precomputed
+-- user -> visible artifacts index maintained by utils/sharing.py
+
+CREATE TABLE IF NOT EXISTS artifact_users (
+    artifact_id INTEGER NOT NULL REFERENCES artifacts(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    PRIMARY KEY (artifact_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS artifact_users_user_idx ON artifact_users (user_id);
+
+CREATE TABLE IF NOT EXISTS artifact_groups (
+    artifact_id INTEGER NOT NULL REFERENCES artifacts(id) ON DELETE CASCADE,
+    group_id INTEGER NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
+    PRIMARY KEY (artifact_id, group_id)
+);
+CREATE INDEX IF NOT EXISTS artifact_groups_group_idx ON artifact_groups (group_id);
+
+CREATE TABLE IF NOT EXISTS user_visible_artifacts (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    artifact_id INTEGER NOT NULL REFERENCES artifacts(id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id, artifact_id)
+);
+CREATE INDEX IF NOT EXISTS user_visible_artifacts_artifact_idx ON user_visible_artifacts (artifact_id);
+
+CREATE INDEX IF NOT EXISTS users_group_id_idx ON users (group_id);
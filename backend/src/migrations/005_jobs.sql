@@ -0,0 +1,26 @@
+-- Durable background jobs, claimed with FOR UPDATE SKIP LOCKED by core/jobs.py
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT now(),
+    locked_by TEXT,
+    heartbeat_at TIMESTAMP,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    result JSONB,
+    error TEXT,
+    created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    finished_at TIMESTAMP
+);
+
+-- The claim query only ever looks at due, queued jobs
+CREATE INDEX IF NOT EXISTS jobs_queued_idx ON jobs (job_type, run_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS jobs_running_idx ON jobs (job_type, heartbeat_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS jobs_created_by_idx ON jobs (created_by, id DESC);
@@ -0,0 +1,17 @@
+-- Rotating refresh tokens, see utils/sessions.py.
+-- Access tokens are checked from their signature alone, so the old token
+-- table is no longer written.
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    jti UUID PRIMARY KEY,
+    family_id UUID NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'active'
+        CHECK (status IN ('active', 'rotated', 'revoked')),
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    rotated_at TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS refresh_tokens_family_idx ON refresh_tokens (family_id);
+CREATE INDEX IF NOT EXISTS refresh_tokens_user_idx ON refresh_tokens (user_id);
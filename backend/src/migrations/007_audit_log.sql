@@ -0,0 +1,18 @@
+-- Audit trail, see core/audit.py.
+-- Range partitioned by month on occurred_at: date-range queries only scan
+-- the partitions they cover, and retention drops whole partitions.
+-- Partitions are created ahead of time by core.audit.ensure_partitions.
+
+CREATE TABLE IF NOT EXISTS audit_log (
+    occurred_at TIMESTAMP NOT NULL,
+    event TEXT NOT NULL,
+    actor_id INTEGER,
+    subject_type TEXT,
+    subject_id TEXT,
+    ip TEXT,
+    details JSONB
+) PARTITION BY RANGE (occurred_at);
+
+CREATE INDEX IF NOT EXISTS audit_log_occurred_at_idx ON audit_log (occurred_at);
+CREATE INDEX IF NOT EXISTS audit_log_actor_idx ON audit_log (actor_id, occurred_at);
+CREATE INDEX IF NOT EXISTS audit_log_event_idx ON audit_log (event, occurred_at);
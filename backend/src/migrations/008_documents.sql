@@ -0,0 +1,45 @@
+-- Documents for chat-docs and their BM25 retrieval index, see utils/documents.py.
+-- document_terms and document_index_stats hold the corpus statistics BM25
+-- needs (chunks per lexeme, total chunks and length). Ingestion and deletion
+-- keep them up to date, so the index never has to be rebuilt.
+
+CREATE TABLE IF NOT EXISTS documents (
+    id SERIAL PRIMARY KEY,
+    title TEXT NOT NULL,
+    filename TEXT,
+    bytes BIGINT NOT NULL DEFAULT 0,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'ingesting'
+        CHECK (status IN ('ingesting', 'ready', 'failed')),
+    error TEXT,
+    uploaded_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id BIGSERIAL PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    -- Words in the chunk, BM25's document length
+    length INTEGER NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+    -- Unit-length vector from DOCUMENT_EMBEDDER, NULL when none is configured
+    embedding REAL[],
+    UNIQUE (document_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS document_chunks_search_vector_idx ON document_chunks USING gin (search_vector);
+
+CREATE TABLE IF NOT EXISTS document_terms (
+    lexeme TEXT PRIMARY KEY,
+    chunk_count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS document_index_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    chunk_count BIGINT NOT NULL DEFAULT 0,
+    total_length BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO document_index_stats (id) VALUES (1) ON CONFLICT DO NOTHING;
@@ -0,0 +1,20 @@
+-- Chat history with per-message token counts and a rolling summary of the
+-- older turns, see utils/chat_context.py.
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS chat_messages_chat_idx ON chat_messages (chat_id, id);
+
+-- summary covers every message up to and including summary_through
+ALTER TABLE chats
+    ADD COLUMN IF NOT EXISTS summary TEXT,
+    ADD COLUMN IF NOT EXISTS summary_through BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS summary_token_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS summary_requested_at TIMESTAMP;
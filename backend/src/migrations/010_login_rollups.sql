@@ -0,0 +1,35 @@
+-- Dashboard rollups of logins and user activity, see utils/rollups.py.
+-- Both tables are keyed by organisation and group (group_id 0 for members
+-- whose group is not in that organisation), so dashboards read a row per
+-- group and day however many users there are.
+
+-- Maintained incrementally by the login path's batched writer
+CREATE TABLE IF NOT EXISTS login_rollups (
+    day DATE NOT NULL,
+    organisation_id INTEGER NOT NULL REFERENCES organisations(id) ON DELETE CASCADE,
+    group_id INTEGER NOT NULL,
+    logins INTEGER NOT NULL DEFAULT 0,
+    active_users INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (organisation_id, day, group_id)
+);
+
+-- Users seen per day, so active_users counts each user once a day.
+-- Only the last few days are kept.
+CREATE TABLE IF NOT EXISTS user_login_days (
+    day DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id)
+);
+
+-- Recomputed periodically, dormancy changes without any event
+CREATE TABLE IF NOT EXISTS user_rollups (
+    organisation_id INTEGER NOT NULL REFERENCES organisations(id) ON DELETE CASCADE,
+    group_id INTEGER NOT NULL,
+    users INTEGER NOT NULL,
+    never_logged_in INTEGER NOT NULL,
+    dormant INTEGER NOT NULL,
+    active_7d INTEGER NOT NULL,
+    active_30d INTEGER NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (organisation_id, group_id)
+);
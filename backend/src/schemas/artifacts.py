@@ -0,0 +1,45 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class AdminCreateArtifactRequest(BaseModel):
+    user_ids: list[int] = []
+    group_ids: list[int] = []
+    variable_name: str
+    content: str
+    is_preprompt: bool = False
+
+
+class AdminUpdateArtifactRequest(BaseModel):
+    id: int
+    # Sharing is left as is when both are omitted
+    user_ids: Optional[list[int]] = None
+    group_ids: Optional[list[int]] = None
+    variable_name: str
+    content: str
+
+
+class AdminPatchArtifactRequest(BaseModel):
+    """
+    Editor delta: ops are [start, end, text] replacements made against
+    base_version, applied in order. Offsets count UTF-16 code units, as
+    JavaScript string indices do.
+    """
+
+    id: int
+    base_version: int
+    ops: list[tuple[int, int, str]]
+    variable_name: Optional[str] = None
+
+
+class AdminGetArtifactRequest(BaseModel):
+    id: int
+    version: Optional[int] = None
+
+
+class AdminDeleteArtifactRequest(BaseModel):
+    artifact_id: int
+
+
+class AdminDeleteArtifactsRequest(BaseModel):
+    ids: list[int]
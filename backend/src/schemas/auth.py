@@ -13,4 +13,8 @@ class TokenData(BaseModel):
 
 class RefreshToken(BaseModel):
     """Schema for refresh token requests"""
-    refresh_token: str
\ No newline at end of file
+    refresh_token: str
+
+class GoogleLogin(BaseModel):
+    """Schema for Google sign-in requests"""
+    id_token: str
@@ -0,0 +1,12 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class AdminDeleteDocumentRequest(BaseModel):
+    document_id: int
+
+
+class RetrieveRequest(BaseModel):
+    queries: list[str] = Field(min_length=1, max_length=32)
+    k: int = Field(default=5, ge=1, le=50)
+    document_ids: Optional[list[int]] = None
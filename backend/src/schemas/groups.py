@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class AdminDeleteGroupRequest(BaseModel):
+    group_id: int
+
+
+class AdminDeleteGroupsRequest(BaseModel):
+    ids: list[int]
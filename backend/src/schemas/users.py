@@ -6,6 +6,7 @@ class UserCreate(BaseModel):
     full_name: str
     email: str
     password: str
+    group_id: Optional[int] = None
 
 
 class AdminCreateUserRequest(BaseModel):
@@ -14,6 +15,10 @@ class AdminCreateUserRequest(BaseModel):
     group_id: Optional[int]
 
 
+class AdminCreateUsersRequest(BaseModel):
+    users: list[AdminCreateUserRequest]
+
+
 class AdminUpdateUserRequest(BaseModel):
     id: int
     full_name: str
@@ -0,0 +1,387 @@
+"""
+Versioned artifact storage.
+
+Every save appends one row to artifact_versions: either a compressed delta
+(a list of [start, end, text] replacements) or, every SNAPSHOT_EVERY
+versions, a compressed full snapshot. Reading replays the deltas on top of
+the latest snapshot, so a save costs bytes proportional to the edit while a
+read replays at most SNAPSHOT_EVERY - 1 deltas. List views only touch the
+artifacts row and never read content. The search vector is rewritten on
+every save, together with the version and length.
+
+Stored deltas use code point offsets, as Python slices strings. Editor
+patches arrive with JavaScript's UTF-16 code unit offsets and are converted
+by apply_editor_ops.
+"""
+
+import json
+import os
+import zlib
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from core.database import get_db_connection, stream_rows
+from core.singleflight import invalidate
+from utils.sharing import get_artifact_audience, set_artifact_audience
+
+load_dotenv()
+
+SNAPSHOT_EVERY = int(os.getenv("ARTIFACT_SNAPSHOT_EVERY", "20"))
+
+# Payloads below this are stored raw, zlib would only add overhead
+COMPRESS_MIN_BYTES = 128
+
+
+class ArtifactNotFound(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    """The patch was made against a version that is no longer current"""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Artifact is at version {current_version}")
+        self.current_version = current_version
+
+
+class InvalidPatch(Exception):
+    pass
+
+
+def pack(data: bytes) -> bytes:
+    if len(data) < COMPRESS_MIN_BYTES:
+        return b"r" + data
+    return b"z" + zlib.compress(data, 6)
+
+
+def unpack(data: bytes) -> bytes:
+    data = bytes(data)
+    if data[:1] == b"z":
+        return zlib.decompress(data[1:])
+    return data[1:]
+
+
+def diff_ops(old: str, new: str) -> list:
+    """
+    Single replacement turning old into new, found by trimming the common
+    prefix and suffix. Linear time and exact for the contiguous edits an
+    editor autosave produces.
+    """
+    if old == new:
+        return []
+    prefix = 0
+    max_prefix = min(len(old), len(new))
+    while prefix < max_prefix and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    max_suffix = min(len(old), len(new)) - prefix
+    while suffix < max_suffix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return [[prefix, len(old) - suffix, new[prefix : len(new) - suffix]]]
+
+
+def _code_point_index(units: bytes, offset: int) -> int:
+    """Code point index of a UTF-16 code unit offset, units being UTF-16-LE"""
+    try:
+        return len(units[: 2 * offset].decode("utf-16-le"))
+    except UnicodeDecodeError:
+        raise InvalidPatch(f"Offset {offset} splits a surrogate pair")
+
+
+def apply_editor_ops(content: str, ops: list) -> tuple[list, str]:
+    """
+    Validate and apply editor ops, whose offsets count UTF-16 code units.
+    Returns the same ops with code point offsets, for storage, and the new
+    content.
+    """
+    converted = []
+    for op in ops:
+        if (
+            not isinstance(op, (list, tuple))
+            or len(op) != 3
+            or not isinstance(op[0], int)
+            or not isinstance(op[1], int)
+            or not isinstance(op[2], str)
+        ):
+            raise InvalidPatch("Each op must be [start, end, text]")
+        start, end, text = op
+        try:
+            text.encode("utf-8")
+        except UnicodeEncodeError:
+            raise InvalidPatch("Op text contains an unpaired surrogate")
+        units = content.encode("utf-16-le")
+        length = len(units) // 2
+        if not 0 <= start <= end <= length:
+            raise InvalidPatch(
+                f"Op [{start}, {end}] is outside a document of length {length}"
+            )
+        if length != len(content):
+            # Outside the BMP code units and code points differ
+            start = _code_point_index(units, start)
+            end = _code_point_index(units, end)
+        converted.append([start, end, text])
+        content = content[:start] + text + content[end:]
+    return converted, content
+
+
+def apply_ops(content: str, ops: list) -> str:
+    for start, end, text in ops:
+        content = content[:start] + text + content[end:]
+    return content
+
+
+def _load_content(cur, artifact_id: int, version: int) -> str:
+    """Rebuild the content at `version` from the latest snapshot before it"""
+    if version == 0:
+        cur.execute(
+            "SELECT content, current_version FROM artifacts WHERE id = %s",
+            (artifact_id,),
+        )
+        row = cur.fetchone()
+        # The plain content column is emptied once the first version is saved
+        if row is None or row[1] > 0:
+            raise ArtifactNotFound(f"Artifact {artifact_id} has no version 0")
+        return row[0]
+
+    cur.execute(
+        """
+        SELECT version, is_snapshot, data
+        FROM artifact_versions
+        WHERE artifact_id = %s
+          AND version <= %s
+          AND version >= (
+              SELECT max(version) FROM artifact_versions
+              WHERE artifact_id = %s AND is_snapshot AND version <= %s
+          )
+        ORDER BY version
+        """,
+        (artifact_id, version, artifact_id, version),
+    )
+    rows = cur.fetchall()
+    if not rows or rows[-1][0] != version:
+        raise ArtifactNotFound(f"Artifact {artifact_id} has no version {version}")
+
+    content = unpack(rows[0][2]).decode()
+    for _, _, data in rows[1:]:
+        content = apply_ops(content, json.loads(unpack(data)))
+    return content
+
+
+def _append_version(cur, artifact_id: int, version: int, ops: list, content: str):
+    """Store `version` as a delta, or as a snapshot when one is due"""
+    if (version - 1) % SNAPSHOT_EVERY == 0:
+        cur.execute(
+            """
+            INSERT INTO artifact_versions (artifact_id, version, is_snapshot, data)
+            VALUES (%s, %s, true, %s)
+            """,
+            (artifact_id, version, pack(content.encode())),
+        )
+    else:
+        cur.execute(
+            """
+            INSERT INTO artifact_versions (artifact_id, version, is_snapshot, data)
+            VALUES (%s, %s, false, %s)
+            """,
+            (artifact_id, version, pack(json.dumps(ops).encode())),
+        )
+
+
+def _lock_artifact(cur, artifact_id: int):
+    cur.execute(
+        """
+        SELECT current_version, content_length, variable_name
+        FROM artifacts
+        WHERE id = %s
+        FOR UPDATE
+        """,
+        (artifact_id,),
+    )
+    row = cur.fetchone()
+    if not row:
+        raise ArtifactNotFound(f"Artifact {artifact_id} does not exist")
+    return row
+
+
+def _save(cur, artifact_id, current_version, ops, variable_name, content) -> int:
+    """Append the next version and move the artifact row forward to it"""
+    if not ops and variable_name is None:
+        return current_version
+    version = current_version + 1
+    _append_version(cur, artifact_id, version, ops, content)
+    cur.execute(
+        """
+        UPDATE artifacts
+        SET current_version = %s,
+            content_length = %s,
+            search_vector = to_tsvector('simple', %s),
+            content = '',
+            variable_name = coalesce(%s, variable_name),
+            last_updated_at = %s
+        WHERE id = %s
+        """,
+        (
+            version,
+            len(content),
+            content,
+            variable_name,
+            datetime.utcnow(),
+            artifact_id,
+        ),
+    )
+    return version
+
+
+def create_artifact(
+    variable_name: str,
+    content: str,
+    is_preprompt: bool = False,
+    user_ids: list[int] | None = None,
+    group_ids: list[int] | None = None,
+) -> dict:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO artifacts
+                    (variable_name, is_preprompt, current_version, content_length,
+                     search_vector)
+                VALUES (%s, %s, 1, %s, to_tsvector('simple', %s))
+                RETURNING id
+                """,
+                (variable_name, is_preprompt, len(content), content),
+            )
+            artifact_id = cur.fetchone()[0]  # type: ignore
+            _append_version(cur, artifact_id, 1, [], content)
+            set_artifact_audience(cur, artifact_id, user_ids or [], group_ids or [])
+            conn.commit()
+    return {"id": artifact_id, "version": 1}
+
+
+def update_artifact(
+    artifact_id: int,
+    variable_name: str,
+    content: str,
+    user_ids: list[int] | None = None,
+    group_ids: list[int] | None = None,
+) -> dict:
+    """
+    Full-body update, stored as the delta from the current content.
+    Sharing is left as is when user_ids and group_ids are both None.
+    """
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            current_version, _, old_name = _lock_artifact(cur, artifact_id)
+            if user_ids is not None or group_ids is not None:
+                set_artifact_audience(cur, artifact_id, user_ids or [], group_ids or [])
+            old = _load_content(cur, artifact_id, current_version)
+            version = _save(
+                cur,
+                artifact_id,
+                current_version,
+                diff_ops(old, content),
+                variable_name if variable_name != old_name else None,
+                content,
+            )
+            conn.commit()
+    invalidate("artifacts")
+    return {"id": artifact_id, "version": version}
+
+
+def patch_artifact(
+    artifact_id: int, base_version: int, ops: list, variable_name: str | None = None
+) -> dict:
+    """Apply editor ops (UTF-16 offsets) made against base_version"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            current_version, _, _ = _lock_artifact(cur, artifact_id)
+            if base_version != current_version:
+                raise VersionConflict(current_version)
+            ops, content = apply_editor_ops(
+                _load_content(cur, artifact_id, current_version), ops
+            )
+            version = _save(cur, artifact_id, current_version, ops, variable_name, content)
+            conn.commit()
+    invalidate("artifacts")
+    return {"id": artifact_id, "version": version}
+
+
+def get_artifact(artifact_id: int, version: int | None = None) -> dict:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, variable_name, is_preprompt, created_at, last_updated_at,
+                       current_version
+                FROM artifacts
+                WHERE id = %s
+                """,
+                (artifact_id,),
+            )
+            row = cur.fetchone()
+            if not row:
+                raise ArtifactNotFound(f"Artifact {artifact_id} does not exist")
+            if version is None or version > row[5]:
+                version = row[5]
+            content = _load_content(cur, artifact_id, version)
+            audience = get_artifact_audience(cur, artifact_id)
+
+    return {
+        "id": row[0],
+        "variable_name": row[1],
+        "is_preprompt": row[2],
+        "created_at": row[3],
+        "last_updated_at": row[4],
+        "version": version,
+        "current_version": row[5],
+        "content": content,
+        **audience,
+    }
+
+
+def reindex_artifacts() -> int:
+    """
+    Rewrite every artifact's search vector from its current content, for
+    vectors written before saves kept them current
+    """
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM artifacts WHERE current_version > 0 ORDER BY id")
+            ids = [row[0] for row in cur.fetchall()]
+        conn.rollback()
+
+    for artifact_id in ids:
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                current_version, _, _ = _lock_artifact(cur, artifact_id)
+                cur.execute(
+                    "UPDATE artifacts SET search_vector = to_tsvector('simple', %s) WHERE id = %s",
+                    (_load_content(cur, artifact_id, current_version), artifact_id),
+                )
+                conn.commit()
+    return len(ids)
+
+
+def list_artifacts():
+    """artifact_list_item rows, without touching any content"""
+    return stream_rows(
+        """
+        SELECT id, variable_name, is_preprompt, created_at, last_updated_at
+        FROM artifacts
+        ORDER BY id
+        """
+    )
+
+
+def delete_artifacts(ids: list[int]) -> list[int]:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM artifacts WHERE id = ANY(%s) RETURNING id",
+                (ids,),
+            )
+            deleted = [row[0] for row in cur.fetchall()]
+            conn.commit()
+    invalidate("artifacts")
+    return deleted
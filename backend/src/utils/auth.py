@@ -18,7 +18,9 @@ load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
 PWD_SALT = os.getenv("PWD_SALT", "")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
+# Short lived, access tokens are not checked against the database.
+# Sessions last as long as their refresh token, see utils/sessions.py
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 
 # Password context for hashing and verification
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -88,79 +90,48 @@ async def authenticate_user(email: str, password: str):
     return user
 
 
-async def save_token(user_id: int, access_token: str) -> bool:
-    """Save token to the database"""
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                # First, invalidate any existing token for this user
-                cur.execute(
-                    """
-                    UPDATE token
-                    SET status = false
-                    WHERE user_id = %s
-                    """,
-                    (user_id,),
-                )
+async def get_current_user(access_token: Optional[str] = Cookie(None)):
+    """
+    Get the current user from the access token cookie.
+    The token is checked from its signature alone. Expired sessions are
+    refreshed before the route runs, see utils.sessions.SessionRefreshMiddleware.
+    """
+    user = user_from_access_token(access_token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
-                # Then insert the new token
-                cur.execute(
-                    """
-                    INSERT INTO token (user_id, access_toke, status, created_date)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (user_id, access_token, True, datetime.utcnow()),
-                )
-                conn.commit()
-                return True
-    except Exception as e:
-        print(f"Error saving token: {e}")
-        return False
 
+def user_from_claims(payload: dict | None) -> dict | None:
+    """The current-user dict for access token claims, None if they are unusable"""
+    # Tokens from before refresh sessions have no uid and need a new login
+    if payload is None or payload.get("sub") is None or payload.get("uid") is None:
+        return None
 
-async def get_current_user(access_token: Optional[str] = Cookie(None)):
+    return {
+        "id": payload["uid"],
+        "full_name": payload.get("name"),
+        "email": payload["sub"],
+        # Permission masks resolved at login or refresh, see utils/permissions.py
+        "permissions": {
+            int(org): mask for org, mask in (payload.get("perms") or {}).items()
+        },
+    }
+
+
+def user_from_access_token(access_token: str | None) -> dict | None:
     """
-    Get the current user from the access token cookie
+    The user of a valid access token, without refreshing. For WebSockets,
+    which cannot hand a rotated refresh cookie back to the browser.
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-
     if not access_token:
-        raise credentials_exception
-
+        return None
     try:
         payload = jwt.decode(access_token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")  # type: ignore
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-
-    user = await get_user_by_email(email)
-    if user is None:
-        raise credentials_exception
-
-    # Verify token is valid in database
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT user_id FROM token
-                    WHERE access_toke = %s AND user_id = %s AND status = true
-                    """,
-                    (access_token, user["id"]),
-                    # toke is short for token obv... Too deep to fix now lol
-                )
-                token_user = cur.fetchone()
-
-                if not token_user:
-                    raise credentials_exception
-    except Exception as e:
-        print(f"Error verifying access token: {e}")
-        raise credentials_exception
-
-    return user
+        return None
+    return user_from_claims(payload)
@@ -0,0 +1,199 @@
+"""
+Low-impact database backups.
+
+pg_dump runs at low CPU and I/O priority and its output is streamed to disk
+through a rate limiter. Because pg_dump blocks once the pipe is full,
+throttling the writer also throttles how fast it reads from the server,
+which is what keeps production latency flat. Runs hold a Postgres advisory
+lock so two backups never overlap, wherever they were started from. Every
+run appends timing and size metrics to BACKUP_METRICS_FILE, and old backups
+are pruned once a new one has succeeded.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import psycopg
+from dotenv import load_dotenv
+
+from core.database import _conninfo
+
+load_dotenv()
+
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", "../backups"))
+# Output bandwidth in bytes per second, 0 for no limit
+BACKUP_MAX_BYTES_PER_SEC = int(os.getenv("BACKUP_MAX_BYTES_PER_SEC", str(8 * 1024 * 1024)))
+BACKUP_NICE = int(os.getenv("BACKUP_NICE", "10"))
+# ionice scheduling class for pg_dump: 3 idle, 2 best-effort, empty to disable
+BACKUP_IONICE_CLASS = os.getenv("BACKUP_IONICE_CLASS", "3")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+BACKUP_MAX_AGE_DAYS = int(os.getenv("BACKUP_MAX_AGE_DAYS", "30"))
+BACKUP_METRICS_FILE = BACKUP_DIR / "backup_metrics.jsonl"
+
+BACKUP_CHUNK_SIZE = 64 * 1024
+# Flush to disk and drop written pages from the page cache this often, so a
+# large dump neither evicts the database's cache nor lands as one write burst
+BACKUP_SYNC_BYTES = 64 * 1024 * 1024
+
+# pg_advisory_lock key shared by every backup run
+BACKUP_LOCK_ID = 0x62616B75
+
+
+class BackupLocked(Exception):
+    pass
+
+
+class BackupFailed(Exception):
+    pass
+
+
+@contextmanager
+def backup_lock():
+    """Hold the backup advisory lock for the duration of the block"""
+    # Own session rather than a pooled connection: the lock lives as long as
+    # the session, and is released even if this process dies mid-dump
+    conn = psycopg.connect(_conninfo, autocommit=True)
+    try:
+        locked = conn.execute(
+            "SELECT pg_try_advisory_lock(%s)", (BACKUP_LOCK_ID,)
+        ).fetchone()[0]  # type: ignore
+        if not locked:
+            raise BackupLocked("Another backup is already running")
+        yield
+    finally:
+        conn.close()
+
+
+class Throttle:
+    """Sleep just enough to keep the average rate under bytes_per_sec"""
+
+    def __init__(self, bytes_per_sec: int):
+        self.bytes_per_sec = bytes_per_sec
+        self.started = time.monotonic()
+        self.total = 0
+        self.slept = 0.0
+
+    def wait(self, n: int):
+        self.total += n
+        if not self.bytes_per_sec:
+            return
+        ahead = self.total / self.bytes_per_sec - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+            self.slept += ahead
+
+
+def _low_priority(cmd: list[str]) -> list[str]:
+    # Wrapper commands rather than preexec_fn, which can deadlock the child
+    # of a threaded process (the job worker runs dumps in a thread)
+    if BACKUP_NICE and shutil.which("nice"):
+        cmd = ["nice", "-n", str(BACKUP_NICE), *cmd]
+    if BACKUP_IONICE_CLASS and shutil.which("ionice"):
+        cmd = ["ionice", "-c", BACKUP_IONICE_CLASS, *cmd]
+    return cmd
+
+
+def _sync_and_drop(f):
+    """Flush f to disk and drop its pages from the page cache, where supported"""
+    f.flush()
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(f.fileno())
+    else:
+        os.fsync(f.fileno())
+    # Not on macOS
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def run_dump(cmd: list[str], env: dict, header: str, backup_file: Path) -> dict:
+    """
+    Stream pg_dump output into backup_file behind header, throttled, and
+    return the run's metrics. The file only appears once the dump succeeded.
+    """
+    started = time.time()
+    throttle = Throttle(BACKUP_MAX_BYTES_PER_SEC)
+    partial = backup_file.with_name(backup_file.name + ".partial")
+    synced = 0
+
+    with tempfile.TemporaryFile() as stderr, open(partial, "wb") as f:
+        process = subprocess.Popen(
+            _low_priority(cmd),
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            env=env,
+        )
+        try:
+            f.write(header.encode())
+            while chunk := process.stdout.read(BACKUP_CHUNK_SIZE):  # type: ignore
+                f.write(chunk)
+                throttle.wait(len(chunk))
+                if throttle.total - synced >= BACKUP_SYNC_BYTES:
+                    _sync_and_drop(f)
+                    synced = throttle.total
+            returncode = process.wait()
+        except BaseException:
+            process.kill()
+            process.wait()
+            partial.unlink(missing_ok=True)
+            raise
+
+        if returncode != 0:
+            stderr.seek(0)
+            partial.unlink(missing_ok=True)
+            tail = stderr.read()[-2000:].decode(errors="replace")
+            raise BackupFailed(f"pg_dump exited with {returncode}: {tail}")
+
+    os.replace(partial, backup_file)
+    duration = time.time() - started
+    return {
+        "file": str(backup_file),
+        "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "duration_seconds": round(duration, 2),
+        "bytes": backup_file.stat().st_size,
+        "throttled_seconds": round(throttle.slept, 2),
+        "mb_per_second": round(throttle.total / 1024 / 1024 / duration, 2) if duration else None,
+    }
+
+
+def prune_backups(prefix: str) -> list[str]:
+    """
+    Delete backups named prefix* beyond the newest BACKUP_KEEP or older than
+    BACKUP_MAX_AGE_DAYS. The newest backup is always kept.
+    """
+    backups = sorted(
+        BACKUP_DIR.glob(f"{prefix}*.sql"), key=lambda p: p.stat().st_mtime, reverse=True
+    )
+    cutoff = (datetime.now() - timedelta(days=BACKUP_MAX_AGE_DAYS)).timestamp()
+    pruned = []
+    for index, path in enumerate(backups[1:], start=1):
+        if index >= BACKUP_KEEP or path.stat().st_mtime < cutoff:
+            path.unlink()
+            pruned.append(path.name)
+    return pruned
+
+
+def record_metrics(metrics: dict):
+    """Append one run's metrics to BACKUP_METRICS_FILE and print them"""
+    print(f"Backup metrics: {json.dumps(metrics)}")
+    try:
+        with open(BACKUP_METRICS_FILE, "a") as f:
+            f.write(json.dumps(metrics) + "\n")
+    except OSError as e:
+        print(f"Could not write backup metrics: {e}")
+
+
+def seconds_until(at: str) -> float:
+    """Seconds from now until the next local HH:MM"""
+    hour, minute = (int(part) for part in at.split(":"))
+    now = datetime.now()
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
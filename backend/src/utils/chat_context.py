@@ -0,0 +1,353 @@
+"""
+Context-window budgeting for the chat path.
+
+Every stored message carries its token count, computed once when it is
+added. A request is built from the agent/artifact prefix, the chat's rolling
+summary and as many of the newest turns as fit in CHAT_CONTEXT_TOKENS
+(minus CHAT_RESPONSE_TOKENS kept free for the answer). Building it only
+adds stored counts and never re-tokenizes the history.
+
+Turns that have fallen out of the recent window are folded into the summary
+by a background job (summarize_chat) and stored on the chats row, so the
+history a request has to look at stays bounded however long the chat gets.
+
+Stored turns are published on the chat's pub/sub topics (chat_topics) for
+live admin views, see utils/chat_events.py.
+
+The tokenizer and summarizer are plain functions. They come from
+CHAT_TOKENIZER / CHAT_SUMMARIZER ("module:function") or are passed in
+directly, which is how fakes are plugged in:
+
+    tokenizer(text: str) -> int
+    summarizer(previous_summary: str | None, messages: list[dict]) -> str
+"""
+
+import importlib
+import math
+import os
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from core import pubsub
+from core.database import get_db_connection
+
+load_dotenv()
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "100000"))
+CHAT_RESPONSE_TOKENS = int(os.getenv("CHAT_RESPONSE_TOKENS", "4096"))
+# Summarize once this many tokens have dropped out of the recent window
+CHAT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CHAT_SUMMARY_TRIGGER_TOKENS", "8000"))
+# Tokens of newest turns the summarizer leaves alone, so requests keep them
+# verbatim
+CHAT_RECENT_TOKENS = int(os.getenv("CHAT_RECENT_TOKENS", "40000"))
+# Most history tokens sent to the summarizer in one call
+CHAT_SUMMARY_INPUT_TOKENS = int(os.getenv("CHAT_SUMMARY_INPUT_TOKENS", "30000"))
+CHAT_TOKENIZER = os.getenv("CHAT_TOKENIZER", "")
+CHAT_SUMMARIZER = os.getenv("CHAT_SUMMARIZER", "")
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "1024"))
+
+# Fallback tokenizer: close enough for budgeting English and Danish text
+CHARS_PER_TOKEN = 4
+# A summary requested this long ago without result may be requested again
+SUMMARY_RETRY_AFTER = timedelta(minutes=5)
+PREFIX_CACHE_SIZE = 256
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an "
+    "assistant. Merge the new turns into the existing summary. Keep facts, "
+    "decisions, names, numbers and open questions; drop pleasantries. Write "
+    "plain prose in the language of the conversation, as briefly as the content "
+    "allows."
+)
+
+_loaded: dict[str, object] = {}
+# hash(prefix) -> tokens, the compiled prefix rarely changes between turns
+_prefix_tokens: dict[int, int] = {}
+
+
+class ContextBudgetError(Exception):
+    pass
+
+
+def approximate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _load(spec: str):
+    if spec not in _loaded:
+        module, _, name = spec.partition(":")
+        _loaded[spec] = getattr(importlib.import_module(module), name)
+    return _loaded[spec]
+
+
+def default_tokenizer():
+    return _load(CHAT_TOKENIZER) if CHAT_TOKENIZER else approximate_tokens
+
+
+def llm_summarizer(previous_summary: str | None, messages: list[dict]) -> str:
+    """Summarize with the shared upstream client, from a job worker thread"""
+    from core import llm
+
+    transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    message = llm.run_sync(
+        llm.create_message,
+        max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+        system=SUMMARY_SYSTEM_PROMPT,
+        messages=[
+            {
+                "role": "user",
+                "content": (
+                    f"<summary>\n{previous_summary or ''}\n</summary>\n\n"
+                    f"<new_turns>\n{transcript}\n</new_turns>"
+                ),
+            }
+        ],
+    )
+    return "".join(block.text for block in message.content if block.type == "text")
+
+
+def default_summarizer():
+    """
+    CHAT_SUMMARIZER if set, else the upstream model when one is configured,
+    else None to only drop old turns
+    """
+    if CHAT_SUMMARIZER:
+        return _load(CHAT_SUMMARIZER)
+    from core import llm
+
+    return llm_summarizer if llm.llm_enabled() else None
+
+
+def count_prefix_tokens(prefix: str, tokenizer=None) -> int:
+    tokenizer = tokenizer or default_tokenizer()
+    key = hash((prefix, tokenizer))
+    if key not in _prefix_tokens:
+        if len(_prefix_tokens) >= PREFIX_CACHE_SIZE:
+            _prefix_tokens.clear()
+        _prefix_tokens[key] = tokenizer(prefix) if prefix else 0
+    return _prefix_tokens[key]
+
+
+def chat_topics(chat_id: int, user_id: int) -> list[str]:
+    """Pub/sub topics a chat's events go to: the chat, its owner and all chats"""
+    return [f"chat:{chat_id}", f"user:{user_id}", "chats"]
+
+
+def add_message(chat_id: int, role: str, content: str, tokenizer=None) -> dict:
+    """Store a chat turn with its token count and publish it"""
+    token_count = (tokenizer or default_tokenizer())(content)
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO chat_messages (chat_id, role, content, token_count)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+                """,
+                (chat_id, role, content, token_count),
+            )
+            message_id = cur.fetchone()[0]  # type: ignore
+            cur.execute(
+                "UPDATE chats SET last_updated_at = now() WHERE id = %s RETURNING user_id",
+                (chat_id,),
+            )
+            user_id = cur.fetchone()[0]  # type: ignore
+            conn.commit()
+    try:
+        pubsub.publish_sync(
+            chat_topics(chat_id, user_id),
+            {
+                "type": "message",
+                "chat_id": chat_id,
+                "user_id": user_id,
+                "message_id": message_id,
+                "role": role,
+                "content": content,
+            },
+        )
+    except Exception as e:
+        # Live views resync on their own, the message is stored
+        print(f"Error publishing chat message {message_id}: {e}")
+    return {"id": message_id, "user_id": user_id, "token_count": token_count}
+
+
+def plan_context(messages: list[dict], available: int) -> tuple[list[dict], list[dict]]:
+    """
+    Split messages (oldest first, each with role and token_count) into the
+    newest ones fitting in available tokens and the older rest. The window
+    starts on a user turn, as the model expects.
+    """
+    used = 0
+    start = len(messages)
+    while start > 0 and used + messages[start - 1]["token_count"] <= available:
+        start -= 1
+        used += messages[start]["token_count"]
+    while start < len(messages) and messages[start]["role"] != "user":
+        start += 1
+    return messages[start:], messages[:start]
+
+
+def _load_history(cur, chat_id: int) -> tuple[dict, list[dict]]:
+    """The chat's summary fields and the messages the summary does not cover"""
+    cur.execute(
+        """
+        SELECT summary, summary_through, summary_token_count
+        FROM chats
+        WHERE id = %s
+        """,
+        (chat_id,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise ContextBudgetError(f"Chat {chat_id} does not exist")
+    chat = {
+        "summary": row[0],
+        "summary_through": row[1],
+        "summary_token_count": row[2],
+    }
+    cur.execute(
+        """
+        SELECT id, role, content, token_count
+        FROM chat_messages
+        WHERE chat_id = %s AND id > %s
+        ORDER BY id
+        """,
+        (chat_id, chat["summary_through"]),
+    )
+    messages = [
+        {"id": r[0], "role": r[1], "content": r[2], "token_count": r[3]}
+        for r in cur.fetchall()
+    ]
+    return chat, messages
+
+
+def request_summary(chat_id: int) -> bool:
+    """Queue a summarize_chat job unless one was requested recently"""
+    if default_summarizer() is None:
+        return False
+    # Lazy: the job queue imports the handlers, which import this module
+    from core.jobs import enqueue
+
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE chats SET summary_requested_at = now()
+                WHERE id = %s
+                  AND (summary_requested_at IS NULL OR summary_requested_at < %s)
+                RETURNING id
+                """,
+                (chat_id, datetime.utcnow() - SUMMARY_RETRY_AFTER),
+            )
+            requested = cur.fetchone() is not None
+            conn.commit()
+    if requested:
+        enqueue("summarize_chat", {"chat_id": chat_id})
+    return requested
+
+
+def build_request(
+    chat_id: int,
+    prefix: str = "",
+    extra_tokens: int = 0,
+    budget: int = CHAT_CONTEXT_TOKENS,
+    tokenizer=None,
+) -> dict:
+    """
+    System prompt and messages for the next model call of a chat, within
+    budget. extra_tokens covers anything the caller adds on top, such as
+    retrieved document chunks.
+    """
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            chat, messages = _load_history(cur, chat_id)
+        conn.rollback()
+
+    fixed = count_prefix_tokens(prefix, tokenizer) + chat["summary_token_count"]
+    available = budget - CHAT_RESPONSE_TOKENS - extra_tokens - fixed
+    if available <= 0:
+        raise ContextBudgetError(
+            f"Prefix and summary use {fixed} tokens, nothing is left for the chat"
+        )
+
+    window, older = plan_context(messages, available)
+    if not window and messages:
+        raise ContextBudgetError("The latest message alone does not fit the budget")
+
+    # Summarize ahead of need, before turns start dropping out of the window.
+    # Turns that do drop out are missing until the summary catches up.
+    _, beyond_recent = plan_context(messages, CHAT_RECENT_TOKENS)
+    if older or sum(m["token_count"] for m in beyond_recent) >= CHAT_SUMMARY_TRIGGER_TOKENS:
+        request_summary(chat_id)
+
+    system = prefix
+    if chat["summary"]:
+        system += (
+            "\n\n<conversation_summary>\n"
+            f"{chat['summary']}\n"
+            "</conversation_summary>"
+        )
+    return {
+        "system": system,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in window],
+        "input_tokens": fixed + sum(m["token_count"] for m in window),
+        "omitted_messages": len(older),
+    }
+
+
+def summarize_chat(chat_id: int, tokenizer=None, summarizer=None) -> dict:
+    """
+    Fold the turns older than the newest CHAT_RECENT_TOKENS into the chat's
+    summary, CHAT_SUMMARY_INPUT_TOKENS at a time
+    """
+    tokenizer = tokenizer or default_tokenizer()
+    summarizer = summarizer or default_summarizer()
+    if summarizer is None:
+        return {"summarized": 0}
+
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            chat, messages = _load_history(cur, chat_id)
+        conn.rollback()
+
+    _, older = plan_context(messages, CHAT_RECENT_TOKENS)
+    # plan_context starts the recent window on a user turn, so older ends on
+    # a complete exchange
+    summary = chat["summary"]
+    through = chat["summary_through"]
+    summarized = 0
+    while summarized < len(older):
+        batch = []
+        batch_tokens = 0
+        for message in older[summarized:]:
+            if batch and batch_tokens + message["token_count"] > CHAT_SUMMARY_INPUT_TOKENS:
+                break
+            batch.append(message)
+            batch_tokens += message["token_count"]
+        summary = summarizer(
+            summary, [{"role": m["role"], "content": m["content"]} for m in batch]
+        )
+        summarized += len(batch)
+        through = batch[-1]["id"]
+
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            # Only if nobody summarized this chat meanwhile
+            cur.execute(
+                """
+                UPDATE chats
+                SET summary = %s, summary_through = %s, summary_token_count = %s,
+                    summary_requested_at = NULL
+                WHERE id = %s AND summary_through = %s
+                """,
+                (
+                    summary,
+                    through,
+                    tokenizer(summary) if summary else 0,
+                    chat_id,
+                    chat["summary_through"],
+                ),
+            )
+            conn.commit()
+    return {"summarized": summarized, "summary_through": through}
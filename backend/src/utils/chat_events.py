@@ -0,0 +1,64 @@
+"""
+Live events of the chat path, for admins watching client chats.
+
+A streamed reply is published while it is generated: reply_started, then
+reply_delta events with the text produced since the last one (coalesced to
+one per CHAT_LIVE_FLUSH_MS, so a long reply is a few dozen NOTIFYs rather
+than one per token), then the stored message from add_message. Watchers
+render the deltas and replace them with the message once it arrives.
+"""
+
+import asyncio
+import os
+import time
+
+from dotenv import load_dotenv
+
+from core import llm, pubsub
+from utils.chat_context import CHAT_RESPONSE_TOKENS, add_message, chat_topics
+
+load_dotenv()
+
+CHAT_LIVE_FLUSH_MS = int(os.getenv("CHAT_LIVE_FLUSH_MS", "150"))
+
+
+async def _publish(topics: list[str], event: dict):
+    try:
+        await pubsub.publish(topics, event)
+    except Exception as e:
+        # Watching is best effort and must not break the client's reply
+        print(f"Error publishing chat event: {e}")
+
+
+async def stream_reply(
+    chat_id: int, user_id: int, request: dict, max_tokens: int = CHAT_RESPONSE_TOKENS
+):
+    """
+    Yield the model's reply to a request from build_request, publishing it
+    live, and store it as the chat's next assistant turn
+    """
+    topics = chat_topics(chat_id, user_id)
+    await _publish(topics, {"type": "reply_started", "chat_id": chat_id, "user_id": user_id})
+
+    parts: list[str] = []
+    pending: list[str] = []
+    last_flush = time.monotonic()
+    async for text in llm.stream_text(
+        system=request["system"], messages=request["messages"], max_tokens=max_tokens
+    ):
+        parts.append(text)
+        pending.append(text)
+        if time.monotonic() - last_flush >= CHAT_LIVE_FLUSH_MS / 1000:
+            await _publish(
+                topics, {"type": "reply_delta", "chat_id": chat_id, "text": "".join(pending)}
+            )
+            pending.clear()
+            last_flush = time.monotonic()
+        yield text
+
+    if pending:
+        await _publish(
+            topics, {"type": "reply_delta", "chat_id": chat_id, "text": "".join(pending)}
+        )
+    # Publishes the finished message
+    await asyncio.to_thread(add_message, chat_id, "assistant", "".join(parts))
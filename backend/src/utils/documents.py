@@ -0,0 +1,497 @@
+"""
+Documents for chat-docs: streamed ingestion and BM25 retrieval.
+
+Uploads are parsed as they arrive, decoded incrementally and cut into
+chunks of about DOCUMENT_CHUNK_WORDS words, preferring paragraph breaks.
+Chunks are written in batches with COPY, and each batch updates the corpus
+statistics BM25 needs (document_terms, document_index_stats) in the same
+transaction. The index therefore grows and shrinks with every upload and
+delete, and is never rebuilt.
+
+retrieve() answers any number of queries in one statement, scoring chunks
+with BM25 over the GIN-indexed tsvectors. If DOCUMENT_EMBEDDER names a local
+embedding function ("module:function", texts in, vectors out), chunks are
+embedded at ingestion, all queries are embedded in one call, and the BM25
+candidates are reranked by fusing both rankings. build_context() then puts
+only the best chunks in the prompt, within a fixed size budget, whatever
+the size of the documents.
+"""
+
+import asyncio
+import codecs
+import importlib
+import math
+import os
+import re
+
+from dotenv import load_dotenv
+from psycopg.rows import dict_row
+
+from core.database import get_db_connection, stream_rows
+from utils.onboarding import FilePart
+
+load_dotenv()
+
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+DOCUMENT_CHUNK_WORDS = int(os.getenv("DOCUMENT_CHUNK_WORDS", "200"))
+# Words repeated at the start of the next chunk when a chunk has to be cut
+# mid-paragraph
+DOCUMENT_CHUNK_OVERLAP_WORDS = int(os.getenv("DOCUMENT_CHUNK_OVERLAP_WORDS", "40"))
+DOCUMENT_BATCH_CHUNKS = int(os.getenv("DOCUMENT_BATCH_CHUNKS", "200"))
+DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "5"))
+DOCUMENT_CONTEXT_MAX_CHARS = int(os.getenv("DOCUMENT_CONTEXT_MAX_CHARS", "12000"))
+# Local embedding function as "module:function", empty for BM25 only
+DOCUMENT_EMBEDDER = os.getenv("DOCUMENT_EMBEDDER", "")
+
+DOCUMENT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst", ".csv")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms found in more than this share of chunks do not select candidates:
+# they barely change the ranking but would make every chunk a match
+BM25_MAX_TERM_SHARE = 0.5
+# Candidates fetched per query and result when reranking with embeddings
+RERANK_FACTOR = 4
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+_PARAGRAPH = "\n\n"
+# Words and paragraph breaks
+_TOKEN = re.compile(r"\n[ \t\r\f\v]*\n\s*|\S+")
+# Trailing whitespace and partial word, kept until more text arrives
+_TAIL = re.compile(r"\s*\S*\Z")
+
+_embed_fn = None
+
+
+class DocumentError(Exception):
+    pass
+
+
+def _check_filename(filename: str):
+    if not filename.lower().endswith(DOCUMENT_EXTENSIONS):
+        raise DocumentError(
+            f"Only text files can be indexed ({', '.join(DOCUMENT_EXTENSIONS)}), "
+            "convert the document to text and upload that"
+        )
+
+
+def embedder():
+    """The configured embedding function, or None"""
+    global _embed_fn
+    if not DOCUMENT_EMBEDDER:
+        return None
+    if _embed_fn is None:
+        module, _, name = DOCUMENT_EMBEDDER.partition(":")
+        _embed_fn = getattr(importlib.import_module(module), name)
+    return _embed_fn
+
+
+def embed(texts: list[str]) -> list[list[float]]:
+    """Embed texts in one call, scaled to unit length so dot product is cosine"""
+    vectors = []
+    for vector in embedder()(texts):  # type: ignore
+        vector = [float(x) for x in vector]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        vectors.append([x / norm for x in vector])
+    return vectors
+
+
+class _Chunker:
+    """Incremental text splitter yielding (content, word count) chunks"""
+
+    def __init__(
+        self,
+        words: int = DOCUMENT_CHUNK_WORDS,
+        overlap: int = DOCUMENT_CHUNK_OVERLAP_WORDS,
+    ):
+        self.words = words
+        self.overlap = overlap
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._tail = ""
+        self._tokens: list[str] = []
+        self._count = 0
+
+    def feed(self, data: bytes, final: bool = False) -> list[tuple[str, int]]:
+        text = self._tail + self._decoder.decode(data, final)
+        if "\x00" in text:
+            raise DocumentError("Binary files cannot be indexed, upload a text file")
+        end = len(text) if final else _TAIL.search(text).start()  # type: ignore
+        text, self._tail = text[:end], text[end:]
+
+        chunks = []
+        for token in _TOKEN.findall(text):
+            if token.isspace():
+                if self._tokens and self._tokens[-1] != _PARAGRAPH:
+                    self._tokens.append(_PARAGRAPH)
+                continue
+            self._tokens.append(token)
+            self._count += 1
+            if self._count >= self.words:
+                chunks.append(self._cut())
+        if final and self._count:
+            chunks.append(self._take(len(self._tokens), []))
+        return chunks
+
+    def _cut(self) -> tuple[str, int]:
+        # End on the last paragraph break in the second half if there is one
+        words = 0
+        best = None
+        for index, token in enumerate(self._tokens):
+            if token == _PARAGRAPH:
+                if words >= self.words // 2:
+                    best = index
+            else:
+                words += 1
+        if best is not None:
+            return self._take(best, self._tokens[best + 1 :])
+        overlap = [t for t in self._tokens if t != _PARAGRAPH][-self.overlap :]
+        return self._take(len(self._tokens), overlap if self.overlap else [])
+
+    def _take(self, end: int, rest: list[str]) -> tuple[str, int]:
+        tokens = self._tokens[:end]
+        while tokens and tokens[-1] == _PARAGRAPH:
+            tokens.pop()
+        words = sum(1 for t in tokens if t != _PARAGRAPH)
+        content = " ".join(tokens).replace(f" {_PARAGRAPH} ", _PARAGRAPH)
+        self._tokens = rest
+        self._count = sum(1 for t in rest if t != _PARAGRAPH)
+        return content, words
+
+
+def _create_document(title: str, filename: str | None, uploaded_by: int | None) -> int:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO documents (title, filename, uploaded_by)
+                VALUES (%s, %s, %s)
+                RETURNING id
+                """,
+                (title, filename, uploaded_by),
+            )
+            document_id = cur.fetchone()[0]  # type: ignore
+            conn.commit()
+    return document_id
+
+
+def _write_chunks(document_id: int, start: int, chunks: list[tuple[str, int]]) -> int:
+    """Index a batch of chunks, return the position after the last one"""
+    embeddings = (
+        embed([content for content, _ in chunks]) if embedder() else [None] * len(chunks)
+    )
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            # Taken first, so concurrent batches queue here instead of
+            # deadlocking on document_terms
+            cur.execute(
+                """
+                UPDATE document_index_stats
+                SET chunk_count = chunk_count + %s, total_length = total_length + %s
+                WHERE id = 1
+                """,
+                (len(chunks), sum(words for _, words in chunks)),
+            )
+            with cur.copy(
+                """
+                COPY document_chunks (document_id, position, content, length, embedding)
+                FROM STDIN
+                """
+            ) as copy:
+                for offset, ((content, words), embedding) in enumerate(
+                    zip(chunks, embeddings)
+                ):
+                    copy.write_row((document_id, start + offset, content, words, embedding))
+            cur.execute(
+                """
+                INSERT INTO document_terms (lexeme, chunk_count)
+                SELECT v.lexeme, count(*)
+                FROM document_chunks c
+                CROSS JOIN LATERAL unnest(c.search_vector) AS v(lexeme, positions, weights)
+                WHERE c.document_id = %s AND c.position >= %s
+                GROUP BY v.lexeme
+                ORDER BY v.lexeme
+                ON CONFLICT (lexeme)
+                DO UPDATE SET chunk_count = document_terms.chunk_count + excluded.chunk_count
+                """,
+                (document_id, start),
+            )
+            cur.execute(
+                "UPDATE documents SET chunk_count = %s WHERE id = %s",
+                (start + len(chunks), document_id),
+            )
+            conn.commit()
+    return start + len(chunks)
+
+
+def _discard_chunks(cur, document_id: int):
+    """Remove a document's chunks and their share of the corpus statistics"""
+    cur.execute(
+        """
+        UPDATE document_index_stats s
+        SET chunk_count = s.chunk_count - c.chunks,
+            total_length = s.total_length - c.length
+        FROM (
+            SELECT count(*) AS chunks, coalesce(sum(length), 0) AS length
+            FROM document_chunks
+            WHERE document_id = %s
+        ) c
+        WHERE s.id = 1
+        """,
+        (document_id,),
+    )
+    cur.execute(
+        """
+        UPDATE document_terms t
+        SET chunk_count = t.chunk_count - d.chunks
+        FROM (
+            SELECT v.lexeme, count(*) AS chunks
+            FROM document_chunks c
+            CROSS JOIN LATERAL unnest(c.search_vector) AS v(lexeme, positions, weights)
+            WHERE c.document_id = %s
+            GROUP BY v.lexeme
+        ) d
+        WHERE t.lexeme = d.lexeme
+        RETURNING t.lexeme, t.chunk_count
+        """,
+        (document_id,),
+    )
+    unused = [lexeme for lexeme, chunk_count in cur.fetchall() if chunk_count <= 0]
+    if unused:
+        cur.execute("DELETE FROM document_terms WHERE lexeme = ANY(%s)", (unused,))
+    cur.execute("DELETE FROM document_chunks WHERE document_id = %s", (document_id,))
+
+
+def _finish_document(document_id: int, size: int):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE documents SET status = 'ready', bytes = %s WHERE id = %s",
+                (size, document_id),
+            )
+            conn.commit()
+
+
+def _fail_document(document_id: int, error: str):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            _discard_chunks(cur, document_id)
+            cur.execute(
+                """
+                UPDATE documents SET status = 'failed', error = %s, chunk_count = 0
+                WHERE id = %s
+                """,
+                (error, document_id),
+            )
+            conn.commit()
+
+
+async def ingest_document(
+    chunks, boundary: bytes, title: str | None = None, uploaded_by: int | None = None
+) -> dict:
+    """
+    Index the text file in a multipart body while it is being received.
+    A document that fails half way is marked failed and leaves nothing in
+    the index.
+    """
+    part = FilePart(boundary, max_size=DOCUMENT_MAX_BYTES, check_filename=_check_filename)
+    chunker = _Chunker()
+    document_id = None
+    position = 0
+    size = 0
+    batch: list[tuple[str, int]] = []
+
+    try:
+        async for data in chunks:
+            for piece in part.feed(data):
+                if document_id is None:
+                    document_id = await asyncio.to_thread(
+                        _create_document, title or part.filename, part.filename, uploaded_by
+                    )
+                size += len(piece)
+                batch.extend(chunker.feed(piece))
+                if len(batch) >= DOCUMENT_BATCH_CHUNKS:
+                    position = await asyncio.to_thread(
+                        _write_chunks, document_id, position, batch
+                    )
+                    batch = []
+
+        if not part.found:
+            raise DocumentError("No file found in the upload")
+        batch.extend(chunker.feed(b"", final=True))
+        if batch and document_id is not None:
+            position = await asyncio.to_thread(_write_chunks, document_id, position, batch)
+        if not position:
+            raise DocumentError("The file contains no text")
+        await asyncio.to_thread(_finish_document, document_id, size)
+    except BaseException as e:
+        if document_id is not None:
+            print(f"Indexing document {document_id} failed: {e!r}")
+            # Shielded: a client that went away must still not leave a
+            # half indexed document behind
+            await asyncio.shield(
+                asyncio.to_thread(_fail_document, document_id, str(e) or type(e).__name__)
+            )
+        raise
+
+    return {
+        "document_id": document_id,
+        "title": title or part.filename,
+        "chunks": position,
+        "bytes": size,
+    }
+
+
+def delete_document(document_id: int) -> bool:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            _discard_chunks(cur, document_id)
+            cur.execute("DELETE FROM documents WHERE id = %s RETURNING id", (document_id,))
+            deleted = cur.fetchone() is not None
+            conn.commit()
+    return deleted
+
+
+def list_documents():
+    return stream_rows(
+        """
+        SELECT id, title, filename, bytes, chunk_count, status, error,
+               uploaded_by, created_at
+        FROM documents
+        ORDER BY id DESC
+        """
+    )
+
+
+# One row per (query, chunk): per-query BM25 over the lexemes the query
+# shares with the index, candidates found through the GIN index
+_RETRIEVE_QUERY = r"""
+WITH stats AS (
+    SELECT chunk_count AS n,
+           greatest(total_length::float8 / nullif(chunk_count, 0), 1) AS avg_length
+    FROM document_index_stats
+    WHERE id = 1
+),
+queries AS (
+    SELECT q.n AS query_no, q.text
+    FROM unnest(%(queries)s::text[]) WITH ORDINALITY AS q(text, n)
+),
+terms AS (
+    SELECT DISTINCT q.query_no, l.lexeme,
+           ln(1 + (s.n - t.chunk_count + 0.5) / (t.chunk_count + 0.5)) AS idf
+    FROM queries q
+    CROSS JOIN LATERAL unnest(tsvector_to_array(to_tsvector('simple', q.text))) AS l(lexeme)
+    JOIN document_terms t ON t.lexeme = l.lexeme
+    CROSS JOIN stats s
+    WHERE t.chunk_count <= greatest(s.n * %(max_share)s, 10)
+),
+matches AS (
+    SELECT query_no,
+           array_to_string(
+               array_agg('''' || replace(replace(lexeme, '\', '\\'), '''', '''''') || ''''),
+               ' | '
+           )::tsquery AS tsq
+    FROM terms
+    GROUP BY query_no
+)
+SELECT m.query_no, c.id, c.document_id, d.title, c.position, c.content,
+       c.embedding, r.score
+FROM matches m
+CROSS JOIN LATERAL (
+    SELECT ch.id,
+           sum(
+               t.idf * array_length(v.positions, 1) * (%(k1)s + 1)
+               / (array_length(v.positions, 1)
+                  + %(k1)s * (1 - %(b)s + %(b)s * ch.length / s.avg_length))
+           ) AS score
+    FROM document_chunks ch
+    JOIN documents doc ON doc.id = ch.document_id AND doc.status = 'ready'
+    CROSS JOIN stats s
+    CROSS JOIN LATERAL unnest(ch.search_vector) AS v(lexeme, positions, weights)
+    JOIN terms t ON t.query_no = m.query_no AND t.lexeme = v.lexeme
+    WHERE ch.search_vector @@ m.tsq
+      AND (%(document_ids)s::int[] IS NULL OR ch.document_id = ANY(%(document_ids)s::int[]))
+    GROUP BY ch.id
+    ORDER BY score DESC
+    LIMIT %(limit)s
+) r
+JOIN document_chunks c ON c.id = r.id
+JOIN documents d ON d.id = c.document_id
+ORDER BY m.query_no, r.score DESC
+"""
+
+
+def _rerank(query_vector: list[float], hits: list[dict]) -> list[dict]:
+    """Fuse the BM25 ranking with embedding similarity by reciprocal rank"""
+    similarities = [
+        sum(map(float.__mul__, query_vector, hit["embedding"]))
+        if hit["embedding"]
+        else -1.0
+        for hit in hits
+    ]
+    by_similarity = sorted(range(len(hits)), key=lambda i: similarities[i], reverse=True)
+    fused = [1 / (RRF_K + rank) for rank in range(1, len(hits) + 1)]
+    for rank, index in enumerate(by_similarity, start=1):
+        if similarities[index] >= 0:
+            fused[index] += 1 / (RRF_K + rank)
+    order = sorted(range(len(hits)), key=lambda i: fused[i], reverse=True)
+    return [hits[i] for i in order]
+
+
+def retrieve(
+    queries: list[str],
+    k: int = DOCUMENT_TOP_K,
+    document_ids: list[int] | None = None,
+) -> list[list[dict]]:
+    """
+    Top k chunks for each query, best first, all queries in one round trip.
+    Restricted to document_ids when given.
+    """
+    if not queries:
+        return []
+    rerank = embedder() is not None
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                _RETRIEVE_QUERY,  # type: ignore
+                {
+                    "queries": queries,
+                    "document_ids": document_ids,
+                    "limit": k * RERANK_FACTOR if rerank else k,
+                    "max_share": BM25_MAX_TERM_SHARE,
+                    "k1": BM25_K1,
+                    "b": BM25_B,
+                },
+            )
+            rows = cur.fetchall()
+
+    results: list[list[dict]] = [[] for _ in queries]
+    for row in rows:
+        results[row.pop("query_no") - 1].append(row)
+
+    if rerank:
+        for query_vector, (index, hits) in zip(embed(queries), enumerate(results)):
+            results[index] = _rerank(query_vector, hits)
+
+    for hits in results:
+        del hits[k:]
+        for hit in hits:
+            hit.pop("embedding")
+    return results
+
+
+def build_context(hits: list[dict], max_chars: int = DOCUMENT_CONTEXT_MAX_CHARS) -> str:
+    """The chunks for the prompt, best first, cut off at max_chars"""
+    parts = []
+    used = 0
+    for hit in hits:
+        part = (
+            f'<source title="{hit["title"]}" part="{hit["position"] + 1}">\n'
+            f'{hit["content"]}\n</source>'
+        )
+        if used + len(part) > max_chars:
+            break
+        parts.append(part)
+        used += len(part) + 1
+    return "\n".join(parts)
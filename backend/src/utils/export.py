@@ -0,0 +1,171 @@
+"""
+Table exports streamed straight out of COPY ... TO STDOUT.
+
+Postgres formats the rows (CSV, or one JSON object per line for NDJSON) and
+psycopg hands the output over in chunks as it arrives, which are written to
+the HTTP response or a file, optionally gzipped on the way. Nothing is
+buffered beyond one chunk, so memory use does not depend on table size.
+"""
+
+import zlib
+
+from psycopg import sql
+
+from core.database import get_async_db_connection, get_db_connection
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Exportable datasets: the columns that may be selected (first = default
+# order) and the filters, as filter name -> (column, operator).
+# password_hash is deliberately absent.
+EXPORTS = {
+    "users": {
+        "table": "users",
+        "columns": (
+            "id",
+            "full_name",
+            "email",
+            "status",
+            "group_id",
+            "created_at",
+            "last_login_at",
+            "login_count",
+        ),
+        "filters": {
+            "status": ("status", "="),
+            "group_id": ("group_id", "="),
+            "since": ("created_at", ">="),
+            "until": ("created_at", "<"),
+            "active_since": ("last_login_at", ">="),
+        },
+    },
+    "chats": {
+        "table": "chats",
+        "columns": ("id", "user_id", "title", "created_at", "last_updated_at"),
+        "filters": {
+            "user_id": ("user_id", "="),
+            "since": ("created_at", ">="),
+            "until": ("created_at", "<"),
+        },
+    },
+    "artifacts": {
+        "table": "artifacts",
+        "columns": (
+            "id",
+            "variable_name",
+            "is_preprompt",
+            "current_version",
+            "content_length",
+            "created_at",
+            "last_updated_at",
+        ),
+        "filters": {
+            "is_preprompt": ("is_preprompt", "="),
+            "since": ("last_updated_at", ">="),
+            "until": ("last_updated_at", "<"),
+        },
+    },
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def build_export_query(
+    dataset: str,
+    columns: list[str] | None = None,
+    filters: dict | None = None,
+    fmt: str = "csv",
+) -> tuple[sql.Composed, list]:
+    """COPY statement and its parameters for a dataset, validated against EXPORTS"""
+    spec = EXPORTS.get(dataset)
+    if spec is None:
+        raise ExportError(f"dataset must be one of {', '.join(EXPORTS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    columns = columns or list(spec["columns"])
+    unknown = [c for c in columns if c not in spec["columns"]]
+    if unknown:
+        raise ExportError(
+            f"Unknown columns for {dataset}: {', '.join(unknown)}. "
+            f"Available: {', '.join(spec['columns'])}"
+        )
+
+    conditions = []
+    params = []
+    for name, value in (filters or {}).items():
+        if name not in spec["filters"]:
+            raise ExportError(
+                f"Unknown filter for {dataset}: {name}. "
+                f"Available: {', '.join(spec['filters'])}"
+            )
+        column, operator = spec["filters"][name]
+        conditions.append(
+            sql.SQL("{} {} %s").format(sql.Identifier(column), sql.SQL(operator))
+        )
+        params.append(value)
+
+    select = sql.SQL("SELECT {columns} FROM {table}{where} ORDER BY id").format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        table=sql.Identifier(spec["table"]),
+        where=(
+            sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+            if conditions
+            else sql.SQL("")
+        ),
+    )
+
+    if fmt == "csv":
+        query = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(select)
+    else:
+        # row_to_json never emits raw newlines or control characters, so CSV
+        # with quote and delimiter characters that cannot occur passes each
+        # JSON object through unescaped, one per line
+        query = sql.SQL(
+            "COPY (SELECT row_to_json(t) FROM ({}) t) TO STDOUT "
+            "WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')"
+        ).format(select)
+    return query, params
+
+
+def _gzip():
+    return zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+
+async def stream_export(query, params: list, compress: bool = False):
+    """Yield the COPY output chunk by chunk, gzipped if compress is set"""
+    compressor = _gzip() if compress else None
+    async with await get_async_db_connection() as conn:
+        async with conn.cursor() as cur:
+            async with cur.copy(query, params) as copy:
+                async for data in copy:
+                    chunk = bytes(data)
+                    if compressor:
+                        chunk = compressor.compress(chunk)
+                    if chunk:
+                        yield chunk
+        # COPY TO opened a transaction, nothing to keep
+        await conn.rollback()
+    if compressor:
+        yield compressor.flush()
+
+
+def export_to_file(query, params: list, path: str, compress: bool = False) -> int:
+    """Write the COPY output to path and return the number of bytes written"""
+    compressor = _gzip() if compress else None
+    written = 0
+    with open(path, "wb") as f:
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                with cur.copy(query, params) as copy:
+                    for data in copy:
+                        chunk = bytes(data)
+                        if compressor:
+                            chunk = compressor.compress(chunk)
+                        written += f.write(chunk)
+            conn.rollback()
+        if compressor:
+            written += f.write(compressor.flush())
+    return written
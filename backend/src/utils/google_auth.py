@@ -0,0 +1,162 @@
+"""
+Google sign-in with locally cached signing certificates.
+
+Google ID tokens are verified against the certificates published at
+GOOGLE_CERTS_URL. They are fetched once at warm-up and then refreshed in the
+background when their Cache-Control max-age runs out, so the login path
+only does local signature checks and never waits on the network. A token
+signed with a key id we do not know yet wakes the refresher early, which
+covers Google rotating keys before our copy expires.
+
+Point GOOGLE_CERTS_URL and GOOGLE_ISSUERS at a local key server to test
+without Google.
+"""
+
+import asyncio
+import os
+import re
+
+import requests
+from dotenv import load_dotenv
+from google.auth import exceptions as google_exceptions
+from google.auth import jwt as google_jwt
+
+from core import lifecycle
+
+load_dotenv()
+
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
+GOOGLE_CERTS_URL = os.getenv(
+    "GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs"
+)
+GOOGLE_ISSUERS = tuple(
+    os.getenv(
+        "GOOGLE_ISSUERS", "accounts.google.com,https://accounts.google.com"
+    ).split(",")
+)
+GOOGLE_CLOCK_SKEW_SECONDS = int(os.getenv("GOOGLE_CLOCK_SKEW_SECONDS", "10"))
+
+# Refresh this long before the certificates expire
+CERTS_REFRESH_MARGIN_SECONDS = 300
+# Bounds on the refresh interval, whatever the cache headers say
+CERTS_MIN_REFRESH_SECONDS = 60
+CERTS_MAX_REFRESH_SECONDS = 6 * 60 * 60
+CERTS_FETCH_TIMEOUT_SECONDS = 5
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+# kid -> PEM certificate, replaced as a whole on every refresh
+_certs: dict[str, str] = {}
+_refresh_now: asyncio.Event | None = None
+_refresher: asyncio.Task | None = None
+
+
+class GoogleAuthError(Exception):
+    pass
+
+
+class GoogleAuthUnavailable(Exception):
+    """No signing certificates have been loaded yet"""
+
+
+def google_enabled() -> bool:
+    return bool(GOOGLE_CLIENT_ID)
+
+
+def _fetch_certs() -> tuple[dict, float]:
+    """Download the certificates, return them with their lifetime in seconds"""
+    response = requests.get(GOOGLE_CERTS_URL, timeout=CERTS_FETCH_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    certs = response.json()
+    if not isinstance(certs, dict) or not certs:
+        raise ValueError("Certificate endpoint returned no certificates")
+
+    match = _MAX_AGE.search(response.headers.get("Cache-Control", ""))
+    max_age = int(match.group(1)) if match else CERTS_MIN_REFRESH_SECONDS
+    max_age -= int(response.headers.get("Age", "0") or 0)
+    return certs, max_age
+
+
+async def refresh_certs() -> float:
+    """Fetch the certificates once, return seconds until the next refresh"""
+    global _certs
+    try:
+        certs, max_age = await asyncio.to_thread(_fetch_certs)
+    except Exception as e:
+        print(f"Failed to refresh Google certificates: {e}")
+        return CERTS_MIN_REFRESH_SECONDS
+
+    _certs = certs
+    return min(
+        CERTS_MAX_REFRESH_SECONDS,
+        max(CERTS_MIN_REFRESH_SECONDS, max_age - CERTS_REFRESH_MARGIN_SECONDS),
+    )
+
+
+async def _refresh_loop(delay: float):
+    loop = asyncio.get_running_loop()
+    last_refresh = loop.time()
+    while True:
+        try:
+            await asyncio.wait_for(_refresh_now.wait(), timeout=delay)  # type: ignore
+        except asyncio.TimeoutError:
+            pass
+        else:
+            # Key ids come from untrusted tokens, early refreshes are rate limited
+            await asyncio.sleep(
+                max(0.0, last_refresh + CERTS_MIN_REFRESH_SECONDS - loop.time())
+            )
+        _refresh_now.clear()  # type: ignore
+        last_refresh = loop.time()
+        delay = await refresh_certs()
+
+
+@lifecycle.on_warm_up
+async def start_cert_refresher():
+    global _refresh_now, _refresher
+    if not google_enabled():
+        return
+    _refresh_now = asyncio.Event()
+    delay = await refresh_certs()
+    _refresher = asyncio.create_task(_refresh_loop(delay))
+
+
+@lifecycle.on_shutdown
+def stop_cert_refresher():
+    if _refresher is not None:
+        _refresher.cancel()
+
+
+def verify_google_id_token(token: str) -> dict:
+    """
+    Verify a Google ID token against the cached certificates and return its
+    claims. Only tokens for GOOGLE_CLIENT_ID with a verified email pass.
+    """
+    if not _certs:
+        raise GoogleAuthUnavailable("Google sign-in is not available right now")
+
+    try:
+        header = google_jwt.decode_header(token)
+    except Exception:
+        raise GoogleAuthError("Malformed ID token")
+    if header.get("kid") not in _certs:
+        # Google may have rotated keys before our copy expired
+        if _refresh_now is not None:
+            _refresh_now.set()
+        raise GoogleAuthError("ID token is signed with an unknown key, try again")
+
+    try:
+        claims = google_jwt.decode(
+            token,
+            certs=_certs,
+            audience=GOOGLE_CLIENT_ID,
+            clock_skew_in_seconds=GOOGLE_CLOCK_SKEW_SECONDS,
+        )
+    except (ValueError, google_exceptions.GoogleAuthError) as e:
+        raise GoogleAuthError(f"Invalid ID token: {e}")
+
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise GoogleAuthError("ID token was not issued by Google")
+    if not claims.get("email") or not claims.get("email_verified"):
+        raise GoogleAuthError("Google account has no verified email")
+    return claims
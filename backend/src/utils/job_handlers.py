@@ -0,0 +1,105 @@
+"""
+Handlers for the background job queue (core/jobs.py).
+Importing this module registers them; both the in-app worker and
+`python -m cli worker` do so before starting.
+"""
+
+import psycopg
+
+from core.database import get_db_connection
+from core.jobs import job_handler
+from utils import chat_context
+from utils.auth import get_password_hash
+from utils.sharing import refresh_user_visibility
+from utils.users import generate_password
+
+# Rows handled per transaction by the bulk handlers
+BATCH_SIZE = 100
+
+
+# Not retried: passwords of users created before a failure would be lost
+@job_handler("create_users", concurrency=2, max_attempts=1)
+def create_users(job: dict, progress) -> dict:
+    """
+    Create client users with generated passwords. Users that already exist
+    are reported, not recreated. The passwords are returned under "secrets",
+    handed out once by the job status endpoint and scrubbed after
+    JOB_SECRETS_TTL_SECONDS if nobody fetches them.
+    """
+    users = job["payload"]["users"]
+    created, failed, secrets = [], [], {}
+
+    for start in range(0, len(users), BATCH_SIZE):
+        batch = users[start : start + BATCH_SIZE]
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                for user in batch:
+                    password = generate_password()
+                    try:
+                        with conn.transaction():
+                            cur.execute(
+                                """
+                                INSERT INTO users
+                                    (full_name, email, password_hash, group_id)
+                                VALUES (%s, %s, %s, %s)
+                                RETURNING id
+                                """,
+                                (
+                                    user["full_name"],
+                                    user["email"],
+                                    get_password_hash(password),
+                                    user.get("group_id"),
+                                ),
+                            )
+                            user_id = cur.fetchone()[0]  # type: ignore
+                            if user.get("group_id") is not None:
+                                refresh_user_visibility(cur, [user_id])
+                        created.append({"email": user["email"], "user_id": user_id})
+                        secrets[user["email"]] = password
+                    except psycopg.errors.UniqueViolation:
+                        failed.append(
+                            {
+                                "email": user["email"],
+                                "error": "A user with this email already exists.",
+                            }
+                        )
+                conn.commit()
+        progress(start + len(batch), len(users))
+
+    return {"created": created, "failed": failed, "secrets": secrets}
+
+
+@job_handler("delete_users", concurrency=1)
+def delete_users(job: dict, progress) -> dict:
+    """Delete users in batches so no single transaction holds locks for long"""
+    ids = job["payload"]["ids"]
+    deleted = []
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start : start + BATCH_SIZE]
+        with get_db_connection() as conn:  # type: ignore
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM users WHERE id = ANY(%s) RETURNING id", (batch,)
+                )
+                deleted.extend(row[0] for row in cur.fetchall())
+                conn.commit()
+        progress(start + len(batch), len(ids))
+    return {"deleted": deleted}
+
+
+@job_handler("backup_full", concurrency=1, max_attempts=2)
+def backup_full(job: dict, progress) -> dict:
+    """Run the same full backup as `python -m cli backup_full`"""
+    # cli pulls in the whole command set, only load it when a backup runs
+    import cli
+
+    backup_file = cli.backup_db_full(None)
+    if backup_file is None:
+        raise RuntimeError("Backup failed, see worker output")
+    return {"file": str(backup_file)}
+
+
+@job_handler("summarize_chat", concurrency=4, max_attempts=3)
+def summarize_chat(job: dict, progress) -> dict:
+    """Fold a chat's older turns into its rolling summary"""
+    return chat_context.summarize_chat(job["payload"]["chat_id"])
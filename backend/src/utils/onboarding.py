@@ -0,0 +1,412 @@
+"""
+Mass client onboarding from an uploaded CSV.
+
+The multipart body is spooled to a temp file (spool_body) before the NDJSON
+response starts, then parsed and validated one row at a time, so memory
+stays flat however large the file is. Valid rows are
+collected into batches of ONBOARD_BATCH_SIZE: the generated passwords of a
+batch are hashed on a thread pool (bcrypt releases the GIL), then the batch
+is written with a single COPY into a temp table and one
+INSERT ... ON CONFLICT into users. Each row gets an NDJSON result line as
+soon as its batch is committed.
+"""
+
+import asyncio
+import codecs
+import csv
+import io
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from core.database import get_db_connection
+from core.responses import dumps
+from core.topology import available_cpus
+from utils.auth import get_password_hash
+from utils.sharing import refresh_user_visibility
+from utils.users import generate_password
+
+load_dotenv()
+
+ONBOARD_BATCH_SIZE = int(os.getenv("ONBOARD_BATCH_SIZE", "500"))
+ONBOARD_MAX_ROWS = int(os.getenv("ONBOARD_MAX_ROWS", "20000"))
+ONBOARD_MAX_BYTES = int(os.getenv("ONBOARD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+REQUIRED_COLUMNS = ("full_name", "email")
+
+# Spooled bodies move from memory to disk past this size
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Room for the multipart headers and boundaries around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_QUOTE_OR_NEWLINE = re.compile(r'["\n]')
+
+_hash_executor: ThreadPoolExecutor | None = None
+
+
+class OnboardingError(Exception):
+    pass
+
+
+def multipart_boundary(content_type: str) -> bytes:
+    mime, options = parse_options_header(content_type)
+    if mime != b"multipart/form-data" or b"boundary" not in options:
+        raise OnboardingError("Expected a multipart/form-data upload")
+    return options[b"boundary"]
+
+
+async def spool_body(chunks, max_bytes: int = ONBOARD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES):
+    """
+    Read a request body into a temp file. Needed before a StreamingResponse
+    starts: from then on Starlette listens for the disconnect on receive()
+    and swallows whatever body is still unread.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    size = 0
+    try:
+        async for data in chunks:
+            size += len(data)
+            if size > max_bytes:
+                raise OnboardingError(f"Uploads are limited to {max_bytes} bytes")
+            spool.write(data)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def spooled_chunks(spool):
+    """The chunks of a body from spool_body, closing the file when done"""
+    try:
+        while data := spool.read(SPOOL_CHUNK_SIZE):
+            yield data
+    finally:
+        spool.close()
+
+
+class FilePart:
+    """
+    Push parser handing out the bytes of the first file in a multipart body.
+    check_filename may raise to reject the file before any of it is read.
+    """
+
+    def __init__(
+        self, boundary: bytes, max_size: int = ONBOARD_MAX_BYTES, check_filename=None
+    ):
+        self.found = False
+        self.filename: str | None = None
+        self._check_filename = check_filename
+        self._chunks: list[bytes] = []
+        self._in_file = False
+        self._field = b""
+        self._value = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._part_begin,
+                "on_header_field": self._header_field,
+                "on_header_value": self._header_value,
+                "on_header_end": self._header_end,
+                "on_headers_finished": self._headers_finished,
+                "on_part_data": self._part_data,
+                "on_part_end": self._part_end,
+            },
+            max_size=max_size,
+        )
+
+    def feed(self, data: bytes) -> list[bytes]:
+        self._parser.write(data)
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is None or self.found:
+            return
+        self.filename = filename.decode(errors="replace")
+        if self._check_filename is not None:
+            self._check_filename(self.filename)
+        self.found = True
+        self._in_file = True
+
+    def _part_data(self, data, start, end):
+        if self._in_file:
+            self._chunks.append(bytes(data[start:end]))
+
+    def _part_end(self):
+        self._in_file = False
+
+
+class _CsvRecords:
+    """Incremental CSV splitter that only parses records once they are complete"""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buffer = ""
+        self._scanned = 0
+        self._in_quotes = False
+
+    def feed(self, data: bytes, final: bool = False) -> list[list[str]]:
+        self._buffer += self._decoder.decode(data, final)
+        end = 0
+        # Newlines inside quoted fields do not end a record
+        for match in _QUOTE_OR_NEWLINE.finditer(self._buffer, self._scanned):
+            if match.group() == '"':
+                self._in_quotes = not self._in_quotes
+            elif not self._in_quotes:
+                end = match.end()
+        self._scanned = len(self._buffer)
+        if final:
+            end = len(self._buffer)
+
+        complete, self._buffer = self._buffer[:end], self._buffer[end:]
+        self._scanned -= end
+        if not complete:
+            return []
+        return [record for record in csv.reader(io.StringIO(complete)) if record]
+
+
+def _check_csv_filename(filename: str):
+    if filename.lower().endswith((".xlsx", ".xls")):
+        raise OnboardingError(
+            "Spreadsheets cannot be streamed, save the sheet as CSV and upload that"
+        )
+
+
+async def _records(chunks, boundary: bytes):
+    part = FilePart(boundary, check_filename=_check_csv_filename)
+    records = _CsvRecords()
+    async for data in chunks:
+        for piece in part.feed(data):
+            for record in records.feed(piece):
+                yield record
+    if not part.found:
+        raise OnboardingError("No file found in the upload")
+    for record in records.feed(b"", final=True):
+        yield record
+
+
+def _load_group_ids() -> set[int]:
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM groups")
+            return {row[0] for row in cur.fetchall()}
+
+
+def _validate(values: dict, group_ids: set[int], seen: set[str]) -> str | None:
+    """Return why a row cannot be imported, or None if it is valid"""
+    if not values["full_name"]:
+        return "full_name is required"
+    if not _EMAIL.match(values["email"]):
+        return "email is not a valid email address"
+    if values["email"] in seen:
+        return "email appears earlier in the file"
+    group_id = values.get("group_id") or None
+    if group_id is not None:
+        try:
+            group_id = int(group_id)
+        except ValueError:
+            return "group_id must be a number"
+        if group_id not in group_ids:
+            return f"group {group_id} does not exist"
+    values["group_id"] = group_id
+    return None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=len(available_cpus()), thread_name_prefix="onboard-hash"
+        )
+    return _hash_executor
+
+
+def _write_batch(batch: list[dict]) -> dict[str, int]:
+    """COPY a batch into users, returning email -> id for the rows inserted"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TEMP TABLE onboard_users (
+                    row_number INTEGER,
+                    full_name TEXT,
+                    email TEXT,
+                    password_hash TEXT,
+                    group_id INTEGER
+                ) ON COMMIT DROP
+                """
+            )
+            with cur.copy(
+                """
+                COPY onboard_users (row_number, full_name, email, password_hash, group_id)
+                FROM STDIN
+                """
+            ) as copy:
+                for row in batch:
+                    copy.write_row(
+                        (
+                            row["row"],
+                            row["full_name"],
+                            row["email"],
+                            row["password_hash"],
+                            row["group_id"],
+                        )
+                    )
+            cur.execute(
+                """
+                INSERT INTO users (full_name, email, password_hash, group_id)
+                SELECT full_name, email, password_hash, group_id
+                FROM onboard_users
+                ORDER BY row_number
+                ON CONFLICT (email) DO NOTHING
+                RETURNING id, email
+                """
+            )
+            created = {email: user_id for user_id, email in cur.fetchall()}
+
+            grouped = [
+                created[row["email"]]
+                for row in batch
+                if row["group_id"] is not None and row["email"] in created
+            ]
+            if grouped:
+                refresh_user_visibility(cur, grouped)
+            conn.commit()
+    return created
+
+
+async def _import_batch(batch: list[dict]) -> list[dict]:
+    loop = asyncio.get_running_loop()
+    passwords = [generate_password() for _ in batch]
+    hashes = await asyncio.gather(
+        *(loop.run_in_executor(_executor(), get_password_hash, pw) for pw in passwords)
+    )
+    for row, password_hash in zip(batch, hashes):
+        row["password_hash"] = password_hash
+
+    created = await asyncio.to_thread(_write_batch, batch)
+
+    results = []
+    for row, password in zip(batch, passwords):
+        if row["email"] in created:
+            results.append(
+                {
+                    "row": row["row"],
+                    "status": "created",
+                    "id": created[row["email"]],
+                    "full_name": row["full_name"],
+                    "email": row["email"],
+                    "password": password,
+                }
+            )
+        else:
+            results.append(
+                {
+                    "row": row["row"],
+                    "status": "failed",
+                    "email": row["email"],
+                    "error": "A user with this email already exists.",
+                }
+            )
+    return results
+
+
+async def onboard_clients(chunks, boundary: bytes):
+    """
+    Import clients from the CSV file in a multipart body, yielding one NDJSON
+    line per data row and a final summary line. The file needs a header row
+    with full_name and email, group_id is optional.
+    """
+    columns = None
+    row_number = 0
+    created = failed = 0
+    seen: set[str] = set()
+    batch: list[dict] = []
+
+    def line(result: dict) -> bytes:
+        return dumps(result) + b"\n"
+
+    async def flush():
+        nonlocal created, failed
+        results = await _import_batch(batch)
+        batch.clear()
+        for result in results:
+            if result["status"] == "created":
+                created += 1
+            else:
+                failed += 1
+        return b"".join(line(result) for result in results)
+
+    try:
+        group_ids = await asyncio.to_thread(_load_group_ids)
+        async for record in _records(chunks, boundary):
+            if columns is None:
+                columns = [column.strip().lower() for column in record]
+                missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+                if missing:
+                    raise OnboardingError(
+                        f"Header row is missing columns: {', '.join(missing)}"
+                    )
+                continue
+
+            row_number += 1
+            if row_number > ONBOARD_MAX_ROWS:
+                raise OnboardingError(f"Uploads are limited to {ONBOARD_MAX_ROWS} rows")
+
+            values = {
+                column: value.strip() for column, value in zip(columns, record)
+            }
+            values.setdefault("full_name", "")
+            values.setdefault("email", "")
+            error = _validate(values, group_ids, seen)
+            if error:
+                failed += 1
+                yield line({"row": row_number, "status": "failed", "error": error})
+                continue
+
+            seen.add(values["email"])
+            batch.append(
+                {
+                    "row": row_number,
+                    "full_name": values["full_name"],
+                    "email": values["email"],
+                    "group_id": values["group_id"],
+                }
+            )
+            if len(batch) >= ONBOARD_BATCH_SIZE:
+                yield await flush()
+
+        if batch:
+            yield await flush()
+        if columns is None:
+            raise OnboardingError("The file is empty")
+    except Exception as e:
+        # The response has already started, report the error in-band
+        print(f"Client onboarding stopped after row {row_number}: {e}")
+        yield line({"error": str(e)})
+
+    yield line({"summary": {"rows": row_number, "created": created, "failed": failed}})
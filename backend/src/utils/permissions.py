@@ -0,0 +1,98 @@
+"""
+Organisation/group authorization with precomputed permission bitmasks.
+
+A user's effective permissions are resolved at login and at every token
+refresh, across their direct organisation memberships and their group, into
+one int3 mask per organisation (1 access, 2 read, 4 write). The masks are
+embedded as signed claims in the access token, so checking them is a dict
+lookup and an AND, with no database work per request. Changes to
+memberships take effect when the access token is next refreshed.
+
+There is no active organisation. Users, artifacts, documents, chats and
+jobs are not scoped by organisation, so routes over them need the
+permission in every organisation the user can access: admin in one
+organisation and viewer in another is a viewer. Routes over data that is
+scoped (the dashboards) check the organisation named in the request.
+"""
+
+from fastapi import Depends, HTTPException, status
+
+from core.database import get_db_connection
+from utils.auth import get_current_user
+
+PERMISSION_ACCESS = 1
+PERMISSION_READ = 2
+PERMISSION_WRITE = 4
+
+
+def resolve_permissions(user_id: int) -> dict[int, int]:
+    """Effective permission mask per organisation for a user"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT organisation_id, bit_or(permission_type)::int
+                FROM (
+                    SELECT organisation_id, permission_type
+                    FROM user_organisation
+                    WHERE user_id = %s
+                    UNION ALL
+                    SELECT g.organisation_id, g.permission_type
+                    FROM users u
+                    JOIN groups g ON g.id = u.group_id
+                    WHERE u.id = %s AND g.organisation_id IS NOT NULL
+                ) AS grants
+                GROUP BY organisation_id
+                """,
+                (user_id, user_id),
+            )
+            return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def permission_claims(user_id: int) -> dict:
+    """Token claims carrying the user's masks"""
+    permissions = resolve_permissions(user_id)
+    # JSON object keys are strings
+    return {"perms": {str(org): mask for org, mask in permissions.items()}}
+
+
+def accessible_organisations(user: dict) -> list[int]:
+    """Organisations the user decoded by get_current_user can access"""
+    return sorted(
+        org
+        for org, mask in user.get("permissions", {}).items()
+        if mask & PERMISSION_ACCESS
+    )
+
+
+def has_permission(user: dict, required: int, organisation_id: int | None = None) -> bool:
+    """
+    Check a mask against the permissions decoded by get_current_user, in
+    organisation_id, or in every organisation the user can access when the
+    data is not scoped by organisation (organisation_id None)
+    """
+    permissions = user.get("permissions", {})
+    if organisation_id is not None:
+        return permissions.get(organisation_id, 0) & required == required
+    orgs = accessible_organisations(user)
+    return bool(orgs) and all(permissions[org] & required == required for org in orgs)
+
+
+def require_permission(required: int):
+    """
+    Route dependency that returns the current user if they hold `required`
+    in every organisation they can access, for routes over data that is not
+    scoped by organisation, e.g.
+
+        current_user: dict = Depends(require_permission(PERMISSION_WRITE))
+    """
+
+    async def dependency(current_user: dict = Depends(get_current_user)):
+        if not has_permission(current_user, PERMISSION_ACCESS | required):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Insufficient permissions",
+            )
+        return current_user
+
+    return dependency
@@ -0,0 +1,276 @@
+"""
+Dashboard rollups of logins and user activity.
+
+Logins are counted per day (UTC), organisation and group in login_rollups.
+record_login() only queues the login. A core.batch_writer.BatchWriter, as
+for audit events, writes the queue every ROLLUP_FLUSH_SECONDS as one upsert
+per batch, so logging in pays no extra round trip. A user counts
+once a day towards active_users however often they log in.
+
+Per-group user counts (total, never logged in, dormant for
+ROLLUP_DORMANT_DAYS, active in the last 7 and 30 days) change without any
+event as time passes. The same thread therefore recomputes them into
+user_rollups every ROLLUP_REFRESH_SECONDS. An advisory lock and the
+refreshed_at timestamp make one worker do it per interval.
+
+Dashboards read only these tables: a row per group, or per group and day.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+
+from core import lifecycle, metrics
+from core.batch_writer import BatchWriter
+from core.database import get_db_connection
+from core.singleflight import invalidate
+
+load_dotenv()
+
+ROLLUP_FLUSH_SECONDS = float(os.getenv("ROLLUP_FLUSH_SECONDS", "2"))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "1000"))
+# Logins beyond this are dropped (oldest first) while the database is down
+ROLLUP_MAX_QUEUE = int(os.getenv("ROLLUP_MAX_QUEUE", "100000"))
+ROLLUP_REFRESH_SECONDS = int(os.getenv("ROLLUP_REFRESH_SECONDS", "300"))
+ROLLUP_DORMANT_DAYS = int(os.getenv("ROLLUP_DORMANT_DAYS", "90"))
+# Days of user_login_days kept, enough for logins flushed after midnight
+ROLLUP_LOGIN_DAYS_KEPT = 3
+
+
+def record_login(user_id: int):
+    """Queue a login for the rollups, never blocks on the database"""
+    _writer.add((user_id, datetime.utcnow()))
+
+
+def _memberships_sql(batch_only: bool) -> str:
+    """
+    Organisation memberships of users, direct or through their group, with
+    the group they count under there (0 if it belongs to another
+    organisation). batch_only limits it to %(user_ids)s.
+    """
+    direct = "WHERE user_id = ANY(%(user_ids)s)" if batch_only else ""
+    via_group = "AND u.id = ANY(%(user_ids)s)" if batch_only else ""
+    return f"""
+        SELECT m.user_id, m.organisation_id,
+               CASE WHEN g.organisation_id = m.organisation_id THEN g.id ELSE 0 END
+                   AS group_id
+        FROM (
+            SELECT user_id, organisation_id
+            FROM user_organisation
+            {direct}
+            UNION
+            SELECT u.id, g.organisation_id
+            FROM users u
+            JOIN groups g ON g.id = u.group_id
+            WHERE g.organisation_id IS NOT NULL {via_group}
+        ) AS m (user_id, organisation_id)
+        JOIN users u ON u.id = m.user_id
+        LEFT JOIN groups g ON g.id = u.group_id
+    """
+
+
+def _write_batch(batch: list[tuple]):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                WITH batch AS (
+                    SELECT user_id, occurred_at::date AS day
+                    FROM unnest(%(user_ids)s::int[], %(times)s::timestamp[])
+                        AS b (user_id, occurred_at)
+                ),
+                -- Users not seen yet that day, across all workers
+                first_today AS (
+                    INSERT INTO user_login_days (day, user_id)
+                    SELECT DISTINCT day, user_id FROM batch
+                    ON CONFLICT DO NOTHING
+                    RETURNING day, user_id
+                ),
+                per_user AS (
+                    SELECT b.day, b.user_id, count(*) AS logins,
+                           EXISTS (
+                               SELECT 1 FROM first_today f
+                               WHERE f.day = b.day AND f.user_id = b.user_id
+                           ) AS first_login
+                    FROM batch b
+                    GROUP BY b.day, b.user_id
+                ),
+                memberships AS ({_memberships_sql(batch_only=True)})
+                INSERT INTO login_rollups (day, organisation_id, group_id, logins, active_users)
+                SELECT p.day, m.organisation_id, m.group_id,
+                       sum(p.logins), count(*) FILTER (WHERE p.first_login)
+                FROM per_user p
+                JOIN memberships m ON m.user_id = p.user_id
+                GROUP BY p.day, m.organisation_id, m.group_id
+                -- Same lock order in every worker
+                ORDER BY m.organisation_id, p.day, m.group_id
+                ON CONFLICT (organisation_id, day, group_id) DO UPDATE
+                SET logins = login_rollups.logins + EXCLUDED.logins,
+                    active_users = login_rollups.active_users + EXCLUDED.active_users
+                """,
+                {
+                    "user_ids": [row[0] for row in batch],
+                    "times": [row[1] for row in batch],
+                },
+            )
+            conn.commit()
+    invalidate("login_stats")
+
+
+def refresh_user_rollups(force: bool = False) -> bool:
+    """
+    Recompute user_rollups unless another worker is doing it or it is
+    younger than ROLLUP_REFRESH_SECONDS. Returns whether it was refreshed.
+    """
+    now = datetime.utcnow()
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('user_rollups'))")
+            if not cur.fetchone()[0]:  # type: ignore
+                conn.rollback()
+                return False
+            if not force:
+                cur.execute("SELECT max(refreshed_at) FROM user_rollups")
+                refreshed_at = cur.fetchone()[0]  # type: ignore
+                if refreshed_at is not None and (
+                    now - refreshed_at < timedelta(seconds=ROLLUP_REFRESH_SECONDS)
+                ):
+                    conn.rollback()
+                    return False
+
+            cur.execute("DELETE FROM user_rollups")
+            cur.execute(
+                f"""
+                INSERT INTO user_rollups (
+                    organisation_id, group_id, users, never_logged_in, dormant,
+                    active_7d, active_30d, refreshed_at
+                )
+                SELECT m.organisation_id, m.group_id,
+                       count(*),
+                       count(*) FILTER (WHERE u.last_login_at IS NULL),
+                       count(*) FILTER (WHERE u.last_login_at < %(dormant_before)s),
+                       count(*) FILTER (WHERE u.last_login_at >= %(week_ago)s),
+                       count(*) FILTER (WHERE u.last_login_at >= %(month_ago)s),
+                       %(now)s
+                FROM ({_memberships_sql(batch_only=False)}) AS m
+                JOIN users u ON u.id = m.user_id
+                WHERE u.status = 'active'
+                GROUP BY m.organisation_id, m.group_id
+                """,
+                {
+                    "dormant_before": now - timedelta(days=ROLLUP_DORMANT_DAYS),
+                    "week_ago": now - timedelta(days=7),
+                    "month_ago": now - timedelta(days=30),
+                    "now": now,
+                },
+            )
+            cur.execute(
+                "DELETE FROM user_login_days WHERE day < %s",
+                (now.date() - timedelta(days=ROLLUP_LOGIN_DAYS_KEPT),),
+            )
+            conn.commit()
+    invalidate("user_stats")
+    metrics.increment("rollup_refreshes_total")
+    return True
+
+
+# Also refreshes user_rollups
+_writer = BatchWriter(
+    "login-rollups",
+    _write_batch,
+    flush_seconds=ROLLUP_FLUSH_SECONDS,
+    batch_size=ROLLUP_BATCH_SIZE,
+    max_queue=ROLLUP_MAX_QUEUE,
+    metric="rollup_logins",
+    tasks=[(ROLLUP_REFRESH_SECONDS, refresh_user_rollups)],
+)
+
+
+def flush() -> int:
+    """Write every queued login, return the number written"""
+    return _writer.flush()
+
+
+@lifecycle.on_warm_up
+def start_writer():
+    """Started at warm-up too, so user_rollups refresh without logins"""
+    _writer.start()
+
+
+def login_stats(organisation_id: int, since: date, until: date) -> dict:
+    """Daily logins and active users of an organisation, with a per-group split"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT d.day::date,
+                       coalesce(sum(r.logins), 0)::int,
+                       coalesce(sum(r.active_users), 0)::int
+                FROM generate_series(%s::date, %s::date, interval '1 day') AS d (day)
+                LEFT JOIN login_rollups r
+                    ON r.organisation_id = %s AND r.day = d.day::date
+                GROUP BY d.day
+                ORDER BY d.day
+                """,
+                (since, until, organisation_id),
+            )
+            days = [
+                {"day": row[0], "logins": row[1], "active_users": row[2]}
+                for row in cur.fetchall()
+            ]
+            cur.execute(
+                """
+                SELECT r.group_id, g.name, sum(r.logins)::int
+                FROM login_rollups r
+                LEFT JOIN groups g ON g.id = r.group_id
+                WHERE r.organisation_id = %s AND r.day BETWEEN %s AND %s
+                GROUP BY r.group_id, g.name
+                ORDER BY r.group_id
+                """,
+                (organisation_id, since, until),
+            )
+            groups = [
+                {"group_id": row[0] or None, "name": row[1], "logins": row[2]}
+                for row in cur.fetchall()
+            ]
+        conn.rollback()
+    return {
+        "organisation_id": organisation_id,
+        "since": since,
+        "until": until,
+        "days": days,
+        "groups": groups,
+    }
+
+
+def user_stats(organisation_id: int) -> dict:
+    """An organisation's user counts from the last refresh, with a per-group split"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT r.group_id, g.name, r.users, r.never_logged_in, r.dormant,
+                       r.active_7d, r.active_30d, r.refreshed_at
+                FROM user_rollups r
+                LEFT JOIN groups g ON g.id = r.group_id
+                WHERE r.organisation_id = %s
+                ORDER BY r.group_id
+                """,
+                (organisation_id,),
+            )
+            rows = cur.fetchall()
+        conn.rollback()
+
+    counts = ("users", "never_logged_in", "dormant", "active_7d", "active_30d")
+    groups = [
+        {"group_id": row[0] or None, "name": row[1], **dict(zip(counts, row[2:7]))}
+        for row in rows
+    ]
+    return {
+        "organisation_id": organisation_id,
+        "dormant_days": ROLLUP_DORMANT_DAYS,
+        "refreshed_at": max((row[7] for row in rows), default=None),
+        **{name: sum(group[name] for group in groups) for name in counts},
+        "groups": groups,
+    }
@@ -0,0 +1,149 @@
+"""
+Type-ahead search over clients, artifacts and chats.
+
+Queries of three or more characters are substring matches served by the
+pg_trgm GIN indexes (plus full-text over artifact content), shorter ones
+are prefix matches on the text_pattern_ops indexes. All kinds are ranked
+and limited in a single statement that runs under SEARCH_TIMEOUT_MS, and
+the query is cancelled server side as soon as the client goes away.
+"""
+
+import asyncio
+import os
+
+import psycopg
+from dotenv import load_dotenv
+
+from core.database import get_async_db_connection
+
+load_dotenv()
+
+SEARCH_KINDS = ("clients", "artifacts", "chats")
+SEARCH_TIMEOUT_MS = int(os.getenv("SEARCH_TIMEOUT_MS", "200"))
+SEARCH_MAX_LIMIT = 25
+
+# Shortest query the trigram indexes can serve
+TRIGRAM_MIN_LENGTH = 3
+
+# How often to check whether the client is still connected
+DISCONNECT_POLL_SECONDS = 0.02
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _text_match(columns: list[str], short: bool) -> tuple[str, str]:
+    """WHERE predicate and score expression matching q against columns"""
+    if short:
+        predicate = " OR ".join(f"lower({c}) LIKE %(prefix)s" for c in columns)
+        score = f"1.0 / greatest(length({columns[0]}), 1)"
+    else:
+        predicate = " OR ".join(f"{c} ILIKE %(pattern)s" for c in columns)
+        scores = [f"similarity({c}, %(q)s)" for c in columns]
+        score = scores[0] if len(scores) == 1 else f"greatest({', '.join(scores)})"
+    return predicate, score
+
+
+def _kind_query(kind: str, short: bool) -> str:
+    if kind == "clients":
+        predicate, score = _text_match(["full_name", "email"], short)
+        return f"""
+            (SELECT 'clients' AS kind, id, full_name AS label, email AS detail,
+                    {score} AS score
+             FROM users
+             WHERE {predicate}
+             ORDER BY score DESC, id
+             LIMIT %(limit)s)
+        """
+    if kind == "artifacts":
+        predicate, score = _text_match(["variable_name"], short)
+        if not short:
+            predicate += " OR search_vector @@ plainto_tsquery('simple', %(q)s)"
+            score = (
+                f"greatest({score}, "
+                "ts_rank(search_vector, plainto_tsquery('simple', %(q)s)))"
+            )
+        return f"""
+            (SELECT 'artifacts' AS kind, id, variable_name AS label, NULL AS detail,
+                    {score} AS score
+             FROM artifacts
+             WHERE {predicate}
+             ORDER BY score DESC, id
+             LIMIT %(limit)s)
+        """
+    if kind == "chats":
+        predicate, score = _text_match(["title"], short)
+        return f"""
+            (SELECT 'chats' AS kind, id, title AS label, user_id::text AS detail,
+                    {score} AS score
+             FROM chats
+             WHERE {predicate}
+             ORDER BY score DESC, id
+             LIMIT %(limit)s)
+        """
+    raise ValueError(f"Unknown search kind: {kind}")
+
+
+def build_search_query(q: str, kinds: list[str], limit: int) -> tuple[str, dict]:
+    short = len(q) < TRIGRAM_MIN_LENGTH
+    query = (
+        " UNION ALL ".join(_kind_query(kind, short) for kind in kinds)
+        + " ORDER BY score DESC LIMIT %(limit)s"
+    )
+    params = {
+        "q": q,
+        "pattern": f"%{_escape_like(q)}%",
+        "prefix": f"{_escape_like(q.lower())}%",
+        "limit": limit,
+    }
+    return query, params
+
+
+async def search(q: str, kinds: list[str], limit: int, is_disconnected) -> dict | None:
+    """
+    Ranked top-`limit` matches across `kinds`. Returns None if the client
+    disconnected before the query finished, in which case it was cancelled.
+    """
+    query, params = build_search_query(q, kinds, limit)
+
+    async def run(conn):
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL statement_timeout = {SEARCH_TIMEOUT_MS}")
+            cur = await conn.execute(query, params)
+            return await cur.fetchall()
+
+    async with await get_async_db_connection() as conn:
+        task = asyncio.create_task(run(conn))
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                break
+            if await is_disconnected():
+                await conn.cancel_safe()
+                try:
+                    await task
+                except psycopg.errors.QueryCanceled:
+                    pass
+                return None
+
+        try:
+            rows = task.result()
+        except psycopg.errors.QueryCanceled:
+            # Over the latency budget, an empty answer beats a late one
+            return {"query": q, "results": [], "timed_out": True}
+
+    return {
+        "query": q,
+        "results": [
+            {
+                "kind": row[0],
+                "id": row[1],
+                "label": row[2],
+                "detail": row[3],
+                "score": float(row[4]),
+            }
+            for row in rows
+        ],
+        "timed_out": False,
+    }
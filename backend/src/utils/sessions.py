@@ -0,0 +1,348 @@
+"""
+Refresh-token sessions.
+
+Access tokens live ACCESS_TOKEN_EXPIRE_MINUTES and carry everything
+get_current_user needs, so they are checked from their signature alone.
+The refresh token (a JWT signed with JWT_REFRESH_SECRET_KEY, kept in an
+httponly cookie) is the only thing looked up in the database, once per
+access token lifetime. Every refresh rotates it: the presented token is
+marked rotated and a successor in the same family is issued. A rotated token
+presented again after REFRESH_REUSE_GRACE_SECONDS has been copied, so the
+whole family is revoked and the session ends. Logout revokes the family of
+the refresh cookie, so it works after the access token has expired.
+
+Both JWT secrets must be set: warm-up fails rather than sign tokens with an
+empty key.
+
+SessionRefreshMiddleware refreshes silently: a request without a valid
+access token but with a refresh token is rotated before it reaches the
+route, and the new cookies go on whatever response is sent, streamed ones
+included.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from fastapi import Response
+from jose import jwt, JWTError
+from starlette.requests import cookie_parser
+
+from core import audit, lifecycle
+from core.database import get_db_connection
+from utils.auth import (
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    SECRET_KEY,
+    create_access_token,
+    user_from_access_token,
+)
+from utils.permissions import permission_claims
+
+load_dotenv()
+
+REFRESH_SECRET_KEY = os.getenv("JWT_REFRESH_SECRET_KEY", "")
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Parallel requests from one browser can all refresh with the same token
+# before the new cookie lands, that is not a replay
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "30"))
+
+# Cookie settings
+COOKIE_SECURE = False  # Set to False in development if not using HTTPS
+COOKIE_HTTPONLY = True
+COOKIE_SAMESITE = "lax"
+ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+REFRESH_TOKEN_EXPIRE_SECONDS = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+
+
+class SessionError(Exception):
+    pass
+
+
+@lifecycle.on_warm_up
+def check_secret_keys():
+    """Refuse to start rather than sign tokens with an empty key"""
+    missing = [
+        name
+        for name, value in (
+            ("JWT_SECRET_KEY", SECRET_KEY),
+            ("JWT_REFRESH_SECRET_KEY", REFRESH_SECRET_KEY),
+        )
+        if not value
+    ]
+    if missing:
+        raise RuntimeError(f"{', '.join(missing)} must be set")
+
+
+def session_claims(user: dict) -> dict:
+    """Access token claims, everything get_current_user needs without the DB"""
+    return {
+        "sub": user["email"],
+        "uid": user["id"],
+        "name": user["full_name"],
+        **permission_claims(user["id"]),
+    }
+
+
+def _new_refresh_token(cur, user_id: int, family_id: str) -> str:
+    jti = str(uuid.uuid4())
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    cur.execute(
+        """
+        INSERT INTO refresh_tokens (jti, family_id, user_id, expires_at)
+        VALUES (%s, %s, %s, %s)
+        """,
+        (jti, family_id, user_id, expires_at),
+    )
+    return jwt.encode(
+        {"jti": jti, "fam": family_id, "uid": user_id, "exp": expires_at},
+        REFRESH_SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+def start_session(user: dict) -> tuple[str, str]:
+    """Access and refresh token for a fresh login"""
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            # Housekeeping, expired tokens of this user are never needed again
+            cur.execute(
+                "DELETE FROM refresh_tokens WHERE user_id = %s AND expires_at < now()",
+                (user["id"],),
+            )
+            refresh_token = _new_refresh_token(cur, user["id"], str(uuid.uuid4()))
+            conn.commit()
+    return create_access_token(data=session_claims(user)), refresh_token
+
+
+def rotate_refresh_token(refresh_token: str) -> tuple[dict, str | None]:
+    """
+    Check a refresh token and replace it with its successor. Returns the user
+    and the new refresh token, which is None when the token was already
+    rotated moments ago by a parallel request.
+    """
+    try:
+        payload = jwt.decode(refresh_token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
+        jti = payload["jti"]
+    except (JWTError, KeyError):
+        raise SessionError("Invalid refresh token")
+
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT r.family_id, r.status,
+                       r.rotated_at > now() - make_interval(secs => %s),
+                       u.id, u.full_name, u.email, u.status
+                FROM refresh_tokens r
+                JOIN users u ON u.id = r.user_id
+                WHERE r.jti = %s
+                FOR UPDATE OF r
+                """,
+                (REFRESH_REUSE_GRACE_SECONDS, jti),
+            )
+            row = cur.fetchone()
+            if not row:
+                raise SessionError("Unknown refresh token")
+            family_id, token_status, in_grace, user_id, full_name, email, user_status = row
+            user = {"id": user_id, "full_name": full_name, "email": email}
+
+            if token_status == "rotated" and in_grace:
+                conn.commit()
+                return user, None
+
+            if token_status != "active" or user_status != "active":
+                if token_status == "rotated":
+                    print(f"Refresh token reuse for user {user_id}, revoking session")
+                cur.execute(
+                    """
+                    UPDATE refresh_tokens SET status = 'revoked'
+                    WHERE family_id = %s AND status <> 'revoked'
+                    """,
+                    (family_id,),
+                )
+                conn.commit()
+                if token_status != "revoked":
+                    audit.record(
+                        "session_revoked",
+                        actor_id=user_id,
+                        subject_type="session",
+                        subject_id=family_id,
+                        details={
+                            "reason": "refresh_token_reuse"
+                            if token_status == "rotated"
+                            else f"user_{user_status}"
+                        },
+                    )
+                raise SessionError("Session has been revoked")
+
+            cur.execute(
+                """
+                UPDATE refresh_tokens SET status = 'rotated', rotated_at = now()
+                WHERE jti = %s
+                """,
+                (jti,),
+            )
+            new_refresh_token = _new_refresh_token(cur, user_id, str(family_id))
+            conn.commit()
+    return user, new_refresh_token
+
+
+def revoke_user_sessions(user_id: int):
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE refresh_tokens SET status = 'revoked'
+                WHERE user_id = %s AND status <> 'revoked'
+                """,
+                (user_id,),
+            )
+            conn.commit()
+
+
+def end_session(refresh_token: str) -> int | None:
+    """
+    Revoke the session (token family) of a refresh token and return its
+    user id, or None if the token is not ours. Expired tokens are accepted,
+    logging out has to work however long the browser was away.
+    """
+    try:
+        payload = jwt.decode(
+            refresh_token,
+            REFRESH_SECRET_KEY,
+            algorithms=[ALGORITHM],
+            options={"verify_exp": False},
+        )
+        jti = payload["jti"]
+    except (JWTError, KeyError):
+        return None
+
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT family_id, user_id FROM refresh_tokens WHERE jti = %s", (jti,)
+            )
+            row = cur.fetchone()
+            if not row:
+                conn.rollback()
+                return None
+            cur.execute(
+                """
+                UPDATE refresh_tokens SET status = 'revoked'
+                WHERE family_id = %s AND status <> 'revoked'
+                """,
+                (row[0],),
+            )
+            conn.commit()
+    return row[1]
+
+
+def set_session_cookies(
+    response: Response, access_token: str, refresh_token: str | None = None
+):
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        max_age=ACCESS_TOKEN_EXPIRE_SECONDS,
+        expires=ACCESS_TOKEN_EXPIRE_SECONDS,
+        httponly=COOKIE_HTTPONLY,
+        secure=COOKIE_SECURE,
+        samesite=COOKIE_SAMESITE,
+    )
+    if refresh_token is not None:
+        response.set_cookie(
+            key="refresh_token",
+            value=refresh_token,
+            max_age=REFRESH_TOKEN_EXPIRE_SECONDS,
+            expires=REFRESH_TOKEN_EXPIRE_SECONDS,
+            httponly=COOKIE_HTTPONLY,
+            secure=COOKIE_SECURE,
+            samesite=COOKIE_SAMESITE,
+        )
+
+
+def clear_session_cookies(response: Response):
+    for key in ("access_token", "refresh_token"):
+        response.delete_cookie(
+            key=key,
+            httponly=COOKIE_HTTPONLY,
+            secure=COOKIE_SECURE,
+            samesite=COOKIE_SAMESITE,
+        )
+
+
+def refresh_session(response: Response, refresh_token: str) -> tuple[dict, str, str | None]:
+    """
+    Rotate the refresh token and issue a new access token, setting both
+    cookies on response. Returns the access token claims and both tokens.
+    """
+    user, new_refresh_token = rotate_refresh_token(refresh_token)
+    claims = session_claims(user)
+    access_token = create_access_token(data=claims)
+    set_session_cookies(response, access_token, new_refresh_token)
+    return claims, access_token, new_refresh_token
+
+
+# Routes that set session cookies themselves
+SESSION_ROUTES = ("/api/auth/",)
+
+
+class SessionRefreshMiddleware:
+    """
+    Rotate an expired session before the request reaches get_current_user.
+    The new access token replaces the cookie the route sees, and both
+    cookies are added to the response start, so routes returning their own
+    Response (StreamingResponse) hand them to the browser as well.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith(SESSION_ROUTES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = [(k, v) for k, v in scope.get("headers") or [] if k != b"cookie"]
+        cookie_header = b"; ".join(v for k, v in scope.get("headers") or [] if k == b"cookie")
+        cookies = cookie_parser(cookie_header.decode("latin-1"))
+        refresh_token = cookies.get("refresh_token")
+        if not refresh_token or user_from_access_token(cookies.get("access_token")):
+            await self.app(scope, receive, send)
+            return
+
+        response = Response()
+        try:
+            _, access_token, new_refresh_token = await asyncio.to_thread(
+                refresh_session, response, refresh_token
+            )
+        except SessionError:
+            # get_current_user answers 401
+            await self.app(scope, receive, send)
+            return
+
+        cookies["access_token"] = access_token
+        if new_refresh_token is not None:
+            cookies["refresh_token"] = new_refresh_token
+        headers.append(
+            (b"cookie", "; ".join(f"{k}={v}" for k, v in cookies.items()).encode("latin-1"))
+        )
+        set_cookies = [(k, v) for k, v in response.raw_headers if k == b"set-cookie"]
+
+        async def send_with_cookies(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), *set_cookies],
+                }
+            await send(message)
+
+        await self.app({**scope, "headers": headers}, receive, send_with_cookies)
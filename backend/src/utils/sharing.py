@@ -0,0 +1,146 @@
+"""
+Set-based artifact sharing.
+
+Who an artifact is shared with lives in artifact_users and artifact_groups,
+written with one unnest() statement per table and diffed against the
+stored set so only changes hit the table. user_visible_artifacts is the
+precomputed answer to "which artifacts can this user see", kept in step
+whenever an artifact's audience or a user's group changes, so listing them
+is a single primary key range scan.
+"""
+
+from core.database import get_db_connection, stream_rows
+from core.singleflight import invalidate
+
+
+def set_artifact_audience(cur, artifact_id: int, user_ids: list[int], group_ids: list[int]):
+    """Replace who an artifact is shared with and refresh its visibility rows"""
+    cur.execute(
+        """
+        DELETE FROM artifact_users
+        WHERE artifact_id = %s AND NOT (user_id = ANY(%s::int[]))
+        """,
+        (artifact_id, user_ids),
+    )
+    cur.execute(
+        """
+        INSERT INTO artifact_users (artifact_id, user_id)
+        SELECT %s, unnest(%s::int[])
+        ON CONFLICT DO NOTHING
+        """,
+        (artifact_id, user_ids),
+    )
+    cur.execute(
+        """
+        DELETE FROM artifact_groups
+        WHERE artifact_id = %s AND NOT (group_id = ANY(%s::int[]))
+        """,
+        (artifact_id, group_ids),
+    )
+    cur.execute(
+        """
+        INSERT INTO artifact_groups (artifact_id, group_id)
+        SELECT %s, unnest(%s::int[])
+        ON CONFLICT DO NOTHING
+        """,
+        (artifact_id, group_ids),
+    )
+    # Everyone who should see the artifact now, diffed against who could before
+    cur.execute(
+        """
+        WITH desired AS (
+            SELECT user_id FROM artifact_users WHERE artifact_id = %(artifact_id)s
+            UNION
+            SELECT u.id
+            FROM artifact_groups ag
+            JOIN users u ON u.group_id = ag.group_id
+            WHERE ag.artifact_id = %(artifact_id)s
+        ), removed AS (
+            DELETE FROM user_visible_artifacts v
+            WHERE v.artifact_id = %(artifact_id)s
+              AND v.user_id NOT IN (SELECT user_id FROM desired)
+        )
+        INSERT INTO user_visible_artifacts (user_id, artifact_id)
+        SELECT user_id, %(artifact_id)s FROM desired
+        ON CONFLICT DO NOTHING
+        """,
+        {"artifact_id": artifact_id},
+    )
+
+
+def refresh_user_visibility(cur, user_ids: list[int]):
+    """
+    Bring the visibility rows of users in line with their direct shares and
+    current group. Call after changing users.group_id or deleting groups.
+    """
+    cur.execute(
+        """
+        WITH targets AS (
+            SELECT unnest(%(user_ids)s::int[]) AS user_id
+        ), desired AS (
+            SELECT au.user_id, au.artifact_id
+            FROM artifact_users au
+            JOIN targets t ON t.user_id = au.user_id
+            UNION
+            SELECT u.id, ag.artifact_id
+            FROM users u
+            JOIN targets t ON t.user_id = u.id
+            JOIN artifact_groups ag ON ag.group_id = u.group_id
+        ), removed AS (
+            DELETE FROM user_visible_artifacts v
+            USING targets t
+            WHERE v.user_id = t.user_id
+              AND (v.user_id, v.artifact_id) NOT IN (SELECT user_id, artifact_id FROM desired)
+        )
+        INSERT INTO user_visible_artifacts (user_id, artifact_id)
+        SELECT user_id, artifact_id FROM desired
+        ON CONFLICT DO NOTHING
+        """,
+        {"user_ids": user_ids},
+    )
+
+
+def delete_groups(group_ids: list[int]) -> list[int]:
+    """
+    Delete groups and take away what their members could only see through
+    them. Returns the ids actually deleted.
+    """
+    with get_db_connection() as conn:  # type: ignore
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE group_id = ANY(%s)", (group_ids,))
+            members = [row[0] for row in cur.fetchall()]
+            # Members' group_id is set to NULL, artifact_groups rows cascade
+            cur.execute("DELETE FROM groups WHERE id = ANY(%s) RETURNING id", (group_ids,))
+            deleted = [row[0] for row in cur.fetchall()]
+            refresh_user_visibility(cur, members)
+            conn.commit()
+    # Artifact audiences lost these groups
+    invalidate("artifacts")
+    return deleted
+
+
+def get_artifact_audience(cur, artifact_id: int) -> dict:
+    cur.execute(
+        """
+        SELECT
+            ARRAY(SELECT user_id FROM artifact_users WHERE artifact_id = %s ORDER BY user_id),
+            ARRAY(SELECT group_id FROM artifact_groups WHERE artifact_id = %s ORDER BY group_id)
+        """,
+        (artifact_id, artifact_id),
+    )
+    user_ids, group_ids = cur.fetchone()
+    return {"user_ids": user_ids, "group_ids": group_ids}
+
+
+def list_visible_artifacts(user_id: int):
+    """artifact_list_item rows the user can see, without touching content"""
+    return stream_rows(
+        """
+        SELECT a.id, a.variable_name, a.is_preprompt, a.created_at, a.last_updated_at
+        FROM user_visible_artifacts v
+        JOIN artifacts a ON a.id = v.artifact_id
+        WHERE v.user_id = %s
+        ORDER BY a.id
+        """,
+        (user_id,),
+    )
@@ -0,0 +1,58 @@
+import pytest
+
+from utils.artifacts import InvalidPatch, apply_editor_ops, apply_ops, diff_ops
+
+
+def test_ascii_offsets_are_unchanged():
+    ops, content = apply_editor_ops("hello world", [[6, 11, "there"]])
+
+    assert ops == [[6, 11, "there"]]
+    assert content == "hello there"
+
+
+def test_utf16_offsets_after_an_emoji_are_converted():
+    # "😀" is two UTF-16 code units but one code point
+    old = "😀 hello"
+    ops, content = apply_editor_ops(old, [[3, 8, "bye"]])
+
+    assert content == "😀 bye"
+    assert ops == [[2, 7, "bye"]]
+    # Stored ops replay to the same content
+    assert apply_ops(old, ops) == content
+
+
+def test_ops_apply_in_order_against_the_edited_content():
+    ops, content = apply_editor_ops("ab", [[0, 0, "🎉"], [3, 4, "c"]])
+
+    assert content == "🎉ac"
+    assert ops == [[0, 0, "🎉"], [2, 3, "c"]]
+
+
+def test_offset_inside_a_surrogate_pair_is_rejected():
+    with pytest.raises(InvalidPatch):
+        apply_editor_ops("a😀b", [[2, 2, "x"]])
+
+
+def test_offset_past_the_end_in_code_units_is_rejected():
+    with pytest.raises(InvalidPatch):
+        apply_editor_ops("😀", [[0, 3, ""]])
+
+
+def test_unpaired_surrogate_text_is_rejected():
+    with pytest.raises(InvalidPatch):
+        apply_editor_ops("abc", [[0, 0, "\ud83d"]])
+
+
+def test_diff_ops_round_trips():
+    old, new = "one 😀 two", "one 😀 three"
+
+    assert apply_ops(old, diff_ops(old, new)) == new
+
+
+def test_update_request_without_sharing_leaves_the_audience_alone():
+    from schemas.artifacts import AdminUpdateArtifactRequest
+
+    request = AdminUpdateArtifactRequest(id=1, variable_name="intro", content="Hi")
+
+    assert request.user_ids is None
+    assert request.group_ids is None
@@ -0,0 +1,28 @@
+import os
+import sys
+
+from utils import backups
+
+
+def test_priority_comes_from_wrapper_commands(monkeypatch):
+    monkeypatch.setattr(backups.shutil, "which", lambda name: f"/usr/bin/{name}")
+    monkeypatch.setattr(backups, "BACKUP_NICE", 10)
+    monkeypatch.setattr(backups, "BACKUP_IONICE_CLASS", "3")
+    assert backups._low_priority(["pg_dump", "db"]) == [
+        "ionice", "-c", "3", "nice", "-n", "10", "pg_dump", "db",
+    ]
+
+
+def test_dump_syncs_without_posix_fadvise(monkeypatch, tmp_path):
+    # As on macOS
+    monkeypatch.delattr(os, "posix_fadvise", raising=False)
+    monkeypatch.setattr(backups, "BACKUP_SYNC_BYTES", 1024)
+    monkeypatch.setattr(backups, "BACKUP_MAX_BYTES_PER_SEC", 0)
+    backup_file = tmp_path / "backup.sql"
+    cmd = [sys.executable, "-c", "import sys; sys.stdout.write('x' * 200000)"]
+
+    result = backups.run_dump(cmd, dict(os.environ), "-- header\n", backup_file)
+
+    assert backup_file.read_text() == "-- header\n" + "x" * 200000
+    assert result["bytes"] == backup_file.stat().st_size
+    assert not backup_file.with_name("backup.sql.partial").exists()
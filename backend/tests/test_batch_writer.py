@@ -0,0 +1,127 @@
+import asyncio
+import inspect
+import threading
+from collections import deque
+
+import psycopg
+
+from core import audit, lifecycle, metrics
+from core.batch_writer import MAX_BATCH_RETRIES, BatchWriter
+
+
+def _counted(monkeypatch):
+    counted = []
+    monkeypatch.setattr(
+        metrics,
+        "increment",
+        lambda name, amount=1, **labels: counted.append((name, amount)),
+    )
+    return counted
+
+
+def _writer(monkeypatch, write_batch, **options):
+    writer = BatchWriter(
+        "test",
+        write_batch,
+        flush_seconds=1,
+        batch_size=options.get("batch_size", 2),
+        max_queue=options.get("max_queue", 3),
+        metric="test_items",
+    )
+    # Flushed by hand, no thread
+    monkeypatch.setattr(writer, "start", lambda: None)
+    return writer
+
+
+def test_failed_flush_keeps_every_item_and_full_queue_drops_oldest(monkeypatch):
+    counted = _counted(monkeypatch)
+
+    def broken(batch):
+        raise psycopg.OperationalError("database is down")
+
+    writer = _writer(monkeypatch, broken)
+    for n in range(3):
+        writer.add(n)
+    assert writer.flush() == 0
+    # The failed batch went back to the front, nothing was evicted
+    assert list(writer._queue) == [0, 1, 2]
+    assert counted == []
+
+    writer.add(3)
+    assert list(writer._queue) == [1, 2, 3]
+    assert counted == [("test_items_dropped_total", 1)]
+    # Nothing left for the flush at exit
+    writer._queue.clear()
+
+
+def test_flush_writes_in_batches_and_in_order(monkeypatch):
+    counted = _counted(monkeypatch)
+    batches = []
+    writer = _writer(monkeypatch, batches.append, max_queue=10)
+    for n in range(5):
+        writer.add(n)
+    assert writer.flush() == 5
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert len(writer) == 0
+    assert counted == [("test_items_written_total", 5)]
+
+
+def test_unreachable_database_never_drops_a_batch(monkeypatch):
+    counted = _counted(monkeypatch)
+
+    def down(batch):
+        raise psycopg.OperationalError("connection refused")
+
+    writer = _writer(monkeypatch, down, max_queue=10)
+    writer.add(1)
+    for _ in range(MAX_BATCH_RETRIES * 3):
+        assert writer.flush() == 0
+    assert list(writer._queue) == [1]
+    assert counted == []
+    writer._queue.clear()
+
+
+def test_bad_item_is_isolated_and_dropped_after_retries(monkeypatch):
+    counted = _counted(monkeypatch)
+    written = []
+
+    def write_batch(batch):
+        if "bad" in batch:
+            raise psycopg.errors.NotNullViolation("null value in column")
+        written.extend(batch)
+
+    writer = _writer(monkeypatch, write_batch, max_queue=10)
+    for item in ("a", "bad", "b", "c"):
+        writer.add(item)
+
+    for _ in range(MAX_BATCH_RETRIES - 1):
+        assert writer.flush() == 0
+        assert list(writer._queue) == ["a", "bad", "b", "c"]
+    # Last retry: the batch is split, the bad item dropped, the rest goes on
+    assert writer.flush() == 3
+    assert written == ["a", "b", "c"]
+    assert len(writer) == 0
+    assert ("test_items_failed_total", 1) in counted
+
+
+def test_shutdown_hook_stops_off_the_event_loop(monkeypatch):
+    writer = _writer(monkeypatch, lambda batch: None)
+    assert writer.shutdown in lifecycle._shutdown_hooks
+    assert inspect.iscoroutinefunction(writer.shutdown)
+    threads = []
+    monkeypatch.setattr(writer, "stop", lambda: threads.append(threading.current_thread()))
+    asyncio.run(writer.shutdown())
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_audit_events_go_through_the_writer(monkeypatch):
+    _counted(monkeypatch)
+    batches = []
+    monkeypatch.setattr(audit._writer, "_queue", deque())
+    monkeypatch.setattr(audit._writer, "start", lambda: None)
+    monkeypatch.setattr(audit, "_copy_batch", batches.append)
+
+    audit.record("login", actor_id=7, subject_type="user", subject_id=7)
+    assert audit.flush() == 1
+    (row,) = batches[0]
+    assert row[1:5] == ("login", 7, "user", "7")
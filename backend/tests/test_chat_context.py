@@ -0,0 +1,39 @@
+from utils.chat_context import plan_context
+
+
+def _turns(*spec):
+    return [{"role": role, "token_count": tokens} for role, tokens in spec]
+
+
+def test_everything_fits():
+    messages = _turns(("user", 10), ("assistant", 20), ("user", 5))
+    assert plan_context(messages, 100) == (messages, [])
+
+
+def test_keeps_the_newest_turns_that_fit():
+    messages = _turns(
+        ("user", 50), ("assistant", 50), ("user", 10), ("assistant", 20), ("user", 5)
+    )
+    recent, older = plan_context(messages, 40)
+    assert recent == messages[2:]
+    assert older == messages[:2]
+
+
+def test_window_starts_on_a_user_turn():
+    messages = _turns(("user", 50), ("assistant", 10), ("user", 10), ("assistant", 5))
+    # Budget fits the last three, but the first of them is the assistant's
+    recent, older = plan_context(messages, 25)
+    assert recent == messages[2:]
+    assert older == messages[:2]
+
+
+def test_exact_budget_is_used_up():
+    messages = _turns(("user", 30), ("assistant", 30))
+    assert plan_context(messages, 60) == (messages, [])
+    assert plan_context(messages, 59) == ([], messages)
+
+
+def test_nothing_fits():
+    messages = _turns(("user", 10), ("assistant", 200))
+    assert plan_context(messages, 100) == ([], messages)
+    assert plan_context([], 100) == ([], [])
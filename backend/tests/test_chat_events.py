@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from core import pubsub
+from utils import chat_events
+from utils.auth import create_access_token
+from utils.permissions import PERMISSION_ACCESS, PERMISSION_READ
+
+REQUEST = {"system": "Be brief.", "messages": [{"role": "user", "content": "Hi"}]}
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    monkeypatch.setattr(pubsub, "PUBSUB_BACKEND", "local")
+
+    async def stream_text(**kwargs):
+        assert kwargs["system"] == REQUEST["system"]
+        for text in ("Hel", "lo", " there"):
+            yield text
+
+    messages = []
+    monkeypatch.setattr(chat_events.llm, "stream_text", stream_text)
+    monkeypatch.setattr(
+        chat_events, "add_message", lambda *args: messages.append(args) or {"id": 1}
+    )
+    return messages
+
+
+def collect(chat_id: int, user_id: int, topic: str):
+    async def scenario():
+        subscription = pubsub.subscribe(topic)
+        try:
+            texts = [
+                text async for text in chat_events.stream_reply(chat_id, user_id, REQUEST)
+            ]
+            events = []
+            while not subscription.queue.empty():
+                events.append(subscription.queue.get_nowait())
+            return texts, events
+        finally:
+            subscription.close()
+
+    return asyncio.run(scenario())
+
+
+def test_stream_reply_publishes_every_delta_and_stores_the_reply(stored, monkeypatch):
+    monkeypatch.setattr(chat_events, "CHAT_LIVE_FLUSH_MS", 0)
+
+    texts, events = collect(5, 2, "chat:5")
+
+    assert texts == ["Hel", "lo", " there"]
+    assert events[0] == {"type": "reply_started", "chat_id": 5, "user_id": 2}
+    assert [e["text"] for e in events[1:]] == ["Hel", "lo", " there"]
+    assert stored == [(5, "assistant", "Hello there")]
+
+
+def test_stream_reply_coalesces_deltas(stored, monkeypatch):
+    monkeypatch.setattr(chat_events, "CHAT_LIVE_FLUSH_MS", 60000)
+
+    _, events = collect(5, 2, "user:2")
+
+    assert [e["type"] for e in events] == ["reply_started", "reply_delta"]
+    assert events[1]["text"] == "Hello there"
+
+
+def test_admin_watch_closes_after_an_oversized_event_resync(monkeypatch):
+    monkeypatch.setattr(pubsub, "PUBSUB_BACKEND", "local")
+    client = TestClient(main.app)
+    client.cookies.set(
+        "access_token",
+        create_access_token(
+            {
+                "sub": "admin@example.com",
+                "uid": 1,
+                "perms": {"1": PERMISSION_ACCESS | PERMISSION_READ},
+            }
+        ),
+    )
+    oversized = {"type": "reply_delta", "chat_id": 5, "text": "x" * 10000}
+
+    async def publish_once_subscribed():
+        while not pubsub.subscriber_count():
+            await asyncio.sleep(0.01)
+        # As the LISTEN connection would receive it
+        pubsub._dispatch(json.loads(pubsub._payload(["chat:5"], oversized)))
+
+    with client.websocket_connect("/api/chat/ws/admin-watch?chat_id=5") as ws:
+        ws.portal.call(publish_once_subscribed)
+        assert ws.receive_json()["type"] == "resync"
+        with pytest.raises(Exception) as closed:
+            ws.receive_json()
+    assert getattr(closed.value, "code", None) == 1013
@@ -0,0 +1,50 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from utils import google_auth
+
+
+def _token(kid: str) -> str:
+    """An unsigned token, enough to reach the key id check"""
+    header = json.dumps({"alg": "RS256", "typ": "JWT", "kid": kid}).encode()
+    return base64.urlsafe_b64encode(header).decode().rstrip("=") + ".e30.c2ln"
+
+
+def test_unknown_key_ids_refresh_early_but_rate_limited(monkeypatch):
+    monkeypatch.setattr(google_auth, "CERTS_MIN_REFRESH_SECONDS", 0.2)
+    monkeypatch.setattr(google_auth, "_certs", {"known": "PEM"})
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        refreshes = []
+
+        async def refresh_certs():
+            refreshes.append(loop.time())
+            return 3600
+
+        monkeypatch.setattr(google_auth, "refresh_certs", refresh_certs)
+        monkeypatch.setattr(google_auth, "_refresh_now", asyncio.Event())
+        started = loop.time()
+        refresher = asyncio.create_task(google_auth._refresh_loop(3600))
+        # A flood of tokens with made-up key ids
+        while loop.time() - started < 0.5:
+            with pytest.raises(google_auth.GoogleAuthError, match="unknown key"):
+                google_auth.verify_google_id_token(_token("rotated"))
+            await asyncio.sleep(0.01)
+        refresher.cancel()
+        return started, refreshes
+
+    started, refreshes = asyncio.run(scenario())
+    # Woken early instead of waiting an hour, but at most once per interval
+    assert 1 <= len(refreshes) <= 3
+    gaps = [b - a for a, b in zip([started] + refreshes, refreshes)]
+    assert all(gap >= 0.19 for gap in gaps)
+
+
+def test_no_certificates_means_unavailable(monkeypatch):
+    monkeypatch.setattr(google_auth, "_certs", {})
+    with pytest.raises(google_auth.GoogleAuthUnavailable):
+        google_auth.verify_google_id_token(_token("known"))
@@ -0,0 +1,101 @@
+import asyncio
+
+from core.jobs import JobWorker
+
+
+def test_stop_gives_up_on_long_jobs_after_the_timeout():
+    async def scenario():
+        worker = JobWorker(job_types=[])
+        finished = asyncio.create_task(asyncio.sleep(0))
+        stuck = asyncio.create_task(asyncio.sleep(3600))
+        worker.running = {"backup_full": {stuck}, "create_users": {finished}}
+
+        await asyncio.wait_for(worker.stop(timeout=0.05), timeout=1)
+        await asyncio.sleep(0)
+        return worker, finished, stuck
+
+    worker, finished, stuck = asyncio.run(scenario())
+    assert worker.stopping
+    assert finished.done() and not finished.cancelled()
+    assert stuck.cancelled()
+
+
+class _Connection:
+    """Enough of a psycopg connection for single-statement writes"""
+
+    rowcount = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return (1,)
+
+    def commit(self):
+        pass
+
+
+def test_job_state_changes_invalidate_coalesced_reads(monkeypatch):
+    from core import jobs, singleflight
+
+    monkeypatch.setattr(jobs, "get_db_connection", _Connection)
+    job = {"id": 1, "attempts": 1, "max_attempts": 5}
+    changes = [
+        lambda: jobs.enqueue("backup_full", {}),
+        lambda: jobs._finish(job, {}),
+        lambda: jobs._fail(job, "boom"),
+        lambda: jobs._progress_reporter(1)(1, 2),
+        lambda: jobs.requeue_abandoned(),
+        lambda: jobs.scrub_secrets(),
+    ]
+    for change in changes:
+        before = (singleflight._generations["jobs"], singleflight._generations["job"])
+        change()
+        after = (singleflight._generations["jobs"], singleflight._generations["job"])
+        assert after[0] > before[0] and after[1] > before[1]
+
+
+def test_job_keeps_its_lease_after_the_worker_stops_waiting(monkeypatch):
+    import threading
+
+    from core import jobs
+
+    release = threading.Event()
+    touched, finished = [], []
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(jobs, "_touch", touched.append)
+    monkeypatch.setattr(jobs, "_finish", lambda job, result: finished.append(result))
+    monkeypatch.setitem(
+        jobs._handlers,
+        "slow",
+        {"fn": lambda job, progress: release.wait(5) and {"ok": True}},
+    )
+
+    async def scenario():
+        worker = JobWorker(job_types=["slow"])
+        task = asyncio.create_task(worker._run_job({"id": 3, "job_type": "slow"}))
+        worker.running["slow"].add(task)
+        await asyncio.sleep(0.05)
+        await worker.stop(timeout=0.01)
+        # The worker gave up waiting, the handler still runs and holds the lease
+        beats = len(touched)
+        await asyncio.sleep(0.05)
+        assert len(touched) > beats
+        assert finished == []
+        release.set()
+
+    # Exiting waits for the handler thread, as process exit does
+    asyncio.run(scenario())
+    assert finished == [{"ok": True}]
+    beats = len(touched)
+    threading.Event().wait(0.05)
+    assert len(touched) == beats
@@ -0,0 +1,181 @@
+import asyncio
+
+import anthropic
+import httpx
+import pytest
+
+from core import llm
+
+REQUEST = httpx.Request("POST", "http://llm.test/v1/messages")
+
+
+def _status_error(status: int, body=None, headers=None) -> anthropic.APIStatusError:
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    return anthropic.APIStatusError("upstream error", response=response, body=body)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_lets_one_probe_through(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm.time, "monotonic", clock)
+    breaker = llm.CircuitBreaker(failures=2, open_seconds=30)
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(llm.LLMUnavailable):
+        breaker.before_call()
+
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # Only the probe goes out while half open
+    with pytest.raises(llm.LLMUnavailable):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_and_cancelled_probe_frees_the_slot(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm.time, "monotonic", clock)
+    breaker = llm.CircuitBreaker(failures=1, open_seconds=30)
+    breaker.record_failure()
+
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_cancelled()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(llm.LLMUnavailable):
+        breaker.before_call()
+
+
+def test_retryable():
+    assert llm._retryable(anthropic.APIConnectionError(request=REQUEST))
+    assert llm._retryable(_status_error(529))
+    assert llm._retryable(_status_error(429))
+    assert llm._retryable(
+        _status_error(400, body={"error": {"type": "overloaded_error"}})
+    )
+    assert not llm._retryable(
+        _status_error(400, body={"error": {"type": "invalid_request_error"}})
+    )
+    assert not llm._retryable(_status_error(401))
+    assert not llm._retryable(ValueError("bad"))
+
+
+def test_retry_delay_is_capped_and_honours_retry_after(monkeypatch):
+    # Always the top of the jitter range
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(llm, "LLM_RETRY_BASE_SECONDS", 0.5)
+    monkeypatch.setattr(llm, "LLM_RETRY_MAX_SECONDS", 8)
+
+    assert llm._retry_delay(0, ValueError()) == 0.5
+    assert llm._retry_delay(2, ValueError()) == 2
+    assert llm._retry_delay(10, ValueError()) == 8
+    assert llm._retry_delay(0, _status_error(429, headers={"retry-after": "3"})) == 3
+    assert llm._retry_delay(0, _status_error(429, headers={"retry-after": "120"})) == 8
+    assert llm._retry_delay(0, _status_error(429, headers={"retry-after": "soon"})) == 0.5
+
+
+class FakeStream:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def _hedged(monkeypatch, *attempts):
+    """
+    Run _open_hedged where the n-th stream opened takes attempts[n] =
+    (seconds, error or None). Returns the result and the streams opened.
+    """
+    monkeypatch.setattr(llm, "LLM_HEDGE_AFTER_MS", 20)
+    monkeypatch.setattr(llm, "breaker", llm.CircuitBreaker(5, 30))
+    opened = []
+    cancelled = []
+
+    async def open_stream(kwargs):
+        seconds, error = attempts[len(opened)]
+        stream = FakeStream(len(opened))
+        opened.append(stream)
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(stream.name)
+            raise
+        if error is not None:
+            raise error
+        return stream, iter(()), []
+
+    monkeypatch.setattr(llm, "_open_stream", open_stream)
+
+    async def scenario():
+        try:
+            result = await llm._open_hedged({})
+        finally:
+            # Let cancelled attempts unwind
+            await asyncio.sleep(0.05)
+        return result
+
+    return asyncio.run(scenario()), opened, cancelled
+
+
+def test_fast_first_token_sends_no_hedge(monkeypatch):
+    (stream, _, _), opened, _ = _hedged(monkeypatch, (0, None))
+    assert stream.name == 0
+    assert len(opened) == 1
+
+
+def test_slow_first_token_is_hedged_and_the_loser_cancelled(monkeypatch):
+    (stream, _, _), opened, cancelled = _hedged(monkeypatch, (5, None), (0, None))
+    assert stream.name == 1
+    assert len(opened) == 2
+    assert cancelled == [0]
+
+
+def test_hedge_covers_a_failing_first_attempt(monkeypatch):
+    (stream, _, _), _, _ = _hedged(
+        monkeypatch, (0.05, ConnectionError("reset")), (0.1, None)
+    )
+    assert stream.name == 1
+
+
+def test_both_attempts_failing_raises(monkeypatch):
+    with pytest.raises(ConnectionError):
+        _hedged(
+            monkeypatch,
+            (0.05, ConnectionError("first")),
+            (0.06, ConnectionError("hedge")),
+        )
+
+
+def test_no_hedge_unless_the_breaker_is_closed(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_HEDGE_AFTER_MS", 20)
+    breaker = llm.CircuitBreaker(1, 30)
+    breaker.record_failure()
+    monkeypatch.setattr(llm, "breaker", breaker)
+    opened = []
+
+    async def open_stream(kwargs):
+        opened.append(kwargs)
+        await asyncio.sleep(0.1)
+        return FakeStream(0), iter(()), []
+
+    monkeypatch.setattr(llm, "_open_stream", open_stream)
+    asyncio.run(llm._open_hedged({}))
+    assert len(opened) == 1
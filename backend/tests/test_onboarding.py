@@ -0,0 +1,62 @@
+from functools import partial
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from api.endpoints import users
+from core import audit
+from utils import onboarding
+from utils.auth import create_access_token
+from utils.permissions import PERMISSION_ACCESS, PERMISSION_READ, PERMISSION_WRITE
+
+ROWS = 20000
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def import_batch(batch):
+        return [
+            {"row": row["row"], "status": "created", "email": row["email"]}
+            for row in batch
+        ]
+
+    monkeypatch.setattr(onboarding, "_load_group_ids", lambda: set())
+    monkeypatch.setattr(onboarding, "_import_batch", import_batch)
+    monkeypatch.setattr(audit, "record", lambda *args, **kwargs: None)
+
+    client = TestClient(main.app)
+    mask = PERMISSION_ACCESS | PERMISSION_READ | PERMISSION_WRITE
+    client.cookies.set(
+        "access_token",
+        create_access_token(
+            {"sub": "admin@example.com", "uid": 1, "perms": {"1": mask}}
+        ),
+    )
+    return client
+
+
+def test_upload_clients_streams_results_for_every_row(client):
+    csv = "full_name,email\n" + "".join(
+        f"Client {i},client{i}@example.com\n" for i in range(ROWS)
+    )
+    response = client.post(
+        "/api/users/upload-clients",
+        files={"file": ("clients.csv", csv.encode(), "text/csv")},
+    )
+
+    assert response.status_code == 200
+    lines = [orjson.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"summary": {"rows": ROWS, "created": ROWS, "failed": 0}}
+    assert not any("error" in line for line in lines)
+
+
+def test_upload_clients_rejects_oversized_body(client, monkeypatch):
+    monkeypatch.setattr(users, "spool_body", partial(onboarding.spool_body, max_bytes=1024))
+    response = client.post(
+        "/api/users/upload-clients",
+        files={"file": ("clients.csv", b"full_name,email\n" + b"x" * 4096, "text/csv")},
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,48 @@
+import pytest
+from fastapi import HTTPException
+
+from api.endpoints.dashboard import _organisation
+from utils.permissions import (
+    PERMISSION_ACCESS,
+    PERMISSION_READ,
+    PERMISSION_WRITE,
+    has_permission,
+)
+
+ADMIN = PERMISSION_ACCESS | PERMISSION_READ | PERMISSION_WRITE
+VIEWER = PERMISSION_ACCESS | PERMISSION_READ
+
+
+def _user(permissions: dict[int, int]) -> dict:
+    return {"id": 1, "permissions": permissions}
+
+
+def test_unscoped_data_needs_the_permission_in_every_organisation():
+    # Admin in org 1 does not make a viewer in org 2 an admin of shared data
+    mixed = _user({1: ADMIN, 2: VIEWER})
+    assert not has_permission(mixed, ADMIN)
+    assert has_permission(mixed, VIEWER)
+    assert has_permission(_user({1: ADMIN, 2: ADMIN}), ADMIN)
+    # Orgs without access do not count either way
+    assert has_permission(_user({1: ADMIN, 3: 0}), ADMIN)
+    assert not has_permission(_user({}), PERMISSION_ACCESS)
+
+
+def test_scoped_data_checks_the_requested_organisation():
+    mixed = _user({1: VIEWER, 2: ADMIN})
+    assert has_permission(mixed, ADMIN, organisation_id=2)
+    assert not has_permission(mixed, ADMIN, organisation_id=1)
+    assert not has_permission(mixed, PERMISSION_ACCESS, organisation_id=3)
+
+
+def test_dashboard_organisation_comes_from_the_request():
+    mixed = _user({1: PERMISSION_ACCESS, 2: VIEWER})
+    assert _organisation(mixed, 2) == 2
+    with pytest.raises(HTTPException) as e:
+        _organisation(mixed, 1)
+    assert e.value.status_code == 403
+    # Ambiguous without organisation_id
+    with pytest.raises(HTTPException) as e:
+        _organisation(mixed, None)
+    assert e.value.status_code == 400
+    assert _organisation(_user({5: VIEWER}), None) == 5
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+import main
+from api.endpoints import auth, documents
+from utils import sessions
+from utils.auth import create_access_token
+from utils.permissions import PERMISSION_ACCESS, PERMISSION_READ
+
+USER = {"id": 1, "email": "admin@example.com", "full_name": "Admin"}
+CLAIMS = {
+    "sub": USER["email"],
+    "uid": USER["id"],
+    "name": USER["full_name"],
+    "perms": {"1": PERMISSION_ACCESS | PERMISSION_READ},
+}
+
+
+@pytest.fixture
+def rotations(monkeypatch):
+    rotated = []
+
+    def rotate_refresh_token(refresh_token):
+        if refresh_token != "refresh-1":
+            raise sessions.SessionError("Session has been revoked")
+        rotated.append(refresh_token)
+        return USER, "refresh-2"
+
+    monkeypatch.setattr(sessions, "rotate_refresh_token", rotate_refresh_token)
+    monkeypatch.setattr(sessions, "session_claims", lambda user: dict(CLAIMS))
+    monkeypatch.setattr(documents, "list_documents", lambda: iter([{"id": 7}]))
+    return rotated
+
+
+def test_expired_session_is_refreshed_on_streaming_routes(rotations):
+    client = TestClient(main.app)
+    client.cookies.set(
+        "access_token", create_access_token(CLAIMS, expires_delta=timedelta(minutes=-1))
+    )
+    client.cookies.set("refresh_token", "refresh-1")
+
+    response = client.get("/api/documents/get-documents")
+
+    assert response.status_code == 200
+    assert response.json() == {"documents": [{"id": 7}]}
+    assert rotations == ["refresh-1"]
+    assert response.cookies.get("refresh_token") == "refresh-2"
+    assert response.cookies.get("access_token")
+
+
+def test_valid_access_token_is_not_refreshed(rotations):
+    client = TestClient(main.app)
+    client.cookies.set("access_token", create_access_token(CLAIMS))
+    client.cookies.set("refresh_token", "refresh-1")
+
+    response = client.get("/api/documents/get-documents")
+
+    assert response.status_code == 200
+    assert rotations == []
+    assert "set-cookie" not in response.headers
+
+
+def test_revoked_session_is_unauthorized(rotations):
+    client = TestClient(main.app)
+    client.cookies.set("refresh_token", "stolen")
+
+    response = client.get("/api/documents/get-documents")
+
+    assert response.status_code == 401
+
+
+def test_logout_with_expired_access_token_revokes_the_refresh_session(monkeypatch):
+    ended = []
+    monkeypatch.setattr(auth, "end_session", lambda token: ended.append(token) or 1)
+    monkeypatch.setattr(auth.audit, "record", lambda *args, **kwargs: None)
+    client = TestClient(main.app)
+    client.cookies.set(
+        "access_token", create_access_token(CLAIMS, expires_delta=timedelta(minutes=-30))
+    )
+    client.cookies.set("refresh_token", "refresh-1")
+
+    response = client.post("/api/auth/logout")
+
+    assert response.status_code == 200
+    assert ended == ["refresh-1"]
+    cleared = response.headers.get_list("set-cookie")
+    assert any(c.startswith("access_token=") and "Max-Age=0" in c for c in cleared)
+    assert any(c.startswith("refresh_token=") and "Max-Age=0" in c for c in cleared)
+
+
+def test_expired_refresh_token_is_still_revoked(monkeypatch):
+    token = jwt.encode(
+        {"jti": "j-1", "fam": "f-1", "uid": 1, "exp": datetime.utcnow() - timedelta(days=1)},
+        "refresh-secret",
+        algorithm=sessions.ALGORITHM,
+    )
+    monkeypatch.setattr(sessions, "REFRESH_SECRET_KEY", "refresh-secret")
+    executed = []
+
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, sql, params):
+            executed.append(params)
+
+        def fetchone(self):
+            return ("f-1", 1)
+
+    class Connection(Cursor):
+        def cursor(self):
+            return Cursor()
+
+        def commit(self):
+            executed.append("commit")
+
+    monkeypatch.setattr(sessions, "get_db_connection", Connection)
+
+    assert sessions.end_session(token) == 1
+    assert executed == [("j-1",), ("f-1",), "commit"]
+    assert sessions.end_session("not-a-token") is None
+
+
+def test_missing_secret_keys_fail_warm_up(monkeypatch):
+    monkeypatch.setattr(sessions, "REFRESH_SECRET_KEY", "")
+    monkeypatch.setattr(sessions, "SECRET_KEY", "access-secret")
+    with pytest.raises(RuntimeError, match="JWT_REFRESH_SECRET_KEY"):
+        sessions.check_secret_keys()
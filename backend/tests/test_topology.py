@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from core import topology
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="CPU pinning is Linux only"
+)
+
+
+@pytest.fixture
+def pinned(monkeypatch, tmp_path):
+    monkeypatch.setattr(topology, "PIN_CLAIM_DIR", tmp_path)
+    monkeypatch.setenv("PIN_WORKER_CPUS", "0,1")
+    monkeypatch.setattr(topology, "_claim_fd", None)
+    cpus = []
+    monkeypatch.setattr(os, "sched_setaffinity", lambda pid, mask: cpus.extend(mask))
+    yield cpus
+    if topology._claim_fd is not None:
+        os.close(topology._claim_fd)
+
+
+def test_each_worker_gets_its_own_cpu(pinned):
+    topology.pin_current_worker()
+    first = topology._claim_fd
+    # A second worker, as far as the locks are concerned
+    topology.pin_current_worker()
+    os.close(first)
+    assert pinned == [0, 1]
+
+
+def test_claim_being_written_is_not_taken_over(pinned, tmp_path):
+    # Another worker has locked cpu-0 but not written its pid yet
+    import fcntl
+
+    other = os.open(tmp_path / "cpu-0", os.O_CREAT | os.O_RDWR)
+    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    try:
+        topology.pin_current_worker()
+    finally:
+        os.close(other)
+    assert pinned == [1]
+    assert (tmp_path / "cpu-1").read_text() == str(os.getpid())
+
+
+def test_dead_workers_cpu_is_free_again(pinned, tmp_path):
+    # Left behind by a worker that died, nobody holds its lock
+    (tmp_path / "cpu-0").write_text("999999")
+    topology.pin_current_worker()
+    assert pinned == [0]